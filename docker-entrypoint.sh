@@ -19,6 +19,7 @@ collect_static() {
 run_migrations() {
     echo "Running migrations"
     python manage.py migrate --noinput
+    python manage.py createcachetable
 }
 
 # Main execution
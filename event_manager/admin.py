@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Flight, FlightEvent, MockConfiguration, AdditionalTask
+from .models import Flight, FlightEvent, MockConfiguration, AdditionalTask, PlaybackSession, PlayRecord
+from .views import events_changed
 
 @admin.register(Flight)
 class FlightAdmin(admin.ModelAdmin):
@@ -8,10 +9,21 @@ class FlightAdmin(admin.ModelAdmin):
 
 @admin.register(FlightEvent)
 class FlightEventAdmin(admin.ModelAdmin):
-    list_display = ('flight', 'flight_state', 'priority', 'is_played')
-    list_filter = ('flight', 'flight_state', 'is_played')
+    list_display = ('flight', 'flight_state', 'priority')
+    list_filter = ('flight', 'flight_state')
     search_fields = ('flight__flight_unique_id', 'flight_state')
 
+    # Event deletes send no signal, so refresh each affected flight here
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        events_changed(obj.flight)
+
+    def delete_queryset(self, request, queryset):
+        flights = list(Flight.objects.filter(pk__in=queryset.values('flight_id')))
+        super().delete_queryset(request, queryset)
+        for flight in flights:
+            events_changed(flight)
+
 @admin.register(MockConfiguration)
 class MockConfigurationAdmin(admin.ModelAdmin):
     list_display = ('flight', 'delay_between_events', 'fast_forward', 'manual_mode')
@@ -22,3 +34,22 @@ class AdditionalTaskAdmin(admin.ModelAdmin):
     list_display = ('name', 'task_type', 'configuration', 'order', 'is_enabled')
     list_filter = ('task_type', 'is_enabled')
     search_fields = ('name',)
+
+@admin.register(PlaybackSession)
+class PlaybackSessionAdmin(admin.ModelAdmin):
+    list_display = ('flight', 'status', 'events_sent', 'last_priority', 'min_priority', 'max_priority', 'updated_at')
+    list_filter = ('status',)
+    search_fields = ('flight__flight_unique_id',)
+
+@admin.register(PlayRecord)
+class PlayRecordAdmin(admin.ModelAdmin):
+    list_display = ('flight', 'source', 'sent_at', 'latency_seconds', 'status_code', 'events', 'payload_bytes')
+    list_filter = ('source', 'status_code')
+    search_fields = ('flight__flight_unique_id', 'run_token')
+
+    # Play history is append-only
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
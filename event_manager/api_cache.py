@@ -0,0 +1,85 @@
+"""
+Shared response cache for /api/flight.
+
+Responses are stored in the default Django cache (Redis or the database
+cache table, so every worker process sees the same entries), keyed by
+(flight number, date). Writes to a flight or its events give that flight a
+new version and delete its entry. Flights whose unique id has no date cannot
+be mapped to a key, so writes to them bump a generation number shared by all
+entries instead. Each entry stores the generation and flight version it was
+built under and is read together with both, so a lookup is a single cache
+round trip. A miss that read the database before a write committed stores
+its entry under the old version, so it is never served.
+
+Hit, miss and invalidation counters are kept per worker process.
+Invalidations count flight writes, not entries evicted by the cache itself.
+"""
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+KEY_PREFIX = 'api:flight'
+GENERATION_KEY = f'{KEY_PREFIX}:generation'
+STATS = ('hits', 'misses', 'invalidations')
+
+_stats_lock = threading.Lock()
+_stats = dict.fromkeys(STATS, 0)
+
+
+def _timeout():
+    return getattr(settings, 'API_CACHE_TIMEOUT', 300)
+
+def _key(fnum, flight_date):
+    return f'{KEY_PREFIX}:{fnum.upper()}:{flight_date:%Y%m%d}'
+
+def _version_key(fnum, flight_date):
+    return f'{KEY_PREFIX}:version:{fnum.upper()}:{flight_date:%Y%m%d}'
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+def get_response(fnum, flight_date):
+    """
+    Cached response body for this flight (None on a miss) and the version it was read at.
+    Pass the version on to set_response().
+    """
+    key = _key(fnum, flight_date)
+    version_key = _version_key(fnum, flight_date)
+    values = cache.get_many([GENERATION_KEY, version_key, key])
+    version = (values.get(GENERATION_KEY, 0), values.get(version_key))
+    entry = values.get(key)
+    if entry is not None and entry[0] == version:
+        _count('hits')
+        return entry[1], version
+    _count('misses')
+    return None, version
+
+def set_response(fnum, flight_date, content, version):
+    cache.set(_key(fnum, flight_date), (version, content), timeout=_timeout())
+
+def invalidate_flight(flight):
+    _count('invalidations')
+    if flight.flight_date is None:
+        try:
+            cache.incr(GENERATION_KEY)
+        except ValueError:
+            cache.set(GENERATION_KEY, 1, timeout=None)
+        return
+    # A fresh token rather than a counter: a version key lost from the cache cannot come back
+    # with a value an old entry was stored under
+    cache.set(_version_key(flight.flight_number, flight.flight_date), uuid.uuid4().hex, timeout=None)
+    cache.delete(_key(flight.flight_number, flight.flight_date))
+
+def forget_flight(fnum, flight_date):
+    """Remove the entry and version of a flight that no longer exists, such as rolled-back benchmark data."""
+    cache.delete_many([_key(fnum, flight_date), _version_key(fnum, flight_date)])
+
+def get_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else None
+    return stats
@@ -1,6 +1,13 @@
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.utils import timezone
-from .models import Flight, FlightEvent
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+from .models import Flight, FlightEvent, PlaybackSession, PlayRecord
+from . import api_cache, db_pool, history, http_client, kafka_producers
+from .importers import detect_format, ingest_capture
+from .playback import summarize_sessions
+from .sessions import resolve_flights, start_sessions
 import json
 from datetime import datetime
 
@@ -19,36 +26,194 @@ def flight_query(request):
         return JsonResponse({'error': 'Missing required parameters'}, status=400)
 
     try:
-        # Parse the date from yyyyMMdd to ddMMyyyy for flight unique id
+        # Parse the date from yyyyMMdd
         date_obj = datetime.strptime(date_str, '%Y%m%d')
-        date_formatted = date_obj.strftime('%d%m%Y')
-
-        # Find events with FIRST_NAV_TRACKING in identified_changes
-        events = FlightEvent.objects.filter(
-            flight__flight_unique_id__contains=fnum,
-            identified_changes__icontains='FIRST_NAV_TRACKING'
-        ).select_related('flight')
-
-        for event in events:
-            # Extract flight unique id components
-            flight_id = event.flight.flight_unique_id
-            if date_formatted in flight_id:
-                try:
-                    event_data = json.loads(event.raw_event)
-                    return JsonResponse(event_data)
-                except json.JSONDecodeError:
-                    continue
-
-        return JsonResponse(None, safe=False)
-
     except ValueError:
         return JsonResponse({'error': 'Invalid date format'}, status=400)
 
+    flight_date = date_obj.date()
+    content, version = api_cache.get_response(fnum, flight_date)
+    if content is None:
+        event = find_first_nav_tracking_event(fnum, flight_date)
+        # raw_event was validated when written, so serve it as-is
+        content = event.raw_event if event is not None else 'null'
+        api_cache.set_response(fnum, flight_date, content, version)
+
+    return HttpResponse(content, content_type='application/json')
+
+def find_first_nav_tracking_event(fnum, flight_date):
+    """
+    Return the first FIRST_NAV_TRACKING event of the flight with this number and date, or None.
+    Uses the flight number/date columns extracted from flight_unique_id, so it is an indexed lookup.
+    """
+    event = FlightEvent.objects.filter(
+        is_first_nav_tracking=True,
+        event_data__isnull=False,
+        flight__flight_number=fnum.upper(),
+        flight__flight_date=flight_date,
+    ).only('raw_event').first()
+    if event is not None:
+        return event
+
+    # Flights whose unique id carries no ddMMyyyy date cannot be indexed; match them the old way
+    date_formatted = flight_date.strftime('%d%m%Y')
+    legacy_events = FlightEvent.objects.filter(
+        is_first_nav_tracking=True,
+        event_data__isnull=False,
+        flight__flight_date__isnull=True,
+        flight__flight_unique_id__contains=fnum,
+    ).select_related('flight')
+    for event in legacy_events:
+        if date_formatted in event.flight.flight_unique_id:
+            return event
+    return None
+
+# The flight push response never changes, so it is serialized once
+ADD_FLIGHT_PUSH_RESPONSE = json.dumps({'errorCode': 8})
+
 def add_flight_push(request):
     """
     API endpoint for flight push.
     Always returns error code 8 only.
     """
+    return HttpResponse(ADD_FLIGHT_PUSH_RESPONSE, content_type='application/json') 
+
+def http_client_stats(request):
+    """
+    API endpoint exposing connection reuse statistics of the shared HTTP client.
+    Stats are per worker process. Pass reset=1 to clear them after reading.
+    """
+    snapshot = http_client.stats.snapshot()
+    if request.GET.get('reset') == '1':
+        http_client.stats.reset()
+    return JsonResponse({'hosts': snapshot})
+
+
+def kafka_stats(request):
+    """
+    API endpoint exposing per-topic produce latency and queue depth of the shared Kafka producers.
+    Stats are per worker process. Pass reset=1 to clear them after reading.
+    """
+    snapshot = kafka_producers.get_stats()
+    if request.GET.get('reset') == '1':
+        kafka_producers.stats.reset()
+    return JsonResponse(snapshot)
+
+
+def db_pool_stats(request):
+    """
+    API endpoint exposing connection reuse of the pooled custom cleanup database connections.
+    Stats are per worker process.
+    """
+    return JsonResponse({'databases': db_pool.get_stats()})
+
+
+def cache_stats(request):
+    """
+    API endpoint exposing hit, miss and invalidation counters of the /api/flight response cache.
+    Stats are per worker process.
+    """
+    return JsonResponse(api_cache.get_stats())
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def ingest_events(request):
+    """
+    API endpoint to bulk-ingest a JSONL or CSV capture holding events of many flights.
+    Form fields:
+    - file: The capture file
+    - format: jsonl or csv (optional, detected from the file name)
+    - workers: Worker processes (optional, defaults to INGEST_WORKERS)
+    Missing flights are created and the events of every flight in the capture are replaced.
+    """
+    capture = request.FILES.get('file')
+    if not capture:
+        return JsonResponse({'status': 'error', 'message': 'Missing capture file'}, status=400)
+
+    capture_format = request.POST.get('format') or detect_format(capture.name)
+    try:
+        workers = int(request.POST['workers']) if request.POST.get('workers') else None
+        summary = ingest_capture(capture, capture_format, workers)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    status = 'success' if not summary['errors'] else 'partial'
+    return JsonResponse({'status': status, **summary})
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def start_sessions_api(request):
+    """
+    API endpoint to start mock sessions for many flights at once.
+    JSON body:
+    - flights: Flight unique ids (or flight ids)
+    - reset: Run cleanup, mark events unplayed and run tasks first (default true)
+    Every flight plays with its own configuration on the shared playback engine.
+    """
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'status': 'error', 'message': 'Invalid JSON payload'}, status=400)
+
+    references = data.get('flights')
+    if not isinstance(references, list) or not references:
+        return JsonResponse({'status': 'error', 'message': 'flights must be a non-empty list'}, status=400)
+
+    flights, missing = resolve_flights(references)
+    results = start_sessions(flights, reset=data.get('reset', True))
+    results += [{'flight': reference, 'status': 'failed', 'error': 'Flight not found'} for reference in missing]
+
+    started = [result['flight'] for result in results if result['status'] == 'started']
+    failed = [result for result in results if result['status'] == 'failed']
+    status = 'success' if not failed else ('partial' if started else 'error')
     return JsonResponse({
-        'errorCode': 8
-    }) 
\ No newline at end of file
+        'status': status,
+        'message': f'Started {len(started)} of {len(results)} mock sessions',
+        'started': started,
+        'failed': failed
+    }, status=200 if started or not results else 400)
+
+def sessions_summary(request):
+    """
+    API endpoint reporting combined progress and callback latency of mock sessions.
+    Query params:
+    - flights: Comma-separated flight unique ids (optional, defaults to every session)
+    - status: Comma-separated session statuses to include (optional)
+    """
+    sessions = PlaybackSession.objects.all()
+    if request.GET.get('flights'):
+        sessions = sessions.filter(flight__flight_unique_id__in=request.GET['flights'].split(','))
+    if request.GET.get('status'):
+        sessions = sessions.filter(status__in=request.GET['status'].split(','))
+    return JsonResponse(summarize_sessions(sessions))
+
+def play_history_summary(request):
+    """
+    API endpoint reporting callback latency percentiles, status codes and failures of recorded plays,
+    per flight and per playback run.
+    Query params:
+    - flights: Comma-separated flight unique ids (optional)
+    - runs: Comma-separated run tokens (optional)
+    - source: manual or playback (optional)
+    - since, until: ISO 8601 bounds on the send time (optional)
+    Plays are written in batches, so the last few seconds may not be included yet.
+    """
+    records = PlayRecord.objects.all()
+    if request.GET.get('flights'):
+        records = records.filter(flight__flight_unique_id__in=request.GET['flights'].split(','))
+    if request.GET.get('runs'):
+        records = records.filter(run_token__in=request.GET['runs'].split(','))
+    if request.GET.get('source'):
+        records = records.filter(source=request.GET['source'])
+    for param, lookup in (('since', 'sent_at__gte'), ('until', 'sent_at__lt')):
+        if request.GET.get(param):
+            value = parse_datetime(request.GET[param])
+            if value is None:
+                return JsonResponse({'status': 'error', 'message': f'Invalid {param}: expected an ISO 8601 date and time'}, status=400)
+            if timezone.is_naive(value):
+                value = timezone.make_aware(value)
+            records = records.filter(**{lookup: value})
+    summary = history.summarize_history(records)
+    # Records of this worker process still waiting to be written
+    summary['writer'] = history.get_stats()
+    return JsonResponse(summary)
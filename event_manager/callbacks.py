@@ -0,0 +1,52 @@
+import logging
+from django.conf import settings
+from . import http_client, io_logging
+
+logger = logging.getLogger(__name__)
+
+def build_callback_payload(event_data, event_id):
+    """
+    Wrap parsed event data so the payload sent to the callback is always a list.
+    """
+    if isinstance(event_data, dict):
+        # If the parsed data is an object {}, wrap it in a list [{}]
+        logger.debug(f"Wrapping event data object into a list for callback event {event_id}")
+        return [event_data]
+    elif isinstance(event_data, list):
+        # If it's already a list [...], use it directly
+        logger.debug(f"Using existing list payload for callback event {event_id}")
+        return event_data
+    # Handle unexpected types - log a warning and attempt to send wrapped in a list
+    logger.warning(f"Unexpected type for event_data for event {event_id}: {type(event_data)}. Wrapping in list before sending.")
+    return [event_data]
+
+def get_callback_timeout():
+    # Get timeout from settings or use default
+    return getattr(settings, 'API_TIMEOUT_MS', 15000) / 1000  # Convert to seconds
+
+def send_callback(callback_url, payload_to_send, event_id):
+    """
+    POST a callback payload and raise for non-2xx responses.
+    Shared by the per-event play view and the playback engine.
+    """
+    timeout = get_callback_timeout()
+
+    # Log request details before sending; bodies only for a sample of calls, rendered when written
+    logger.info(f"---> Sending callback for event {event_id} to URL: {callback_url}")
+    log_bodies = io_logging.sample(logger)
+    if log_bodies:
+        logger.info("Callback payload for event %s:\n%s", event_id, io_logging.Body(payload_to_send))
+
+    response = http_client.post(
+        callback_url,
+        json=payload_to_send,
+        timeout=timeout
+    )
+
+    # Log response status
+    logger.info(f"<--- Callback response status for event {event_id}: {response.status_code} ({len(response.content)} bytes)")
+    if log_bodies:
+        logger.info("Callback response for event %s:\n%s", event_id, io_logging.Body(response.content))
+
+    response.raise_for_status()  # Raise HTTPError for bad responses (4xx or 5xx)
+    return response
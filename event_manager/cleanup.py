@@ -0,0 +1,274 @@
+"""
+Cleanup queries run before a mock session starts, on reset and abort, and on demand.
+
+A cleanup script is split into statements once, and the {flight_unique_id}
+placeholder becomes a bound parameter instead of being formatted into the SQL,
+so flight ids are always quoted correctly. The whole script runs in one
+transaction: either every statement is applied or none is.
+
+On PostgreSQL the bound statements are sent to the server as one script, with
+a clock_timestamp() marker recorded between statements, so the per-statement
+timings come back with the final result instead of costing a round trip per
+statement. Other databases run the statements one by one on the same cursor.
+"""
+import logging
+import re
+import time
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from psycopg2.extensions import encodings
+
+from . import db_pool
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CLEANUP_QUERY = "DELETE FROM flight_status WHERE flight_unique_id = '{flight_unique_id}'"
+
+PLACEHOLDER = '{flight_unique_id}'
+PARAMETER = '%(flight_unique_id)s'
+
+
+class CleanupError(Exception):
+    def __init__(self, message, index=None, query=None):
+        super().__init__(message)
+        self.index = index
+        self.query = query
+
+
+# A dollar quote opens with $tag$ or $$ (not $1, which is a positional parameter)
+DOLLAR_QUOTE = re.compile(r'\$([A-Za-z_][A-Za-z0-9_]*)?\$')
+
+
+def _quoted_end(sql, position, quote):
+    """Index just past the quoted string or identifier starting at position; a doubled quote is part of it."""
+    end = position + 1
+    while True:
+        end = sql.find(quote, end)
+        if end == -1:
+            return len(sql)
+        if sql[end + 1:end + 2] == quote:
+            end += 2
+            continue
+        return end + 1
+
+def _block_comment_end(sql, position):
+    # PostgreSQL block comments nest
+    depth = 0
+    while position < len(sql):
+        if sql.startswith('/*', position):
+            depth += 1
+            position += 2
+        elif sql.startswith('*/', position):
+            depth -= 1
+            position += 2
+            if not depth:
+                return position
+        else:
+            position += 1
+    return len(sql)
+
+def _segments(sql):
+    """
+    Split SQL into (kind, text) pieces, kind being 'code', 'string', 'identifier', 'comment'
+    or 'dollar' (a dollar-quoted body such as a DO block). Unterminated pieces run to the end.
+    """
+    position = code_start = 0
+    while position < len(sql):
+        char = sql[position]
+        if char == "'":
+            kind, end = 'string', _quoted_end(sql, position, "'")
+        elif char == '"':
+            kind, end = 'identifier', _quoted_end(sql, position, '"')
+        elif sql.startswith('--', position):
+            newline = sql.find('\n', position)
+            kind, end = 'comment', newline if newline != -1 else len(sql)
+        elif sql.startswith('/*', position):
+            kind, end = 'comment', _block_comment_end(sql, position)
+        elif char == '$' and (position == 0 or not (sql[position - 1].isalnum() or sql[position - 1] == '_')) \
+                and DOLLAR_QUOTE.match(sql, position):
+            opening = DOLLAR_QUOTE.match(sql, position).group(0)
+            closing = sql.find(opening, position + len(opening))
+            kind, end = 'dollar', closing + len(opening) if closing != -1 else len(sql)
+        else:
+            position += 1
+            continue
+        if code_start < position:
+            yield 'code', sql[code_start:position]
+        yield kind, sql[position:end]
+        position = code_start = end
+    if code_start < len(sql):
+        yield 'code', sql[code_start:]
+
+def split_statements(script):
+    """
+    Split a script on semicolons outside quoted strings and identifiers, comments and
+    dollar-quoted bodies. Pieces holding nothing but comments are dropped.
+    """
+    statements = []
+    current = []
+    has_sql = False
+    for kind, text in _segments(script):
+        if kind != 'code':
+            current.append(text)
+            has_sql = has_sql or kind != 'comment'
+            continue
+        for index, piece in enumerate(text.split(';')):
+            if index:
+                if has_sql:
+                    statements.append(''.join(current).strip())
+                current = []
+                has_sql = False
+            current.append(piece)
+            has_sql = has_sql or bool(piece.strip())
+    if has_sql:
+        statements.append(''.join(current).strip())
+    return statements
+
+def bind_statement(statement):
+    """
+    Rewrite a statement to use a bound %(flight_unique_id)s parameter. A literal that
+    is exactly '{flight_unique_id}' becomes the parameter, and one with other text around
+    the placeholder (e.g. '%{flight_unique_id}%') becomes a concatenation with it.
+    Comments and dollar-quoted bodies are kept as they are; a parameter cannot be bound
+    inside a body, so the placeholder is rejected there.
+    """
+    parts = []
+    for kind, text in _segments(statement):
+        if kind == 'code':
+            parts.append(PARAMETER.join(piece.replace('%', '%%') for piece in text.split(PLACEHOLDER)))
+        elif kind == 'string':
+            # Strip the quotes; an unterminated literal has no closing one
+            parts.append(_bind_literal(text[1:-1] if len(text) > 1 and text.endswith("'") else text[1:]))
+        elif kind == 'dollar' and PLACEHOLDER in text:
+            raise CleanupError(f'{PLACEHOLDER} cannot be used inside a dollar-quoted body', query=statement)
+        else:
+            parts.append(text.replace('%', '%%'))
+    return ''.join(parts)
+
+def _bind_literal(literal):
+    if PLACEHOLDER not in literal:
+        return "'" + literal.replace('%', '%%') + "'"
+    pieces = []
+    for index, text in enumerate(literal.split(PLACEHOLDER)):
+        if index:
+            pieces.append(PARAMETER)
+        if text:
+            pieces.append("'" + text.replace('%', '%%') + "'")
+    if len(pieces) == 1:
+        return pieces[0]
+    return '(' + ' || '.join(pieces) + ')'
+
+def prepare_script(script):
+    """[(original statement, bound statement)] for a cleanup script (the default query when empty)."""
+    return [(statement, bind_statement(statement)) for statement in split_statements(script or DEFAULT_CLEANUP_QUERY)]
+
+def uses_custom_db(config):
+    return bool(
+        config is not None and config.use_custom_db
+        and all([config.db_host, config.db_name, config.db_user, config.db_password])
+    )
+
+def _error_message(error):
+    return str(error).split('LINE')[0].strip()
+
+@contextmanager
+def cleanup_transaction(config, rollback=False):
+    """
+    (cursor, is_postgres) inside a transaction on the custom database of the config,
+    or on the default database. Commits on success unless rollback is set.
+    """
+    if uses_custom_db(config):
+        with db_pool.connection(config) as conn:
+            try:
+                with conn.cursor() as cursor:
+                    yield cursor, True
+                if rollback:
+                    conn.rollback()
+                else:
+                    conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    else:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                yield cursor, connection.vendor == 'postgresql'
+            if rollback:
+                transaction.set_rollback(True)
+
+def _execute_each(cursor, statements, params):
+    timings = []
+    for index, (statement, bound) in enumerate(statements):
+        started = time.perf_counter()
+        try:
+            cursor.execute(bound, params)
+        except Exception as e:
+            raise CleanupError(
+                f'Query failed: {_error_message(e)} (statement {index + 1} of {len(statements)})',
+                index, statement
+            )
+        timings.append((time.perf_counter() - started, cursor.rowcount))
+    return timings
+
+def _execute_script(cursor, statements, params):
+    """Send every statement in one execute, with server-side timestamps between them."""
+    encoding = encodings.get(cursor.connection.encoding, 'utf-8')
+    script = []
+    for index, (_, bound) in enumerate(statements):
+        script.append(f"SELECT set_config('flight_mock.cleanup_{index}', extract(epoch from clock_timestamp())::text, true)")
+        script.append(cursor.mogrify(bound, params).decode(encoding))
+    markers = ', '.join(f"current_setting('flight_mock.cleanup_{index}')" for index in range(len(statements)))
+    script.append(f"SELECT {markers}, extract(epoch from clock_timestamp())::text")
+    # On lines of their own, so a statement ending in a -- comment cannot swallow the separator
+    cursor.execute('\n;\n'.join(script))
+    stamps = [float(value) for value in cursor.fetchone()]
+    # Only the last statement's row count is reported for a multi-statement execute
+    return [(stamps[index + 1] - stamps[index], None) for index in range(len(statements))]
+
+def _find_failing_statement(config, statements, params):
+    """Replay a failed script statement by statement, rolled back, to name the statement that failed."""
+    try:
+        with cleanup_transaction(config, rollback=True) as (cursor, _):
+            _execute_each(cursor, statements, params)
+    except CleanupError as e:
+        return e
+    return None
+
+def execute_cleanup(script, flight_unique_id, config=None):
+    """
+    Run a cleanup script for the flight in one transaction, on the custom database of the
+    config when it has one. Returns per-statement timings; raises CleanupError naming the
+    failed statement, in which case nothing was applied.
+    """
+    statements = prepare_script(script)
+    params = {'flight_unique_id': flight_unique_id}
+    started = time.perf_counter()
+    batched = False
+    try:
+        with cleanup_transaction(config) as (cursor, batched):
+            if batched and len(statements) > 1:
+                timings = _execute_script(cursor, statements, params)
+            else:
+                timings = _execute_each(cursor, statements, params)
+    except CleanupError:
+        raise
+    except Exception as e:
+        failure = _find_failing_statement(config, statements, params) if batched else None
+        if failure is not None:
+            raise failure
+        raise CleanupError(f'Query failed: {_error_message(e)}')
+
+    elapsed = time.perf_counter() - started
+    result = {
+        'statements': [
+            {'index': index, 'query': statement, 'duration_ms': round(seconds * 1000, 2), 'rows': rows}
+            for index, ((statement, _), (seconds, rows)) in enumerate(zip(statements, timings))
+        ],
+        'total_ms': round(elapsed * 1000, 2),
+    }
+    logger.info(
+        f"Cleanup for {flight_unique_id}: {len(statements)} statements in {result['total_ms']} ms "
+        f"on {'custom database' if uses_custom_db(config) else 'default database'}"
+    )
+    return result
@@ -0,0 +1,221 @@
+"""
+Pooled connections to the custom cleanup databases of mock configurations.
+
+Starting, resetting and aborting a mock session runs the cleanup query against
+the configured database. Connections are kept open per DSN and handed out
+again, so repeated cleanups skip the backend start-up and authentication of a
+new connection. Each pool is bounded, connections idle for too long are
+closed, and a connection that sat unused for a while is pinged before it is
+handed out; one that fails the ping (or was left broken by its last user) is
+replaced by a fresh one.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from django.conf import settings
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, make_dsn
+
+logger = logging.getLogger(__name__)
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+class ConnectionPool:
+    """Connections to one database. Idle connections are reused most recent first."""
+
+    def __init__(self, dsn, label, max_size, idle_timeout, check_after, wait_timeout):
+        self.dsn = dsn
+        self.label = label
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.check_after = check_after
+        self.wait_timeout = wait_timeout
+        self._idle = []  # (connection, time it was returned)
+        self._in_use = 0
+        self._condition = threading.Condition()
+        self.stats = {
+            'checkouts': 0, 'connections_opened': 0, 'connect_seconds': 0.0,
+            'health_check_failures': 0, 'evicted': 0, 'discarded': 0,
+        }
+
+    def _connect(self):
+        started = time.perf_counter()
+        conn = psycopg2.connect(self.dsn, connect_timeout=getattr(settings, 'CUSTOM_DB_CONNECT_TIMEOUT', 5))
+        with self._condition:
+            self.stats['connections_opened'] += 1
+            self.stats['connect_seconds'] += time.perf_counter() - started
+        logger.info(f"Opened cleanup database connection to {self.label}")
+        return conn
+
+    def _is_healthy(self, conn, idle_seconds):
+        if conn.closed:
+            return False
+        if idle_seconds < self.check_after:
+            # Recently used: trust it rather than paying a round trip
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error as e:
+            logger.warning(f"Dropping broken cleanup database connection to {self.label}: {str(e)}")
+            return False
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def evict_idle(self):
+        """Close connections idle for longer than the idle timeout. Returns how many were closed."""
+        now = time.monotonic()
+        with self._condition:
+            expired = [conn for conn, returned in self._idle if now - returned > self.idle_timeout]
+            self._idle = [(conn, returned) for conn, returned in self._idle if now - returned <= self.idle_timeout]
+            self.stats['evicted'] += len(expired)
+        for conn in expired:
+            self._close(conn)
+        return len(expired)
+
+    def acquire(self):
+        self.evict_idle()
+        with self._condition:
+            self.stats['checkouts'] += 1
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            with self._condition:
+                while not self._idle and self._in_use >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolExhausted(
+                            f'All {self.max_size} connections to {self.label} are in use'
+                        )
+                    self._condition.wait(remaining)
+                self._in_use += 1
+                conn, returned = self._idle.pop() if self._idle else (None, None)
+
+            if conn is None:
+                try:
+                    return self._connect()
+                except Exception:
+                    self._forget()
+                    raise
+            if self._is_healthy(conn, time.monotonic() - returned):
+                return conn
+            with self._condition:
+                self.stats['health_check_failures'] += 1
+            self._close(conn)
+            self._forget()
+
+    def _forget(self):
+        with self._condition:
+            self._in_use -= 1
+            self._condition.notify()
+
+    def release(self, conn):
+        """Return a connection; an open transaction is rolled back, a broken connection is closed."""
+        reusable = not conn.closed
+        if reusable and conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                reusable = False
+        if not reusable:
+            self._close(conn)
+            with self._condition:
+                self.stats['discarded'] += 1
+            self._forget()
+            return
+        with self._condition:
+            self._in_use -= 1
+            self._idle.append((conn, time.monotonic()))
+            self._condition.notify()
+
+    def close(self):
+        with self._condition:
+            idle = [conn for conn, _ in self._idle]
+            self._idle = []
+        for conn in idle:
+            self._close(conn)
+
+    def snapshot(self):
+        with self._condition:
+            values = dict(self.stats)
+            idle = len(self._idle)
+            in_use = self._in_use
+        opened = values['connections_opened']
+        return {
+            'checkouts': values['checkouts'],
+            'connections_opened': opened,
+            # Every checkout either reused an idle connection or opened one
+            'connections_reused': max(values['checkouts'] - opened, 0),
+            'avg_connect_ms': round(values['connect_seconds'] / opened * 1000, 2) if opened else 0.0,
+            'health_check_failures': values['health_check_failures'],
+            'evicted': values['evicted'],
+            'discarded': values['discarded'],
+            'idle': idle,
+            'in_use': in_use,
+        }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def config_dsn(config):
+    """DSN and a password-free label for the custom database of a MockConfiguration."""
+    port = config.db_port or '5432'
+    dsn = make_dsn(host=config.db_host, port=port, dbname=config.db_name, user=config.db_user, password=config.db_password)
+    return dsn, f'{config.db_user}@{config.db_host}:{port}/{config.db_name}'
+
+def get_pool(dsn, label):
+    with _pools_lock:
+        pool = _pools.get(dsn)
+        if pool is None:
+            # Get pool limits from settings or use defaults
+            pool = ConnectionPool(
+                dsn,
+                label,
+                max_size=getattr(settings, 'CUSTOM_DB_POOL_SIZE', 5),
+                idle_timeout=getattr(settings, 'CUSTOM_DB_POOL_IDLE_SECONDS', 300),
+                check_after=getattr(settings, 'CUSTOM_DB_POOL_CHECK_SECONDS', 30),
+                wait_timeout=getattr(settings, 'CUSTOM_DB_POOL_TIMEOUT', 10),
+            )
+            _pools[dsn] = pool
+        pools = list(_pools.values())
+    # Close idle connections of every pool, including databases no longer in use
+    for other in pools:
+        if other is not pool:
+            other.evict_idle()
+    return pool
+
+@contextmanager
+def connection(config):
+    """
+    Pooled connection to the configuration's custom database. Commit before leaving
+    the block; anything left uncommitted is rolled back when the connection is returned.
+    """
+    pool = get_pool(*config_dsn(config))
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
+def get_stats():
+    with _pools_lock:
+        pools = list(_pools.values())
+    return {pool.label: pool.snapshot() for pool in pools}
+
+def close_all():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
@@ -1,5 +1,7 @@
+import json
 from django import forms
 from .models import Flight, FlightEvent, MockConfiguration, AdditionalTask
+from .snapshots import SnapshotError, parse_tables
 
 class FlightForm(forms.ModelForm):
     class Meta:
@@ -10,7 +12,7 @@ class FlightEventForm(forms.ModelForm):
     priority = forms.IntegerField(
         required=False, 
         min_value=0,
-        help_text="Optional. Leave empty for next available priority, or specify a number to insert at that position."
+        help_text="Optional. Leave empty to add after the last event. Priorities are spaced by 1000: enter a value between two events to insert between them, or an existing priority to insert before that event."
     )
     
     class Meta:
@@ -24,18 +26,60 @@ class FlightEventForm(forms.ModelForm):
             'identified_changes': forms.Textarea(attrs={'rows': 3}),
         }
         
+    def clean_raw_event(self):
+        raw_event = self.cleaned_data.get('raw_event')
+        try:
+            json.loads(raw_event)
+        except json.JSONDecodeError as e:
+            raise forms.ValidationError(f'Invalid JSON: {str(e)}')
+        return raw_event
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            # Editing: a blank priority must not silently become 0
+            self.fields['priority'].required = True
+            self.fields['priority'].help_text = "Enter a free priority to move the event there, or an existing priority to move it before that event. 0 moves it after the last event."
+
     def clean_priority(self):
         priority = self.cleaned_data.get('priority')
         return priority if priority is not None else 0
 
 class MockConfigurationForm(forms.ModelForm):
+    batch_size = forms.IntegerField(
+        required=False,
+        min_value=1,
+        help_text="Optional. Send up to this many consecutive events as one callback during playback. Leave empty to send one event per callback."
+    )
+    batch_window = forms.FloatField(
+        required=False,
+        min_value=0,
+        help_text="Optional. Instead of a fixed size, coalesce all events due within this many seconds of the first one."
+    )
+    reset_strategy = forms.ChoiceField(
+        required=False,
+        choices=MockConfiguration.RESET_STRATEGIES,
+        help_text="Cleanup query runs the query above; restore snapshot truncates the tables below and reloads the captured baseline."
+    )
+    replay_timing = forms.ChoiceField(
+        required=False,
+        choices=MockConfiguration.REPLAY_TIMINGS,
+        help_text="Fixed delay waits the delay above between events; recorded timing reproduces the gaps between the events' ingestion times (imported events only)."
+    )
+    speed_factor = forms.FloatField(
+        required=False,
+        widget=forms.NumberInput(attrs={'step': 'any', 'list': 'speedFactorPresets'}),
+        help_text="Recorded timing only. Replay this many times faster than the capture, e.g. 1, 10 or 60. Leave empty for real time."
+    )
+
     class Meta:
         model = MockConfiguration
         fields = [
             'delay_between_events', 'fast_forward', 'manual_mode', 
             'callback_url', 'cleanup_before_start', 'cleanup_query',
             'use_custom_db', 'db_host', 'db_port', 'db_name', 
-            'db_user', 'db_password'
+            'db_user', 'db_password', 'batch_size', 'batch_window',
+            'reset_strategy', 'snapshot_tables', 'replay_timing', 'speed_factor'
         ]
         widgets = {
             'callback_url': forms.URLInput(attrs={'placeholder': 'https://your-callback-url.com/webhook'}),
@@ -48,8 +92,53 @@ class MockConfigurationForm(forms.ModelForm):
             'db_port': forms.TextInput(attrs={'placeholder': '5432'}),
             'db_name': forms.TextInput(attrs={'placeholder': 'database_name'}),
             'db_user': forms.TextInput(attrs={'placeholder': 'username'}),
+            'snapshot_tables': forms.Textarea(attrs={
+                'rows': 2,
+                'placeholder': 'public.flights, public.flight_status'
+            }),
         }
 
+    def clean_reset_strategy(self):
+        return self.cleaned_data.get('reset_strategy') or 'query'
+
+    def clean_replay_timing(self):
+        return self.cleaned_data.get('replay_timing') or 'fixed'
+
+    def clean_speed_factor(self):
+        speed_factor = self.cleaned_data.get('speed_factor')
+        if speed_factor is None:
+            return 1.0
+        if speed_factor <= 0:
+            raise forms.ValidationError('Speed factor must be greater than 0')
+        return speed_factor
+
+    def clean_snapshot_tables(self):
+        snapshot_tables = self.cleaned_data.get('snapshot_tables', '')
+        try:
+            parse_tables(snapshot_tables)
+        except SnapshotError as e:
+            raise forms.ValidationError(str(e))
+        return snapshot_tables
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('reset_strategy') == 'snapshot' and not cleaned_data.get('snapshot_tables'):
+            self.add_error('snapshot_tables', 'List the tables to restore when using the snapshot strategy')
+        return cleaned_data
+
+    def clean_batch_size(self):
+        batch_size = self.cleaned_data.get('batch_size')
+        return batch_size if batch_size is not None else 1
+
+    def save(self, commit=True):
+        config = super().save(commit=False)
+        if 'snapshot_tables' in self.changed_data:
+            # The captured baseline no longer matches the table list
+            config.snapshot_captured_at = None
+        if commit:
+            config.save()
+        return config
+
 class AdditionalTaskForm(forms.ModelForm):
     class Meta:
         model = AdditionalTask
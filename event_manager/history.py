@@ -0,0 +1,198 @@
+"""
+Append-only history of the callbacks sent for flight events.
+
+Recording a play only appends to an in-memory buffer; a background thread of
+each worker process writes the buffer with one bulk INSERT when
+PLAY_HISTORY_BATCH_SIZE records are waiting, or every
+PLAY_HISTORY_FLUSH_SECONDS otherwise, so a play never waits on the history
+table. Records still buffered at exit are written then. A batch that cannot
+be written is logged and dropped, and at most PLAY_HISTORY_MAX_BUFFER records
+wait at once; both are counted in get_stats().
+"""
+import atexit
+import hashlib
+import logging
+import os
+import threading
+from datetime import datetime
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .loadgen import latency_summary
+from .models import PlayRecord
+
+logger = logging.getLogger(__name__)
+
+
+def get_batch_size():
+    # Get history settings from settings or use defaults
+    return getattr(settings, 'PLAY_HISTORY_BATCH_SIZE', 500)
+
+def get_flush_seconds():
+    return getattr(settings, 'PLAY_HISTORY_FLUSH_SECONDS', 2.0)
+
+def get_max_buffer():
+    return getattr(settings, 'PLAY_HISTORY_MAX_BUFFER', 50000)
+
+
+class HistoryWriter:
+    """Buffers play records and writes them in batches from a background thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records = []
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def _ensure_thread(self):
+        # Started on first use, and again in a forked worker process, where the thread does not survive
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                if self._pid is not None:
+                    # The buffered records are the parent's to write, and the lock may have been copied while held
+                    self._lock = threading.Lock()
+                    self._records = []
+                    self._wake = threading.Event()
+                    self.written = self.dropped = self.failed = 0
+                self._thread = threading.Thread(target=self._run, name='play-history', daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def add(self, record):
+        self._ensure_thread()
+        with self._lock:
+            if len(self._records) >= get_max_buffer():
+                self.dropped += 1
+                return
+            self._records.append(record)
+            if len(self._records) >= get_batch_size():
+                self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(get_flush_seconds())
+            self._wake.clear()
+            close_old_connections()
+            self.flush()
+
+    def flush(self):
+        """Write every buffered record now."""
+        if self._pid is not None and self._pid != os.getpid():
+            # Forked and nothing played here yet; the buffered records are the parent's
+            return
+        with self._lock:
+            records, self._records = self._records, []
+        if not records:
+            return
+        try:
+            PlayRecord.objects.bulk_create(records, batch_size=get_batch_size())
+        except Exception as e:
+            logger.error(f"Writing {len(records)} play records failed: {str(e)}")
+            with self._lock:
+                self.failed += len(records)
+            return
+        with self._lock:
+            self.written += len(records)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'buffered': len(self._records),
+                'written': self.written,
+                'dropped': self.dropped,
+                'failed': self.failed,
+            }
+
+
+writer = HistoryWriter()
+
+def _body_size(body):
+    if body is None:
+        return 0
+    return len(body.encode() if isinstance(body, str) else body)
+
+def record_play(flight_id, source, events, sent_at, seconds, response=None, error=None, run_token=''):
+    """
+    Record one callback for the given events (in send order).
+    Pass the response, or the exception raised instead; an HTTPError still carries its response.
+    """
+    if response is None and error is not None:
+        response = getattr(error, 'response', None)
+    request = response.request if response is not None else getattr(error, 'request', None)
+    content = response.content if response is not None else None
+    writer.add(PlayRecord(
+        flight_id=flight_id,
+        source=source,
+        run_token=run_token,
+        event_id=events[0].id,
+        event_priority=events[0].priority,
+        events=len(events),
+        sent_at=sent_at,
+        latency_seconds=seconds,
+        status_code=response.status_code if response is not None else None,
+        payload_bytes=_body_size(request.body) if request is not None else 0,
+        response_bytes=len(content) if content is not None else None,
+        response_digest=hashlib.sha256(content).hexdigest() if content is not None else '',
+        error=str(error) if error is not None else '',
+    ))
+
+def get_stats():
+    return writer.snapshot()
+
+def _group(row, group):
+    group['plays'] += 1
+    group['events'] += row['events']
+    group['failed'] += int(bool(row['error']))
+    group['payload_bytes'] += row['payload_bytes']
+    status = str(row['status_code']) if row['status_code'] is not None else 'none'
+    group['status_codes'][status] = group['status_codes'].get(status, 0) + 1
+    group['latencies'].append(row['latency_seconds'])
+    group['first_sent_at'] = min(group['first_sent_at'] or row['sent_at'], row['sent_at'])
+    group['last_sent_at'] = max(group['last_sent_at'] or row['sent_at'], row['sent_at'])
+
+def _new_group(**fields):
+    return dict(
+        fields, plays=0, events=0, failed=0, payload_bytes=0, status_codes={}, latencies=[],
+        first_sent_at=None, last_sent_at=None
+    )
+
+def _finish(group):
+    group['latency_ms'] = latency_summary(group.pop('latencies'))
+    for name in ('first_sent_at', 'last_sent_at'):
+        if isinstance(group[name], datetime):
+            group[name] = group[name].isoformat()
+    return group
+
+def summarize_history(records):
+    """Plays, failures, status codes and callback latency percentiles per flight and per playback run."""
+    flights = {}
+    runs = {}
+    rows = records.values(
+        'flight__flight_unique_id', 'source', 'run_token', 'events', 'sent_at', 'latency_seconds',
+        'status_code', 'payload_bytes', 'error'
+    ).order_by()
+    for row in rows.iterator():
+        flight = row['flight__flight_unique_id']
+        if flight not in flights:
+            flights[flight] = _new_group(flight=flight)
+        _group(row, flights[flight])
+        # Manual plays of a flight count as one run
+        key = (flight, row['run_token'] or 'manual')
+        if key not in runs:
+            runs[key] = _new_group(flight=flight, run=key[1], source=row['source'])
+        _group(row, runs[key])
+
+    return {
+        'flights': [_finish(group) for _, group in sorted(flights.items())],
+        'runs': sorted((_finish(group) for group in runs.values()), key=lambda group: group['first_sent_at']),
+    }
+
+atexit.register(writer.flush)
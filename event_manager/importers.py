@@ -0,0 +1,271 @@
+"""
+Streaming event import.
+
+Rows are parsed incrementally from the upload, sorted by ingestion_time with
+bounded memory (sorted runs are spilled to temporary files and merged), and
+inserted with bulk_create in large batches.
+
+Captures holding many flights (JSONL or CSV with a flight_unique_id column)
+are split into one partition file per worker process. Each worker sorts its
+partition by flight and ingestion_time, creates missing flights and replaces
+their events, so a flight is always handled by exactly one process.
+"""
+import csv
+import heapq
+import io
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import pickle
+import tempfile
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.db import connections, transaction
+
+from . import api_cache
+from .models import PRIORITY_GAP, Flight, FlightEvent, PlaybackSession
+
+logger = logging.getLogger(__name__)
+
+INGESTION_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+
+def _text_stream(source):
+    if isinstance(source, str):
+        return io.StringIO(source)
+    if isinstance(source, io.TextIOBase):
+        return source
+    if hasattr(source, 'chunks'):
+        # Uploads above FILE_UPLOAD_MAX_MEMORY_SIZE are already on disk; read them as a stream
+        source.seek(0)
+        source = source.file
+    return io.TextIOWrapper(source, encoding='utf-8', newline='')
+
+def read_csv_rows(source):
+    """
+    Yield CSV rows as dicts from an uploaded file, an open file or a string, one line at a time.
+    """
+    yield from csv.DictReader(_text_stream(source))
+
+def read_jsonl_rows(source):
+    """
+    Yield rows of a JSONL capture as dicts. raw_event_json may be given as a JSON
+    string or as the event object itself.
+    """
+    for line_number, line in enumerate(_text_stream(source), start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f'Invalid JSON on line {line_number}: {str(e)}')
+        if not isinstance(row, dict):
+            raise ValueError(f'Line {line_number} is not a JSON object')
+        if not isinstance(row.get('raw_event_json'), str):
+            row['raw_event_json'] = json.dumps(row.get('raw_event_json'))
+        yield row
+
+def detect_format(name):
+    """Capture format ('csv' or 'jsonl') from a file name; JSONL unless it ends in .csv."""
+    return 'csv' if (name or '').lower().endswith('.csv') else 'jsonl'
+
+def _event_row(row):
+    # Keep only what is stored, so sorted runs stay small
+    return (
+        row['raw_event_json'],
+        row['identified_changes'],
+        row['flight_state'],
+        # Captures are recorded in UTC
+        datetime.strptime(row['ingestion_time'], INGESTION_TIME_FORMAT).replace(tzinfo=timezone.utc),
+    )
+
+def _spill(run):
+    spill_file = tempfile.TemporaryFile()
+    for item in run:
+        pickle.dump(item, spill_file, protocol=pickle.HIGHEST_PROTOCOL)
+    spill_file.seek(0)
+    return spill_file
+
+def _read_spill(spill_file):
+    try:
+        while True:
+            try:
+                yield pickle.load(spill_file)
+            except EOFError:
+                return
+    finally:
+        spill_file.close()
+
+def external_sort(items, key, run_size=None):
+    """
+    Yield items ordered by key(item), keeping at most run_size items in memory.
+    Items with equal keys keep their input order.
+    """
+    run_size = run_size or getattr(settings, 'IMPORT_SORT_RUN_SIZE', 50000)
+    runs = []
+    run = []
+    for sequence, item in enumerate(items):
+        run.append((key(item), sequence, item))
+        if len(run) >= run_size:
+            run.sort()
+            runs.append(_spill(run))
+            run = []
+    run.sort()
+
+    if not runs:
+        for _, _, item in run:
+            yield item
+        return
+
+    runs.append(_spill(run))
+    for _, _, item in heapq.merge(*[_read_spill(spill_file) for spill_file in runs]):
+        yield item
+
+def sort_by_ingestion_time(rows, run_size=None):
+    """
+    Yield (raw_event, identified_changes, flight_state, ingestion_time) tuples ordered by
+    ingestion_time. Ties keep their input order.
+    """
+    return external_sort((_event_row(row) for row in rows), key=lambda event_row: event_row[3], run_size=run_size)
+
+def insert_flight_events(flight, event_rows, batch_size=None):
+    """
+    Bulk-insert sorted event rows for a flight with priorities spaced by PRIORITY_GAP.
+    Returns the number of rows.
+    Call inside a transaction so a bad row rolls the whole import back.
+    """
+    batch_size = batch_size or getattr(settings, 'IMPORT_BATCH_SIZE', 2000)
+    batch = []
+    count = 0
+    for count, (raw_event, identified_changes, flight_state, ingestion_time) in enumerate(event_rows, start=1):
+        event = FlightEvent(
+            flight=flight,
+            raw_event=raw_event,
+            identified_changes=identified_changes,
+            flight_state=flight_state,
+            priority=count * PRIORITY_GAP,
+            ingestion_time=ingestion_time
+        )
+        try:
+            event.populate_derived_fields()
+        except json.JSONDecodeError as e:
+            raise ValueError(f'Invalid JSON in raw_event_json of row {count}: {str(e)}')
+        batch.append(event)
+        if len(batch) >= batch_size:
+            FlightEvent.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        FlightEvent.objects.bulk_create(batch)
+    return count
+
+def _init_worker():
+    # Spawned workers start a fresh interpreter and need their own Django setup
+    if not apps.ready:
+        django.setup()
+
+def _partition(rows, partitions, directory):
+    """
+    Write rows to one pickle file per partition, keyed by flight so a flight never spans
+    two partitions. Returns the paths of non-empty partitions and the number of rows.
+    """
+    paths = [os.path.join(directory, f'partition-{index}') for index in range(partitions)]
+    files = [open(path, 'wb') for path in paths]
+    used = set()
+    count = 0
+    try:
+        for count, row in enumerate(rows, start=1):
+            try:
+                flight_unique_id = row['flight_unique_id'].strip()
+                item = (flight_unique_id,) + _event_row(row)
+            except KeyError as e:
+                raise ValueError(f'Row {count} is missing {e}')
+            except (AttributeError, TypeError, ValueError) as e:
+                raise ValueError(f'Row {count} is invalid: {str(e)}')
+            if not flight_unique_id:
+                raise ValueError(f'Row {count} has an empty flight_unique_id')
+            index = zlib.crc32(flight_unique_id.encode('utf-8')) % partitions
+            pickle.dump(item, files[index], protocol=pickle.HIGHEST_PROTOCOL)
+            used.add(index)
+    finally:
+        for partition_file in files:
+            partition_file.close()
+    return [paths[index] for index in sorted(used)], count
+
+def ingest_partition(path, batch_size=None):
+    """
+    Create missing flights and replace the events of every flight in one partition file.
+    Each flight is written in its own transaction; a failing flight is reported and skipped.
+    """
+    summary = {'flights': 0, 'flights_created': 0, 'events': 0, 'errors': []}
+    items = external_sort(_read_spill(open(path, 'rb')), key=lambda item: (item[0], item[4]))
+    for flight_unique_id, group in itertools.groupby(items, key=lambda item: item[0]):
+        try:
+            with transaction.atomic():
+                flight, created = Flight.objects.get_or_create(flight_unique_id=flight_unique_id)
+                if not created:
+                    flight.events.all().delete()
+                    # The new events start unplayed
+                    PlaybackSession.objects.filter(flight=flight).update(last_priority=None)
+                count = insert_flight_events(flight, (item[1:] for item in group), batch_size)
+        except Exception as e:
+            logger.error(f"Error ingesting flight {flight_unique_id}: {str(e)}")
+            summary['errors'].append({'flight_unique_id': flight_unique_id, 'error': str(e)})
+            continue
+
+        flight.refresh_fid_pointer()
+        flight.refresh_priority_bounds()
+        api_cache.invalidate_flight(flight)
+        summary['flights'] += 1
+        summary['flights_created'] += int(created)
+        summary['events'] += count
+    return summary
+
+def ingest_capture(source, capture_format='jsonl', workers=None, batch_size=None):
+    """
+    Ingest a capture holding events of many flights, using up to `workers` processes.
+    Returns a summary with flight, event and error counts, elapsed time and rows per second.
+    """
+    if capture_format not in ('jsonl', 'csv'):
+        raise ValueError(f'Unsupported capture format: {capture_format}')
+    # Get worker count from settings or use default
+    workers = max(workers or getattr(settings, 'INGEST_WORKERS', 4), 1)
+    if connections['default'].vendor == 'sqlite':
+        # SQLite allows a single writer, so parallel workers would only lock each other out
+        workers = 1
+    started = time.perf_counter()
+    rows = read_csv_rows(source) if capture_format == 'csv' else read_jsonl_rows(source)
+
+    with tempfile.TemporaryDirectory(prefix='ingest-') as directory:
+        paths, row_count = _partition(rows, workers, directory)
+        if len(paths) <= 1:
+            results = [ingest_partition(path, batch_size) for path in paths]
+        else:
+            # Spawned rather than forked: this may run in a web worker whose other threads
+            # (playback, history, logging, Kafka polling) could hold a lock at fork time
+            with ProcessPoolExecutor(
+                max_workers=len(paths), mp_context=multiprocessing.get_context('spawn'), initializer=_init_worker
+            ) as executor:
+                results = list(executor.map(ingest_partition, paths, itertools.repeat(batch_size)))
+
+    summary = {'rows': row_count, 'flights': 0, 'flights_created': 0, 'events': 0, 'errors': []}
+    for result in results:
+        for key in ('flights', 'flights_created', 'events', 'errors'):
+            summary[key] += result[key]
+    elapsed = time.perf_counter() - started
+    summary['workers'] = len(paths)
+    summary['elapsed_seconds'] = round(elapsed, 3)
+    summary['rows_per_second'] = round(row_count / elapsed) if elapsed > 0 else row_count
+    logger.info(
+        f"Ingested {summary['events']} events for {summary['flights']} flights "
+        f"({summary['flights_created']} new) in {elapsed:.2f}s with {len(paths)} workers, "
+        f"{len(summary['errors'])} flights failed"
+    )
+    return summary
@@ -0,0 +1,161 @@
+"""
+Logging of callback, proxy and Kafka payloads without slowing the request down.
+
+Payload bodies are logged for a sample of calls (PAYLOAD_LOG_SAMPLE_RATE) and
+cut at PAYLOAD_LOG_MAX_CHARS; the one-line summary of each call is always
+logged. A body is passed to the logger as a Body argument, which is only
+rendered when a handler formats the record, and then only up to the cap, so
+a multi-hundred-KB event is never serialised in full just to be truncated.
+PAYLOAD_LOG_FULL=1 logs every body in full, pretty-printed, for debugging.
+
+BackgroundStreamHandler (the console handler in settings.LOGGING) moves
+formatting and writing to a background thread: request threads only put the
+record on a bounded queue. Records that do not fit are dropped instead of
+blocking the request, and a warning with their count is logged once the
+queue has room again.
+"""
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import threading
+from logging.handlers import QueueListener
+
+from django.conf import settings
+
+
+def full_capture():
+    # Get payload logging settings from settings or use defaults
+    return getattr(settings, 'PAYLOAD_LOG_FULL', False)
+
+def get_sample_rate():
+    return getattr(settings, 'PAYLOAD_LOG_SAMPLE_RATE', 0.1)
+
+def get_max_chars():
+    return getattr(settings, 'PAYLOAD_LOG_MAX_CHARS', 2000)
+
+def sample(logger):
+    """Whether to log the bodies of this call; decide once per call so a request and its response go together."""
+    if not logger.isEnabledFor(logging.INFO):
+        return False
+    if full_capture():
+        return True
+    rate = get_sample_rate()
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+class Body:
+    """A payload (parsed JSON, text or bytes) that is rendered, up to the size cap, only when logged."""
+
+    __slots__ = ('value', 'limit', 'pretty')
+
+    def __init__(self, value):
+        self.value = value
+        full = full_capture()
+        self.limit = None if full else get_max_chars()
+        self.pretty = full
+
+    def __str__(self):
+        value = self.value
+        if isinstance(value, bytes):
+            value = value.decode('utf-8', errors='replace') if self.limit is None else value[:self.limit + 1].decode('utf-8', errors='replace')
+        if isinstance(value, str) and self.pretty:
+            # Full capture re-indents JSON text, such as a response body
+            try:
+                value = json.loads(value)
+            except ValueError:
+                pass
+        if isinstance(value, str):
+            text = value
+        else:
+            text = self._encode(value)
+        if self.limit is not None and len(text) > self.limit:
+            return f'{text[:self.limit]}... (truncated)'
+        return text
+
+    def _encode(self, value):
+        encoder = json.JSONEncoder(indent=2 if self.pretty else None, default=str)
+        if self.limit is None:
+            return encoder.encode(value)
+        # Stop encoding once the cap is passed
+        chunks = []
+        length = 0
+        for chunk in encoder.iterencode(value):
+            chunks.append(chunk)
+            length += len(chunk)
+            if length > self.limit:
+                break
+        return ''.join(chunks)
+
+
+class BackgroundStreamHandler(logging.Handler):
+    """Stream handler whose formatting and writes happen on a background thread."""
+
+    def __init__(self, queue_size=10000, stream=None):
+        super().__init__()
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.target = logging.StreamHandler(stream)
+        self.dropped = 0
+        self._unreported = 0  # Dropped records not yet reported in the log
+        self._listener = None
+        self._pid = None
+        self._stopped = False
+        self._start_lock = threading.Lock()
+        atexit.register(self.stop)
+
+    def setFormatter(self, fmt):
+        # The target does the formatting, on the background thread
+        super().setFormatter(fmt)
+        self.target.setFormatter(fmt)
+
+    def _ensure_listener(self):
+        # Started on first use, and again in a forked worker process, where the thread does not survive
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                if self._pid is not None:
+                    # Forked: the queued records are the parent's to write, and the queue's lock may
+                    # have been copied while held
+                    self.queue = queue.Queue(maxsize=self.queue.maxsize)
+                    self.dropped = self._unreported = 0
+                self._listener = QueueListener(self.queue, self.target, respect_handler_level=True)
+                self._listener.start()
+                self._pid = os.getpid()
+
+    def emit(self, record):
+        if self._stopped:
+            # At exit, after the background writer has been stopped
+            self.target.handle(record)
+            return
+        self._ensure_listener()
+        if record.exc_info:
+            # Render the traceback now rather than keep its frames alive until the record is written
+            record = copy.copy(record)
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            self._unreported += 1
+            return
+        if self._unreported:
+            count, self._unreported = self._unreported, 0
+            notice = logging.makeLogRecord({
+                'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                'msg': f'{count} log records were dropped because the log queue was full',
+            })
+            try:
+                self.queue.put_nowait(notice)
+            except queue.Full:
+                self._unreported += count
+
+    def stop(self):
+        self._stopped = True
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+            self._listener = None
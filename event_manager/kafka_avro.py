@@ -0,0 +1,113 @@
+"""
+Avro encoding for Kafka production.
+
+Messages are encoded in the Confluent wire format (magic byte, 4-byte schema
+id, Avro binary body). The schema of a subject is resolved once and the
+parsed schema and wire header are cached per (registry, subject), so later
+messages and requests only pay for the Avro encoding itself.
+
+Without a registry URL, schemas are read from AVRO_SCHEMA_DIR/<subject>.avsc
+and served by LocalSchemaRegistry, an in-process stand-in for the registry.
+It derives the schema id from the schema text, so the id is stable across
+processes but does not match ids of a real registry.
+"""
+import io
+import json
+import logging
+import os
+import struct
+import threading
+import zlib
+
+from confluent_kafka.schema_registry import RegisteredSchema, Schema, SchemaRegistryClient
+from django.conf import settings
+from fastavro import parse_schema, schemaless_writer
+
+logger = logging.getLogger(__name__)
+
+
+class LocalSchemaRegistry:
+    """Serves schemas from .avsc files through the registry client's get_latest_version()."""
+
+    def __init__(self, schema_dir):
+        self.schema_dir = schema_dir
+
+    def get_latest_version(self, subject):
+        path = os.path.join(self.schema_dir, f'{subject}.avsc')
+        try:
+            with open(path, encoding='utf-8') as schema_file:
+                schema_str = schema_file.read()
+        except FileNotFoundError:
+            raise ValueError(f'No schema registry URL given and no local schema file {path}')
+        schema_id = zlib.crc32(schema_str.encode('utf-8')) & 0x7fffffff
+        return RegisteredSchema(schema_id, Schema(schema_str, 'AVRO'), subject, 1)
+
+
+class AvroEncoder:
+    """Encoder for one subject, built from the subject's latest schema."""
+
+    def __init__(self, registry, subject):
+        self.subject = subject
+        registered = registry.get_latest_version(subject)
+        if registered.schema.references:
+            raise ValueError(f'Schema {subject} references other schemas, which is not supported')
+        self.schema_id = registered.schema_id
+        self.parsed_schema = parse_schema(json.loads(registered.schema.schema_str))
+        # Magic byte 0 and the big-endian schema id, as written by Confluent serializers
+        self.header = struct.pack('>bI', 0, self.schema_id)
+
+    def encode(self, record):
+        return self.encode_batch([record])[0]
+
+    def encode_batch(self, records):
+        """Encode many records reusing one buffer. Raises ValueError naming the first bad record."""
+        buffer = io.BytesIO()
+        encoded = []
+        for index, record in enumerate(records):
+            buffer.seek(0)
+            buffer.truncate()
+            buffer.write(self.header)
+            try:
+                schemaless_writer(buffer, self.parsed_schema, record)
+            except Exception as e:
+                raise ValueError(f'Record {index} does not match schema {self.subject}: {str(e)}')
+            encoded.append(buffer.getvalue())
+        return encoded
+
+
+_registries = {}
+_encoders = {}
+_lock = threading.Lock()
+
+def get_registry(schema_registry_url=None):
+    key = schema_registry_url or ''
+    registry = _registries.get(key)
+    if registry is None:
+        if schema_registry_url:
+            registry = SchemaRegistryClient({'url': schema_registry_url})
+        else:
+            # Get schema directory from settings or use default
+            registry = LocalSchemaRegistry(getattr(settings, 'AVRO_SCHEMA_DIR', os.path.join(settings.BASE_DIR, 'schemas')))
+        _registries[key] = registry
+    return registry
+
+def get_encoder(subject, schema_registry_url=None):
+    """Cached encoder for the subject; the schema is fetched on first use only."""
+    key = (schema_registry_url or '', subject)
+    with _lock:
+        encoder = _encoders.get(key)
+        if encoder is None:
+            logger.info(f"Resolving Avro schema for subject {subject} from {schema_registry_url or 'local schema files'}")
+            encoder = AvroEncoder(get_registry(schema_registry_url), subject)
+            _encoders[key] = encoder
+        return encoder
+
+def clear_cache():
+    """Forget cached schemas, e.g. after a new schema version was registered."""
+    with _lock:
+        _encoders.clear()
+        _registries.clear()
+
+def default_subject(topic):
+    # Confluent's default TopicNameStrategy for message values
+    return f'{topic}-value'
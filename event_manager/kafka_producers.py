@@ -0,0 +1,194 @@
+"""
+Long-lived Kafka producers shared by every request of a worker process.
+
+One producer is kept per bootstrap server list (and config overrides, such as
+the throughput-tuned settings of bulk publishing), so broker metadata discovery
+and connection setup happen once instead of on every produce. A background
+thread polls each producer, which delivers the delivery reports
+asynchronously; callers get a Future they can wait on for their own message
+only, instead of flushing the whole producer.
+
+Per-topic stats record produce-to-delivery latency and how many messages are
+still waiting for a delivery report. Tests can swap the Producer class with
+set_producer_factory().
+"""
+import atexit
+import logging
+import socket
+import threading
+import time
+from concurrent.futures import Future
+
+from confluent_kafka import KafkaException, Producer
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ProducerStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._topics = {}
+
+    def _topic(self, topic):
+        return self._topics.setdefault(topic, {
+            'produced': 0, 'delivered': 0, 'failed': 0, 'in_flight': 0,
+            'latency_seconds': 0.0, 'max_latency_seconds': 0.0,
+        })
+
+    def record_produce(self, topic):
+        with self._lock:
+            values = self._topic(topic)
+            values['produced'] += 1
+            values['in_flight'] += 1
+
+    def record_delivery(self, topic, seconds, failed=False):
+        with self._lock:
+            values = self._topic(topic)
+            values['in_flight'] -= 1
+            values['failed' if failed else 'delivered'] += 1
+            values['latency_seconds'] += seconds
+            values['max_latency_seconds'] = max(values['max_latency_seconds'], seconds)
+
+    def reset(self):
+        with self._lock:
+            # Messages still in flight will report back, so keep counting them
+            in_flight = {topic: values['in_flight'] for topic, values in self._topics.items() if values['in_flight']}
+            self._topics = {}
+            for topic, count in in_flight.items():
+                self._topic(topic)['in_flight'] = count
+
+    def snapshot(self):
+        with self._lock:
+            topics = {topic: dict(values) for topic, values in self._topics.items()}
+
+        result = {}
+        for topic, values in topics.items():
+            reported = values['delivered'] + values['failed']
+            result[topic] = {
+                'produced': values['produced'],
+                'delivered': values['delivered'],
+                'failed': values['failed'],
+                # Messages produced but not yet acknowledged by the broker
+                'queue_depth': values['in_flight'],
+                'avg_latency_ms': round(values['latency_seconds'] / reported * 1000, 2) if reported else 0.0,
+                'max_latency_ms': round(values['max_latency_seconds'] * 1000, 2),
+            }
+        return result
+
+
+stats = ProducerStats()
+
+_producer_factory = Producer
+
+def set_producer_factory(factory):
+    """Replace the Producer class (e.g. with a mock) and drop producers built by the old one."""
+    global _producer_factory
+    close_all()
+    _producer_factory = factory
+
+
+class PooledProducer:
+    """A producer plus the thread that serves its delivery reports."""
+
+    def __init__(self, bootstrap_servers, overrides=None):
+        self.bootstrap_servers = bootstrap_servers
+        self.producer = _producer_factory(get_producer_config(bootstrap_servers, overrides))
+        self._closed = threading.Event()
+        self._poller = threading.Thread(target=self._poll, name=f'kafka-poll-{bootstrap_servers}', daemon=True)
+        self._poller.start()
+
+    def _poll(self):
+        while not self._closed.is_set():
+            try:
+                self.producer.poll(0.1)
+            except Exception as e:
+                logger.error(f"Error polling Kafka producer for {self.bootstrap_servers}: {str(e)}")
+                time.sleep(1)
+
+    def produce(self, topic, value, key=None):
+        """Queue a message and return a Future resolved with the delivered message."""
+        future = Future()
+        started = time.perf_counter()
+
+        def on_delivery(err, msg):
+            stats.record_delivery(topic, time.perf_counter() - started, failed=err is not None)
+            if err is not None:
+                logger.error(f"Message delivery to {topic} failed: {str(err)}")
+                future.set_exception(KafkaException(err))
+            else:
+                logger.debug(f"Message delivered to {msg.topic()} [{msg.partition()}] at offset {msg.offset()}")
+                future.set_result(msg)
+
+        stats.record_produce(topic)
+        while True:
+            try:
+                self.producer.produce(topic=topic, value=value, key=key, on_delivery=on_delivery)
+                return future
+            except BufferError:
+                # Local queue is full; let the poller drain delivery reports and retry
+                logger.warning(f"Kafka producer queue full for {self.bootstrap_servers}, waiting")
+                time.sleep(0.05)
+            except Exception:
+                stats.record_delivery(topic, time.perf_counter() - started, failed=True)
+                raise
+
+    def queue_length(self):
+        return len(self.producer)
+
+    def close(self, timeout=10):
+        remaining = self.producer.flush(timeout)
+        if remaining:
+            logger.warning(f"{remaining} Kafka messages for {self.bootstrap_servers} were not delivered before shutdown")
+        self._closed.set()
+
+
+def get_producer_config(bootstrap_servers, overrides=None):
+    config = {
+        'bootstrap.servers': bootstrap_servers,
+        'client.id': socket.gethostname(),
+        # Fail a message that cannot be delivered instead of retrying it for 5 minutes
+        'message.timeout.ms': getattr(settings, 'KAFKA_MESSAGE_TIMEOUT_MS', 30000),
+    }
+    config.update(overrides or {})
+    return config
+
+def _pool_key(bootstrap_servers, overrides):
+    if not overrides:
+        return bootstrap_servers
+    return f"{bootstrap_servers} ({', '.join(f'{name}={value}' for name, value in sorted(overrides.items()))})"
+
+_producers = {}
+_producers_lock = threading.Lock()
+
+def get_producer(bootstrap_servers, overrides=None):
+    """Shared producer for these servers; producers with different config overrides are pooled separately."""
+    key = _pool_key(bootstrap_servers, overrides)
+    with _producers_lock:
+        pooled = _producers.get(key)
+        if pooled is None:
+            logger.info(f"Creating Kafka producer for {key}")
+            pooled = PooledProducer(bootstrap_servers, overrides)
+            _producers[key] = pooled
+        return pooled
+
+def produce(bootstrap_servers, topic, value, key=None):
+    return get_producer(bootstrap_servers).produce(topic, value, key)
+
+def get_stats():
+    with _producers_lock:
+        producers = dict(_producers)
+    return {
+        'topics': stats.snapshot(),
+        # Messages waiting in each producer's local queue (not yet sent or acknowledged)
+        'producers': {servers: {'queue_length': pooled.queue_length()} for servers, pooled in producers.items()},
+    }
+
+def close_all(timeout=10):
+    with _producers_lock:
+        producers = list(_producers.values())
+        _producers.clear()
+    for pooled in producers:
+        pooled.close(timeout)
+
+atexit.register(close_all)
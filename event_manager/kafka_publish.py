@@ -0,0 +1,146 @@
+"""
+Publish a flight's event sequence (or a priority range of it) to a Kafka topic.
+
+Messages go through a shared producer tuned for throughput: it lingers to
+fill larger batches and compresses them. Every message is queued without
+waiting, and delivery reports are collected once all of them are queued.
+Values are the stored JSON, or Avro when a schema subject is given (encoded
+a chunk of events at a time with the cached encoder of the subject).
+"""
+import logging
+import time
+from concurrent.futures import wait
+
+from django.conf import settings
+
+from . import kafka_avro, kafka_producers
+
+logger = logging.getLogger(__name__)
+
+# How the message key is chosen: no key, the flight unique id, the event's fid, or the event id.
+# Keying by flight or fid keeps the flight's events in order on one partition.
+KEY_STRATEGIES = ('none', 'flight', 'fid', 'event')
+
+# Events read and Avro-encoded together
+ENCODE_CHUNK_SIZE = 500
+
+
+def get_bulk_producer_overrides():
+    return {
+        'linger.ms': getattr(settings, 'KAFKA_BULK_LINGER_MS', 50),
+        'batch.size': getattr(settings, 'KAFKA_BULK_BATCH_BYTES', 1048576),
+        'compression.type': getattr(settings, 'KAFKA_BULK_COMPRESSION', 'lz4'),
+    }
+
+def _message_key(key_strategy, flight, event):
+    if key_strategy == 'flight':
+        return flight.flight_unique_id.encode('utf-8')
+    if key_strategy == 'event':
+        return str(event.id).encode('utf-8')
+    if key_strategy == 'fid':
+        fid = event.event_data.get('fid') if isinstance(event.event_data, dict) else None
+        return str(fid if fid is not None else flight.fid or flight.flight_unique_id).encode('utf-8')
+    return None
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _encode_values(events, encoder):
+    if encoder is None:
+        return [event.raw_event.encode('utf-8') for event in events]
+    for event in events:
+        if event.event_data is None:
+            raise ValueError(f'Event {event.id} has no parsed payload to encode as Avro')
+    return encoder.encode_batch([event.event_data for event in events])
+
+def publish_flight_events(flight, bootstrap_servers, topic, min_priority=None, max_priority=None,
+                          key_strategy='none', rate=None, avro_subject=None, schema_registry_url=None):
+    """
+    Produce each event of the flight, in priority order, to the topic.
+    rate limits messages per second (None sends as fast as the producer accepts them).
+    With avro_subject, values are Avro-encoded with that subject's schema.
+    Returns counts of delivered and failed messages, payload sizes, elapsed time and messages per second.
+    """
+    if key_strategy not in KEY_STRATEGIES:
+        raise ValueError(f'Unknown key strategy: {key_strategy}')
+    if rate is not None and rate <= 0:
+        raise ValueError('Rate must be positive')
+    # Resolve the schema before sending anything, so a bad subject fails fast
+    encoder = kafka_avro.get_encoder(avro_subject, schema_registry_url) if avro_subject else None
+
+    events = flight.events.order_by('priority', 'created_at')
+    if min_priority is not None:
+        events = events.filter(priority__gte=min_priority)
+    if max_priority is not None:
+        events = events.filter(priority__lte=max_priority)
+    fields = ['id', 'raw_event'] + (['event_data'] if key_strategy == 'fid' or encoder is not None else [])
+
+    overrides = get_bulk_producer_overrides()
+    pooled = kafka_producers.get_producer(bootstrap_servers, overrides)
+    logger.info(
+        f"Publishing events of flight {flight.flight_unique_id} to {topic} "
+        f"(key: {key_strategy}, encoding: {'avro' if encoder else 'json'})"
+    )
+
+    started = time.perf_counter()
+    futures = []
+    json_bytes = 0
+    payload_bytes = 0
+    for chunk in _chunks(events.only(*fields).iterator(chunk_size=2000), ENCODE_CHUNK_SIZE):
+        values = _encode_values(chunk, encoder)
+        for event, value in zip(chunk, values):
+            if rate:
+                # Pace against the start time so the average rate holds even if one send is slow
+                delay = started + len(futures) / rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            json_bytes += len(event.raw_event.encode('utf-8'))
+            payload_bytes += len(value)
+            futures.append(pooled.produce(topic, value, _message_key(key_strategy, flight, event)))
+    queued_seconds = time.perf_counter() - started
+
+    # Get delivery timeout from settings or use default
+    done, not_done = wait(futures, timeout=getattr(settings, 'KAFKA_BULK_DELIVERY_TIMEOUT', 60))
+    elapsed = time.perf_counter() - started
+
+    errors = {}
+    for future in done:
+        error = future.exception()
+        if error is not None:
+            errors[str(error)] = errors.get(str(error), 0) + 1
+    failed = sum(errors.values())
+    delivered = len(done) - failed
+
+    summary = {
+        'flight': flight.flight_unique_id,
+        'topic': topic,
+        'key_strategy': key_strategy,
+        'encoding': 'avro' if encoder else 'json',
+        'messages': len(futures),
+        'delivered': delivered,
+        'failed': failed,
+        # Still waiting for a delivery report when the timeout expired
+        'pending': len(not_done),
+        'errors': [{'error': error, 'count': count} for error, count in errors.items()],
+        'payload_bytes': payload_bytes,
+        'json_bytes': json_bytes,
+        'queued_seconds': round(queued_seconds, 3),
+        'elapsed_seconds': round(elapsed, 3),
+        'messages_per_second': round(delivered / elapsed, 1) if elapsed > 0 else float(delivered),
+        'producer_config': overrides,
+    }
+    if encoder is not None:
+        summary['schema_subject'] = encoder.subject
+        summary['schema_id'] = encoder.schema_id
+    logger.info(
+        f"Published {delivered}/{len(futures)} events of flight {flight.flight_unique_id} to {topic} "
+        f"in {elapsed:.2f}s ({summary['messages_per_second']} msg/s), {failed} failed, {len(not_done)} pending"
+    )
+    return summary
@@ -0,0 +1,369 @@
+"""
+Rate-controlled load generation from stored flights.
+
+Replays the stored events of many flights at a target aggregate rate in events
+per second, which is constant, ramps linearly, or steps through levels. Send
+times come from the rate profile alone (open loop): each event is handed to a
+sender thread at its scheduled time whether or not earlier callbacks have
+returned, so a slow target shows up as growing latency instead of quietly
+lowering the offered load. Latency is measured from the scheduled send time,
+so time spent waiting for a free sender thread counts as well.
+
+The sender threads are capped (the concurrency). When all of them are busy,
+sends wait and the run is no longer open loop, so every send records when it
+actually started: the offered rate is computed from those start times, the
+scheduling lag (actual minus intended start) is reported, and sends delayed
+by the cap are counted and logged as a warning.
+
+Events are taken round-robin across the flights, each flight's in priority
+order, and sent one per callback to the flight's callback URL. Nothing is
+marked played and no playback session is touched, so a load test can run
+against flights that are also used for mock sessions.
+"""
+import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+
+from . import http_client
+from .callbacks import build_callback_payload, get_callback_timeout
+from .models import FlightEvent, MockConfiguration
+
+logger = logging.getLogger(__name__)
+
+PROFILES = ('constant', 'ramp', 'step')
+PERCENTILES = (50, 90, 95, 99)
+
+
+class LoadTestError(Exception):
+    pass
+
+
+class RateProfile:
+    """Target rate over time, as segments of (duration, start rate, end rate) with the rate linear in between."""
+
+    def __init__(self, kind, segments):
+        self.kind = kind
+        self.segments = segments
+
+    @property
+    def duration(self):
+        return sum(duration for duration, _, _ in self.segments)
+
+    @property
+    def total_events(self):
+        return int(math.ceil(sum((start + end) / 2 * duration for duration, start, end in self.segments)))
+
+    def events_between(self, begin, end):
+        """Expected number of events scheduled between two offsets."""
+        total = 0.0
+        offset = 0.0
+        for duration, start_rate, end_rate in self.segments:
+            low, high = max(begin - offset, 0.0), min(end - offset, duration)
+            if high > low:
+                slope = (end_rate - start_rate) / duration
+                total += (start_rate + slope * (low + high) / 2) * (high - low)
+            offset += duration
+        return total
+
+    def send_times(self):
+        """Offsets in seconds from the start at which successive events are due."""
+        offset = 0.0
+        base = 0.0  # events due before the current segment
+        index = 0
+        for duration, start_rate, end_rate in self.segments:
+            slope = (end_rate - start_rate) / duration
+            area = (start_rate + end_rate) / 2 * duration
+            while index < base + area:
+                count = index - base
+                # Invert the cumulative count start_rate * t + slope * t^2 / 2 for t
+                if slope == 0:
+                    due = count / start_rate
+                else:
+                    due = (math.sqrt(max(start_rate ** 2 + 2 * slope * count, 0.0)) - start_rate) / slope
+                yield offset + min(due, duration)
+                index += 1
+            offset += duration
+            base += area
+
+    def describe(self):
+        if self.kind == 'step':
+            return f"step {', '.join(f'{start:g}' for _, start, _ in self.segments)} events/s, {self.segments[0][0]:g}s each"
+        duration, start, end = self.segments[0]
+        if self.kind == 'ramp':
+            return f'ramp {start:g} to {end:g} events/s over {duration:g}s'
+        return f'constant {start:g} events/s for {duration:g}s'
+
+
+def build_profile(kind, rate=None, start_rate=None, end_rate=None, duration=None, steps=None, step_duration=None):
+    if kind == 'constant':
+        if not rate or rate <= 0 or not duration or duration <= 0:
+            raise LoadTestError('A constant profile needs a positive rate and duration')
+        return RateProfile(kind, [(duration, rate, rate)])
+    if kind == 'ramp':
+        if start_rate is None or end_rate is None or start_rate < 0 or end_rate < 0 or start_rate + end_rate <= 0:
+            raise LoadTestError('A ramp profile needs a start and end rate, at least one of them positive')
+        if not duration or duration <= 0:
+            raise LoadTestError('A ramp profile needs a positive duration')
+        return RateProfile(kind, [(duration, start_rate, end_rate)])
+    if kind == 'step':
+        if not steps or any(step < 0 for step in steps) or not any(steps):
+            raise LoadTestError('A step profile needs a list of non-negative rates, at least one of them positive')
+        if not step_duration or step_duration <= 0:
+            raise LoadTestError('A step profile needs a positive step duration')
+        return RateProfile(kind, [(step_duration, step, step) for step in steps])
+    raise LoadTestError(f"Unknown profile '{kind}'; use one of {', '.join(PROFILES)}")
+
+def percentile(sorted_values, percent):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(math.ceil(percent / 100 * len(sorted_values))), 1)
+    return sorted_values[rank - 1]
+
+def latency_summary(seconds):
+    """p50/p90/p95/p99, max and mean in milliseconds of durations given in seconds."""
+    values = sorted(seconds)
+    summary = {f'p{percent}': round(percentile(values, percent) * 1000, 2) for percent in PERCENTILES}
+    summary['max'] = round(values[-1] * 1000, 2) if values else 0.0
+    summary['mean'] = round(sum(values) / len(values) * 1000, 2) if values else 0.0
+    return summary
+
+def load_streams(flights, url=None):
+    """
+    Per flight, the (event id, callback URL, payload) of its stored events in priority order.
+    Every flight needs a callback URL unless url overrides them all.
+    """
+    callback_urls = dict(MockConfiguration.objects.filter(flight__in=flights).values_list('flight_id', 'callback_url'))
+    missing = [flight.flight_unique_id for flight in flights if not url and not callback_urls.get(flight.id)]
+    if missing:
+        raise LoadTestError(f"No callback URL configured for: {', '.join(missing)}")
+
+    streams = []
+    for flight in flights:
+        target = url or callback_urls[flight.id]
+        events = (
+            FlightEvent.objects.filter(flight=flight, event_data__isnull=False)
+            .order_by('priority', 'created_at')
+            .values_list('id', 'event_data')
+        )
+        stream = [(event_id, target, build_callback_payload(event_data, event_id)) for event_id, event_data in events]
+        if stream:
+            streams.append(stream)
+    if not streams:
+        raise LoadTestError('The selected flights have no stored events')
+    return streams
+
+def interleave(streams, loop=False):
+    """Events round-robin across the streams; with loop, each stream starts over once it runs out."""
+    positions = [0] * len(streams)
+    while True:
+        active = False
+        for index, stream in enumerate(streams):
+            if positions[index] >= len(stream):
+                if not loop:
+                    continue
+                positions[index] = 0
+            yield stream[positions[index]]
+            positions[index] += 1
+            active = True
+        if not active:
+            return
+
+
+class LoadGenerator:
+    def __init__(self, profile, streams, concurrency=None, timeout=None, loop=False, bucket_seconds=10):
+        self.profile = profile
+        self.streams = streams
+        # Get sender threads and callback timeout from settings or use defaults
+        self.concurrency = concurrency or getattr(settings, 'LOADGEN_MAX_CONCURRENCY', 64)
+        self.timeout = timeout or get_callback_timeout()
+        self.loop = loop
+        self.bucket_seconds = bucket_seconds
+        # One keep-alive connection per sender thread, so the target is not measured on connection setup
+        self._session = http_client.build_session(pool_connections=len(streams), pool_maxsize=self.concurrency)
+        self._lock = threading.Lock()
+        self._results = []  # (scheduled offset, scheduling lag seconds, service seconds, error or '')
+        self._dispatched = 0
+        self._sending = 0  # Sends that have started
+        self._capped = 0  # Sends queued because every sender thread was busy
+        self._in_flight = 0
+        self._max_in_flight = 0
+
+    def _send(self, event, due):
+        sent = time.monotonic()
+        with self._lock:
+            self._sending += 1
+        event_id, url, payload = event
+        error = ''
+        try:
+            response = self._session.post(url, json=payload, timeout=http_client.get_timeout(self.timeout))
+            if response.status_code >= 400:
+                error = f'HTTP {response.status_code}'
+        except requests.RequestException as e:
+            error = type(e).__name__
+            logger.debug(f"Load test callback for event {event_id} failed: {str(e)}")
+        except Exception as e:
+            # Not a transport error, e.g. a payload that cannot be encoded; recorded the same way
+            error = type(e).__name__
+            logger.debug(f"Load test callback for event {event_id} raised: {str(e)}")
+        finally:
+            # Always release the slot, or run() would wait on the concurrency cap forever
+            done = time.monotonic()
+            with self._lock:
+                self._results.append((due - self._started, sent - due, done - sent, error))
+                self._in_flight -= 1
+
+    def _progress(self, since):
+        with self._lock:
+            recent = self._results[since:]
+            completed = len(self._results)
+            in_flight = self._in_flight
+            waiting = self._dispatched - self._sending
+        latencies = sorted(lag + service for _, lag, service, _ in recent)
+        return completed, {
+            'elapsed_seconds': round(time.monotonic() - self._started, 1),
+            'dispatched': self._dispatched,
+            'completed': completed,
+            'in_flight': in_flight,
+            'waiting': waiting,
+            'failed': sum(1 for result in recent if result[3]),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        }
+
+    def run(self, progress=None, interval=5):
+        """Run the profile to the end (or until the events run out) and return the report."""
+        executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='loadgen')
+        events = interleave(self.streams, self.loop)
+        max_lag = 0.0
+        exhausted = interrupted = False
+        reported = 0
+        self._started = time.monotonic()
+        next_progress = self._started + interval
+        logger.info(f"Load test started: {self.profile.describe()} across {len(self.streams)} flights")
+        try:
+            for offset in self.profile.send_times():
+                event = next(events, None)
+                if event is None:
+                    exhausted = True
+                    break
+                due = self._started + offset
+                now = time.monotonic()
+                if progress and now >= next_progress:
+                    reported, values = self._progress(reported)
+                    progress(values)
+                    next_progress = now + interval
+                if due > now:
+                    time.sleep(due - now)
+                else:
+                    # Behind schedule: dispatch at once rather than skipping, and report how far behind
+                    max_lag = max(max_lag, now - due)
+                with self._lock:
+                    if self._in_flight >= self.concurrency:
+                        # No free sender thread: this send starts late
+                        self._capped += 1
+                    self._dispatched += 1
+                    self._in_flight += 1
+                    self._max_in_flight = max(self._max_in_flight, self._in_flight)
+                executor.submit(self._send, event, due)
+            while self._in_flight:
+                time.sleep(0.05)
+                if progress and time.monotonic() >= next_progress:
+                    reported, values = self._progress(reported)
+                    progress(values)
+                    next_progress = time.monotonic() + interval
+            executor.shutdown(wait=True)
+        except KeyboardInterrupt:
+            interrupted = True
+            # Drop sends still waiting for a thread; the running ones finish within the timeout
+            executor.shutdown(wait=True, cancel_futures=True)
+        finally:
+            self._session.close()
+
+        report = self._report(max_lag, exhausted or interrupted)
+        report['events_exhausted'] = exhausted
+        report['interrupted'] = interrupted
+        if report['concurrency_limited']:
+            logger.warning(
+                f"Load test hit the concurrency cap: {report['concurrency_limited']} of {report['dispatched']} sends "
+                f"waited for a free sender thread (max scheduling lag {report['schedule_lag_ms']['max']} ms), so the "
+                f"offered load was {report['offered_rate']} events/s instead of {report['target_rate']}; "
+                f"raise --concurrency"
+            )
+        logger.info(
+            f"Load test finished: {report['succeeded']} of {report['dispatched']} events succeeded, "
+            f"achieved {report['achieved_rate']} events/s, p99 {report['latency_ms']['p99']} ms"
+        )
+        return report
+
+    def _report(self, max_lag, ended_early):
+        with self._lock:
+            results = list(self._results)
+        elapsed = time.monotonic() - self._started
+        succeeded = [result for result in results if not result[3]]
+        errors = {}
+        for result in results:
+            if result[3]:
+                errors[result[3]] = errors.get(result[3], 0) + 1
+
+        # Actual start offsets: the scheduled offset plus the scheduling lag
+        starts = sorted(offset + lag for offset, lag, _, _ in results)
+        # The offered load is spread over the profile, or over longer when sends started late;
+        # a run that ended early only covers the sends it made
+        offered_seconds = starts[-1] if starts else 0.0
+        if not ended_early:
+            offered_seconds = max(offered_seconds, self.profile.duration)
+        by_bucket = {}
+        started_by_bucket = {}
+        for result in results:
+            by_bucket.setdefault(int(result[0] // self.bucket_seconds), []).append(result)
+        for start in starts:
+            bucket = int(start // self.bucket_seconds)
+            started_by_bucket[bucket] = started_by_bucket.get(bucket, 0) + 1
+        timeline = []
+        for bucket in range(int(math.ceil(self.profile.duration / self.bucket_seconds))):
+            begin = bucket * self.bucket_seconds
+            end = min(begin + self.bucket_seconds, self.profile.duration)
+            in_bucket = by_bucket.get(bucket, [])
+            latencies = sorted(lag + service for _, lag, service, error in in_bucket if not error)
+            timeline.append({
+                'start_second': round(begin, 3),
+                'target_rate': round(self.profile.events_between(begin, end) / (end - begin), 2),
+                'offered_rate': round(started_by_bucket.get(bucket, 0) / (end - begin), 2),
+                'achieved_rate': round(len(latencies) / (end - begin), 2),
+                'failed': len(in_bucket) - len(latencies),
+                'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+                'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            })
+
+        return {
+            'profile': self.profile.describe(),
+            'flights': len(self.streams),
+            'concurrency': self.concurrency,
+            'planned_events': self.profile.total_events,
+            'target_rate': round(self.profile.total_events / self.profile.duration, 2),
+            'dispatched': self._dispatched,
+            'completed': len(results),
+            'succeeded': len(succeeded),
+            'failed': len(results) - len(succeeded),
+            'cancelled': self._dispatched - len(results),
+            'errors': errors,
+            'elapsed_seconds': round(elapsed, 3),
+            # From the times sends actually started, so sends held back by the concurrency cap lower it
+            'offered_rate': round(len(starts) / offered_seconds, 2) if offered_seconds else 0.0,
+            'achieved_rate': round(len(succeeded) / elapsed, 2) if elapsed else 0.0,
+            'max_dispatch_lag_ms': round(max_lag * 1000, 2),
+            'max_in_flight': self._max_in_flight,
+            'concurrency_limited': self._capped,
+            # From the scheduled send time: waiting for a sender thread plus the callback itself
+            'latency_ms': latency_summary([lag + service for _, lag, service, error in succeeded]),
+            # Actual minus intended start of each send
+            'schedule_lag_ms': latency_summary([lag for _, lag, _, _ in results]),
+            'service_ms': latency_summary([service for _, _, service, error in succeeded]),
+            'timeline': timeline,
+        }
@@ -0,0 +1,124 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+
+from event_manager import api_cache
+from event_manager.api_views import flight_query
+from event_manager.models import Flight, FlightEvent, parse_flight_unique_id
+
+
+class Rollback(Exception):
+    pass
+
+
+def _percentile(timings, fraction):
+    if not timings:
+        return 0
+    if fraction == 0.5:
+        return statistics.median(timings)
+    timings = sorted(timings)
+    return timings[max(int(len(timings) * fraction) - 1, 0)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark /api/flight against synthetic data sets of increasing size. "
+        "Each query is timed once with its cache entry invalidated (database lookup) and once "
+        "cached. Data is created inside a transaction that is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000,100000',
+                            help='Comma-separated total event counts to benchmark')
+        parser.add_argument('--events-per-flight', type=int, default=50)
+        parser.add_argument('--queries', type=int, default=200, help='Queries timed per size')
+        parser.add_argument('--explain', action='store_true', help='Print the query plan of the lookup')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        self.stdout.write(
+            f"{'events':>10} {'flights':>8} {'miss p50':>9} {'miss p95':>9} {'miss max':>9} "
+            f"{'hit p50':>8} {'hit p95':>8} {'hits':>5}"
+        )
+        for size in sizes:
+            try:
+                with transaction.atomic():
+                    self._run(size, options)
+                    raise Rollback()
+            except Rollback:
+                pass
+
+    def _run(self, size, options):
+        per_flight = max(options['events_per_flight'], 1)
+        flight_count = max(size // per_flight, 1)
+
+        flights = []
+        for i in range(flight_count):
+            flight = Flight(flight_unique_id=f'BM{i}_05042025')
+            flight.flight_number, flight.flight_date = parse_flight_unique_id(flight.flight_unique_id)
+            flights.append(flight)
+        flights = Flight.objects.bulk_create(flights, batch_size=5000)
+
+        batch = []
+        for flight in flights:
+            for priority in range(1, per_flight + 1):
+                event = FlightEvent(
+                    flight=flight,
+                    raw_event=json.dumps({'fid': flight.flight_unique_id, 'priority': priority}),
+                    flight_state='SCHEDULED',
+                    priority=priority,
+                    identified_changes='FIRST_NAV_TRACKING' if priority == per_flight // 2 + 1 else 'TIME_CHANGE',
+                )
+                event.populate_derived_fields()
+                batch.append(event)
+                if len(batch) >= 5000:
+                    FlightEvent.objects.bulk_create(batch)
+                    batch = []
+        if batch:
+            FlightEvent.objects.bulk_create(batch)
+
+        factory = RequestFactory()
+        misses = []
+        hits = []
+        stats_before = api_cache.get_stats()
+        queried = set()
+        try:
+            for i in range(options['queries']):
+                # Query flights spread across the data set
+                flight = flights[(i * 7919) % flight_count]
+                queried.add(flight)
+                request = factory.get('/api/flight', {'fnum': flight.flight_number, 'date': '20250405'})
+                # The first query of each pair goes to the database, the second is served from the cache
+                api_cache.invalidate_flight(flight)
+                for timings in (misses, hits):
+                    started = time.perf_counter()
+                    response = flight_query(request)
+                    timings.append((time.perf_counter() - started) * 1000)
+                    if response.status_code != 200 or response.content == b'null':
+                        self.stderr.write(f'Unexpected response for query {i}: {response.status_code} {response.content[:100]}')
+        finally:
+            # The flights are rolled back; their cache entries would outlive them
+            for flight in queried:
+                api_cache.forget_flight(flight.flight_number, flight.flight_date)
+        stats = api_cache.get_stats()
+        cache_hits = stats['hits'] - stats_before['hits']
+        if cache_hits != len(hits) or stats['misses'] - stats_before['misses'] != len(misses):
+            self.stderr.write(f'Expected {len(hits)} cache hits and {len(misses)} misses, got {cache_hits} hits')
+
+        self.stdout.write(
+            f"{size:>10} {flight_count:>8} {_percentile(misses, 0.5):>9.2f} {_percentile(misses, 0.95):>9.2f} "
+            f"{max(misses, default=0):>9.2f} {_percentile(hits, 0.5):>8.2f} {_percentile(hits, 0.95):>8.2f} {cache_hits:>5}"
+        )
+
+        if options['explain']:
+            queryset = FlightEvent.objects.filter(
+                is_first_nav_tracking=True,
+                event_data__isnull=False,
+                flight__flight_number='BM0',
+                flight__flight_date=flights[0].flight_date,
+            ).only('raw_event')
+            self.stdout.write(queryset.explain())
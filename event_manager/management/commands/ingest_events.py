@@ -0,0 +1,43 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from event_manager.importers import detect_format, ingest_capture
+
+
+class Command(BaseCommand):
+    help = (
+        "Ingest a JSONL or CSV capture holding events of many flights. Rows need "
+        "flight_unique_id, ingestion_time, raw_event_json, identified_changes and flight_state. "
+        "Missing flights are created and the events of every flight in the capture are replaced."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Capture file, or '-' to read from stdin")
+        parser.add_argument('--format', choices=['jsonl', 'csv'],
+                            help='Capture format (default: from the file extension, JSONL unless .csv)')
+        parser.add_argument('--workers', type=int, help='Worker processes (default: INGEST_WORKERS)')
+        parser.add_argument('--batch-size', type=int, help='Events per bulk INSERT (default: IMPORT_BATCH_SIZE)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        capture_format = options['format'] or detect_format(path)
+        try:
+            if path == '-':
+                summary = ingest_capture(sys.stdin, capture_format, options['workers'], options['batch_size'])
+            else:
+                with open(path, encoding='utf-8', newline='') as capture:
+                    summary = ingest_capture(capture, capture_format, options['workers'], options['batch_size'])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(
+            f"Ingested {summary['events']} events for {summary['flights']} flights "
+            f"({summary['flights_created']} created) from {summary['rows']} rows in "
+            f"{summary['elapsed_seconds']:.2f}s with {summary['workers']} workers "
+            f"({summary['rows_per_second']} rows/s)"
+        )
+        for error in summary['errors']:
+            self.stderr.write(f"{error['flight_unique_id']}: {error['error']}")
+        if summary['errors']:
+            raise CommandError(f"{len(summary['errors'])} flights failed to ingest")
@@ -0,0 +1,137 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from event_manager.loadgen import PROFILES, LoadGenerator, LoadTestError, build_profile, load_streams
+from event_manager.models import Flight
+from event_manager.sessions import resolve_flights
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay the stored events of many flights at a target aggregate rate (constant, ramp or step profile) "
+        "and report the achieved rate and callback latency percentiles. Sends are scheduled open loop, so a slow "
+        "callback target raises latency instead of lowering the offered load. Events are not marked played."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('flights', nargs='*', help='Flight unique ids')
+        parser.add_argument('--all', action='store_true', help='Use every flight that has a mock configuration')
+        parser.add_argument('--profile', choices=PROFILES, default='constant', help='Rate profile (default: constant)')
+        parser.add_argument('--rate', type=float, help='Events per second for the constant profile')
+        parser.add_argument('--start-rate', type=float, help='Events per second at the start of a ramp')
+        parser.add_argument('--end-rate', type=float, help='Events per second at the end of a ramp')
+        parser.add_argument('--steps', help='Comma-separated events per second of each step, e.g. 100,250,500')
+        parser.add_argument('--duration', type=float, help='Seconds the constant or ramp profile runs for')
+        parser.add_argument('--step-duration', type=float, help='Seconds each step runs for')
+        parser.add_argument('--concurrency', type=int,
+                            help='Callbacks that can be in flight at once (default: LOADGEN_MAX_CONCURRENCY)')
+        parser.add_argument('--url', help="Send every callback here instead of each flight's callback URL")
+        parser.add_argument('--loop', action='store_true',
+                            help="Start a flight's events over once they run out instead of ending the run")
+        parser.add_argument('--timeout', type=float, help='Callback timeout in seconds (default: API_TIMEOUT_MS)')
+        parser.add_argument('--bucket', type=float, default=10, help='Seconds per timeline row of the report (default: 10)')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between progress lines (default: 5)')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            flights = list(Flight.objects.filter(mockconfiguration__isnull=False).distinct().order_by('flight_unique_id'))
+        elif options['flights']:
+            flights, missing = resolve_flights(options['flights'])
+            if missing:
+                raise CommandError(f"Unknown flights: {', '.join(missing)}")
+        else:
+            raise CommandError('Give flight unique ids or --all')
+        if not flights:
+            raise CommandError('No flights to replay')
+
+        try:
+            steps = [float(step) for step in options['steps'].split(',')] if options['steps'] else None
+        except ValueError:
+            raise CommandError(f"Invalid --steps: {options['steps']}")
+        if options['bucket'] <= 0:
+            raise CommandError('--bucket must be positive')
+
+        try:
+            profile = build_profile(
+                options['profile'],
+                rate=options['rate'],
+                start_rate=options['start_rate'],
+                end_rate=options['end_rate'],
+                duration=options['duration'],
+                steps=steps,
+                step_duration=options['step_duration'],
+            )
+            streams = load_streams(flights, url=options['url'])
+        except LoadTestError as e:
+            raise CommandError(str(e))
+
+        events = sum(len(stream) for stream in streams)
+        self.stdout.write(
+            f"{profile.describe()}: {profile.total_events} events planned from {events} stored events "
+            f"of {len(streams)} flights"
+        )
+        if events < profile.total_events and not options['loop']:
+            self.stderr.write('Fewer stored events than planned; the run ends when they run out (use --loop to repeat them)')
+
+        generator = LoadGenerator(
+            profile,
+            streams,
+            concurrency=options['concurrency'],
+            timeout=options['timeout'],
+            loop=options['loop'],
+            bucket_seconds=options['bucket'],
+        )
+        report = generator.run(progress=self._progress, interval=options['interval'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self._print_report(report)
+        if report['concurrency_limited']:
+            self.stderr.write(self.style.WARNING(
+                f"Concurrency cap hit: {report['concurrency_limited']} sends waited for a free sender thread, so the "
+                f"run was not open loop and offered {report['offered_rate']} of {report['target_rate']} events/s. "
+                f"Raise --concurrency and run again."
+            ))
+        if report['interrupted']:
+            self.stderr.write('Interrupted; the report covers the events dispatched so far')
+
+    def _progress(self, values):
+        self.stdout.write(
+            f"{values['elapsed_seconds']}s: {values['completed']}/{values['dispatched']} completed, "
+            f"{values['in_flight']} in flight, {values['waiting']} waiting for a sender, {values['failed']} failed, "
+            f"p50 {values['p50_ms']} ms p99 {values['p99_ms']} ms"
+        )
+
+    def _print_report(self, report):
+        self.stdout.write('')
+        self.stdout.write(f"{'second':>8} {'target/s':>10} {'offered/s':>10} {'achieved/s':>11} {'failed':>7} {'p50 ms':>9} {'p99 ms':>9}")
+        for row in report['timeline']:
+            self.stdout.write(
+                f"{row['start_second']:>8g} {row['target_rate']:>10g} {row['offered_rate']:>10g} {row['achieved_rate']:>11g} "
+                f"{row['failed']:>7} {row['p50_ms']:>9g} {row['p99_ms']:>9g}"
+            )
+        self.stdout.write('')
+        self.stdout.write(
+            f"Target {report['target_rate']} events/s, offered {report['offered_rate']} events/s, "
+            f"achieved {report['achieved_rate']} events/s"
+        )
+        self.stdout.write(
+            f"{report['succeeded']} succeeded, {report['failed']} failed, {report['cancelled']} cancelled "
+            f"of {report['dispatched']} dispatched in {report['elapsed_seconds']}s"
+        )
+        for error, count in report['errors'].items():
+            self.stdout.write(f"  {error}: {count}")
+        for label in ('latency_ms', 'schedule_lag_ms', 'service_ms'):
+            values = report[label]
+            self.stdout.write(
+                f"{label[:-3].replace('_', ' '):>12}: p50 {values['p50']} p90 {values['p90']} p95 {values['p95']} "
+                f"p99 {values['p99']} max {values['max']} ms"
+            )
+        self.stdout.write(
+            f"Max in flight {report['max_in_flight']} of {report['concurrency']}, "
+            f"{report['concurrency_limited']} sends held back by the cap, "
+            f"max dispatch lag {report['max_dispatch_lag_ms']} ms"
+        )
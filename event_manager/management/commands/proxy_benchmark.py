@@ -0,0 +1,204 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient
+from django.urls import reverse
+
+from event_manager import http_client
+from event_manager.loadgen import latency_summary
+
+
+class SlowStub:
+    """Local HTTP/1.1 server answering every POST with a small JSON body after a fixed delay."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.port = None
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='slow-stub', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        server = self._loop.run_until_complete(asyncio.start_server(self._serve, '127.0.0.1', 0, backlog=4096))
+        self.port = server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self._loop.run_forever()
+        server.close()
+        # End the kept-alive connections still waiting for a request
+        tasks = asyncio.all_tasks(self._loop)
+        for task in tasks:
+            task.cancel()
+        self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self._loop.close()
+
+    async def _serve(self, reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                length = 0
+                for line in head.split(b'\r\n'):
+                    name, _, value = line.partition(b':')
+                    if name.strip().lower() == b'content-length':
+                        length = int(value)
+                await reader.readexactly(length)
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+                await asyncio.sleep(self.delay)
+                self.in_flight -= 1
+                body = b'{"ok": true}'
+                writer.write(
+                    b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                    b'Content-Length: ' + str(len(body)).encode() + b'\r\n\r\n' + body
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Send many concurrent requests through the proxy or transform endpoint to a local stub that answers slowly, "
+        "and report throughput, latency percentiles and the peak thread count of this process. The requests go "
+        "through Django's ASGI handler in this process; --sync-threads adds a baseline of the same calls made with "
+        "the blocking client from a thread pool of that size, like sync views on a threaded worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoint', choices=('proxy', 'transform'), default='proxy', help='Endpoint to call (default: proxy)')
+        parser.add_argument('--requests', type=int, default=500, help='Requests to send (default: 500)')
+        parser.add_argument('--concurrency', type=int, default=200, help='Requests in flight at once (default: 200)')
+        parser.add_argument('--delay', type=float, default=1.0, help='Seconds the stub waits before answering (default: 1)')
+        parser.add_argument('--sync-threads', type=int, help='Also run the blocking baseline with this many threads')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests and --concurrency must be positive')
+        if options['delay'] < 0:
+            raise CommandError('--delay must not be negative')
+
+        stub = SlowStub(options['delay']).start()
+        try:
+            base_url = f'http://127.0.0.1:{stub.port}'
+            report = {
+                'endpoint': options['endpoint'],
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'delay_seconds': options['delay'],
+                'async': self._measure(stub, lambda: asyncio.run(self._run_async(options, base_url))),
+            }
+            if options['sync_threads']:
+                report['sync'] = self._measure(stub, lambda: self._run_sync(options, base_url))
+        finally:
+            stub.stop()
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write(
+            f"{report['requests']} {report['endpoint']} requests, {report['concurrency']} at once, "
+            f"stub delay {report['delay_seconds']}s"
+        )
+        for mode in ('async', 'sync'):
+            if mode not in report:
+                continue
+            result = report[mode]
+            latency = result['latency_ms']
+            self.stdout.write(
+                f"{mode:>6}: {result['elapsed_seconds']}s, {result['requests_per_second']} requests/s, "
+                f"{result['failed']} failed, p50 {latency['p50']} p99 {latency['p99']} max {latency['max']} ms, "
+                f"peak {result['max_threads']} threads, stub saw {result['stub_max_in_flight']} at once"
+            )
+
+    def _measure(self, stub, run):
+        stub.max_in_flight = 0
+        peak = {'threads': threading.active_count()}
+        done = threading.Event()
+
+        def watch():
+            while not done.wait(0.01):
+                peak['threads'] = max(peak['threads'], threading.active_count())
+
+        watcher = threading.Thread(target=watch, daemon=True)
+        watcher.start()
+        started = time.perf_counter()
+        try:
+            latencies, failed = run()
+        finally:
+            elapsed = time.perf_counter() - started
+            done.set()
+            watcher.join()
+        return {
+            'elapsed_seconds': round(elapsed, 3),
+            'requests_per_second': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+            'failed': failed,
+            'latency_ms': latency_summary(latencies),
+            # Not counting the watcher thread itself
+            'max_threads': peak['threads'] - 1,
+            'stub_max_in_flight': stub.max_in_flight,
+        }
+
+    def _request_body(self, options, base_url):
+        event = {'benchmark': True}
+        if options['endpoint'] == 'transform':
+            return reverse('transform-payload'), {'raw_event': event, 'host_address': base_url}
+        return reverse('proxy-api-request'), {'payload': event, 'url': f'{base_url}/benchmark'}
+
+    async def _run_async(self, options, base_url):
+        path, body = self._request_body(options, base_url)
+        client = AsyncClient()
+        slots = asyncio.Semaphore(options['concurrency'])
+        latencies = []
+        failed = 0
+
+        async def send():
+            nonlocal failed
+            async with slots:
+                started = time.perf_counter()
+                response = await client.post(path, data=json.dumps(body), content_type='application/json')
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    failed += 1
+
+        try:
+            await asyncio.gather(*(send() for _ in range(options['requests'])))
+        finally:
+            # The views' session belongs to this loop, which ends here
+            await http_client.aclose_async_session()
+        return latencies, failed
+
+    def _run_sync(self, options, base_url):
+        _, body = self._request_body(options, base_url)
+        url = body.get('url') or f"{base_url}/nav/v1/internal/create-flight-detail-dto-v2"
+        payload = body.get('payload') or body['raw_event']
+        session = http_client.build_session(pool_connections=1, pool_maxsize=options['sync_threads'])
+
+        def send(_):
+            started = time.perf_counter()
+            try:
+                session.post(url, json=payload, timeout=http_client.get_timeout(15)).raise_for_status()
+                return time.perf_counter() - started, False
+            except Exception:
+                return time.perf_counter() - started, True
+
+        with ThreadPoolExecutor(max_workers=options['sync_threads']) as executor:
+            results = list(executor.map(send, range(options['requests'])))
+        return [seconds for seconds, _ in results], sum(failed for _, failed in results)
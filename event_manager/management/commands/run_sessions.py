@@ -0,0 +1,85 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from event_manager.models import Flight, PlaybackSession
+from event_manager.playback import abort_playback, configure_engine, summarize_sessions
+from event_manager.sessions import resolve_flights, start_sessions
+
+
+class Command(BaseCommand):
+    help = (
+        "Start mock sessions for many flights at once and wait for them to finish, printing combined "
+        "progress and callback latency. Playback runs in this process, so keep it running until done; "
+        "Ctrl-C aborts every session it started."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('flights', nargs='*', help='Flight unique ids')
+        parser.add_argument('--all', action='store_true', help='Start every flight that has a mock configuration')
+        parser.add_argument('--no-reset', action='store_true',
+                            help='Skip cleanup, unplayed reset and additional tasks before starting')
+        parser.add_argument('--workers', type=int,
+                            help='Playback threads shared by all sessions (default: PLAYBACK_MAX_WORKERS)')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between progress lines (default: 5)')
+        parser.add_argument('--json', action='store_true', help='Print the final summary as JSON')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            flights = list(Flight.objects.filter(mockconfiguration__isnull=False).distinct().order_by('flight_unique_id'))
+        elif options['flights']:
+            flights, missing = resolve_flights(options['flights'])
+            if missing:
+                raise CommandError(f"Unknown flights: {', '.join(missing)}")
+        else:
+            raise CommandError('Give flight unique ids or --all')
+        if not flights:
+            raise CommandError('No flights to start')
+
+        if options['workers']:
+            configure_engine(options['workers'])
+
+        results = start_sessions(flights, reset=not options['no_reset'])
+        for result in results:
+            if result['status'] == 'failed':
+                self.stderr.write(f"{result['flight']}: {result['error']}")
+        started = [flight for flight, result in zip(flights, results) if result['status'] == 'started']
+        self.stdout.write(f"Started {len(started)} of {len(flights)} mock sessions")
+        if not started:
+            raise CommandError('No mock session could be started')
+
+        sessions = PlaybackSession.objects.filter(flight__in=started)
+        try:
+            while True:
+                time.sleep(options['interval'])
+                summary = summarize_sessions(sessions)
+                self.stdout.write(
+                    f"{summary['played_events']}/{summary['total_events']} events ({summary['progress_percent']}%), "
+                    f"{summary['by_status']}, {summary['events_per_second']} events/s, "
+                    f"callback avg {summary['avg_callback_ms']} ms max {summary['max_callback_ms']} ms"
+                )
+                if not summary['by_status'].get('running') and not summary['by_status'].get('paused'):
+                    break
+        except KeyboardInterrupt:
+            for flight in started:
+                abort_playback(flight)
+            self.stderr.write('Aborted all sessions')
+            summary = summarize_sessions(sessions)
+
+        if options['json']:
+            self.stdout.write(json.dumps(summary, indent=2, default=str))
+        else:
+            for flight in summary['flights']:
+                error = f" - {flight['last_error']}" if flight['last_error'] else ''
+                self.stdout.write(
+                    f"{flight['flight']}: {flight['status']}, {flight['played_events']}/{flight['total_events']} events, "
+                    f"callback avg {flight['avg_callback_ms']} ms{error}"
+                )
+            self.stdout.write(
+                f"{summary['sessions']} sessions, {summary['events_sent']} events in {summary['elapsed_seconds']}s "
+                f"({summary['events_per_second']} events/s), callback avg {summary['avg_callback_ms']} ms "
+                f"max {summary['max_callback_ms']} ms"
+            )
+        if summary['by_status'].get('failed'):
+            raise CommandError(f"{summary['by_status']['failed']} sessions failed")
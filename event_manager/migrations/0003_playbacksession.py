@@ -0,0 +1,28 @@
+# Generated by Django 4.2.20 on 2026-10-18 13:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('event_manager', '0002_mockconfiguration_db_host_mockconfiguration_db_name_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlaybackSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('idle', 'Idle'), ('running', 'Running'), ('paused', 'Paused'), ('completed', 'Completed'), ('aborted', 'Aborted'), ('failed', 'Failed')], default='idle', max_length=20)),
+                ('run_token', models.CharField(blank=True, help_text='Identifies the engine run that owns this session', max_length=32)),
+                ('events_sent', models.IntegerField(default=0)),
+                ('last_priority', models.IntegerField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('flight', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='playback_session', to='event_manager.flight')),
+            ],
+        ),
+    ]
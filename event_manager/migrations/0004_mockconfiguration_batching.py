@@ -0,0 +1,23 @@
+# Generated by Django 4.2.20 on 2026-10-18 13:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('event_manager', '0003_playbacksession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mockconfiguration',
+            name='batch_size',
+            field=models.PositiveIntegerField(default=1, help_text='Maximum number of events sent in one callback during playback'),
+        ),
+        migrations.AddField(
+            model_name='mockconfiguration',
+            name='batch_window',
+            field=models.FloatField(blank=True, help_text='Seconds; when set, coalesce all events due within this window of the first one instead of using batch_size', null=True),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.20 on 2026-10-18 13:13
+
+import json
+
+from django.db import migrations, models
+
+
+def parse_raw_events(apps, schema_editor):
+    FlightEvent = apps.get_model('event_manager', 'FlightEvent')
+    batch = []
+    for event in FlightEvent.objects.only('id', 'raw_event').iterator(chunk_size=2000):
+        try:
+            event.event_data = json.loads(event.raw_event)
+        except json.JSONDecodeError:
+            # Leave invalid rows unparsed; they are still reported when played
+            continue
+        batch.append(event)
+        if len(batch) >= 2000:
+            FlightEvent.objects.bulk_update(batch, ['event_data'])
+            batch = []
+    if batch:
+        FlightEvent.objects.bulk_update(batch, ['event_data'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('event_manager', '0004_mockconfiguration_batching'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flightevent',
+            name='event_data',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.RunPython(parse_raw_events, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 4.2.20 on 2026-10-18 13:14
+
+import re
+from datetime import datetime
+
+from django.db import migrations, models
+
+
+def parse_flight_unique_id(flight_unique_id):
+    """
+    Copy of event_manager.models.parse_flight_unique_id as of this migration, so later
+    changes to the model helper cannot change what this data migration writes.
+    """
+    tokens = [token for token in re.split(r'[^A-Za-z0-9]+', flight_unique_id or '') if token]
+    flight_date = None
+    others = []
+    for token in tokens:
+        if flight_date is None and len(token) == 8 and token.isdigit():
+            try:
+                flight_date = datetime.strptime(token, '%d%m%Y').date()
+                continue
+            except ValueError:
+                pass
+        others.append(token)
+
+    flight_number = next(
+        (token for token in others if re.search(r'[A-Za-z]', token) and re.search(r'\d', token)),
+        others[0] if others else ''
+    )
+    return flight_number.upper(), flight_date
+
+
+def populate_lookup_columns(apps, schema_editor):
+    Flight = apps.get_model('event_manager', 'Flight')
+    FlightEvent = apps.get_model('event_manager', 'FlightEvent')
+
+    flights = list(Flight.objects.only('id', 'flight_unique_id'))
+    for flight in flights:
+        flight.flight_number, flight.flight_date = parse_flight_unique_id(flight.flight_unique_id)
+    Flight.objects.bulk_update(flights, ['flight_number', 'flight_date'], batch_size=1000)
+
+    FlightEvent.objects.filter(identified_changes__icontains='FIRST_NAV_TRACKING').update(is_first_nav_tracking=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('event_manager', '0005_flightevent_event_data'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flight',
+            name='flight_date',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='flight',
+            name='flight_number',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='flightevent',
+            name='is_first_nav_tracking',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['flight_number', 'flight_date'], name='flight_number_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flightevent',
+            index=models.Index(condition=models.Q(('is_first_nav_tracking', True)), fields=['flight', 'priority'], name='event_first_nav_tracking_idx'),
+        ),
+        migrations.RunPython(populate_lookup_columns, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.2.20 on 2026-10-18 13:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_fid_pointers(apps, schema_editor):
+    Flight = apps.get_model('event_manager', 'Flight')
+    FlightEvent = apps.get_model('event_manager', 'FlightEvent')
+
+    batch = []
+    for event in FlightEvent.objects.only('id', 'event_data').iterator(chunk_size=2000):
+        if isinstance(event.event_data, dict) and 'fid' in event.event_data:
+            event.has_fid = True
+            batch.append(event)
+        if len(batch) >= 2000:
+            FlightEvent.objects.bulk_update(batch, ['has_fid'])
+            batch = []
+    if batch:
+        FlightEvent.objects.bulk_update(batch, ['has_fid'])
+
+    for flight in Flight.objects.only('id'):
+        event = FlightEvent.objects.filter(flight=flight, has_fid=True).order_by('priority', 'created_at').first()
+        if event is not None:
+            fid = event.event_data['fid']
+            Flight.objects.filter(pk=flight.pk).update(fid_event=event, fid=str(fid) if fid is not None else '')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('event_manager', '0006_indexed_flight_lookup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flight',
+            name='fid',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='flight',
+            name='fid_event',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='event_manager.flightevent'),
+        ),
+        migrations.AddField(
+            model_name='flightevent',
+            name='has_fid',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='flightevent',
+            index=models.Index(condition=models.Q(('has_fid', True)), fields=['flight', 'priority'], name='event_has_fid_idx'),
+        ),
+        migrations.RunPython(populate_fid_pointers, migrations.RunPython.noop),
+    ]
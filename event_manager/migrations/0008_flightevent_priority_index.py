@@ -0,0 +1,17 @@
+# Generated by Django 4.2.20 on 2026-10-18 13:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('event_manager', '0007_fid_pointer'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='flightevent',
+            index=models.Index(fields=['flight', 'priority', 'id'], name='event_flight_priority_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.20 on 2026-10-18 13:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('event_manager', '0008_flightevent_priority_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mockconfiguration',
+            name='reset_strategy',
+            field=models.CharField(choices=[('query', 'Cleanup query'), ('snapshot', 'Restore snapshot')], default='query', help_text='How the cleanup database is reset when a session starts, resets or aborts', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='mockconfiguration',
+            name='snapshot_captured_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='mockconfiguration',
+            name='snapshot_tables',
+            field=models.TextField(blank=True, help_text='Tables restored by the snapshot strategy, comma- or newline-separated, parents before children'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.20 on 2026-10-18 13:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('event_manager', '0009_mockconfiguration_snapshot_reset'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='playbacksession',
+            name='callback_seconds',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='playbacksession',
+            name='callbacks',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='playbacksession',
+            name='max_callback_seconds',
+            field=models.FloatField(default=0),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.20 on 2026-10-18 13:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('event_manager', '0010_playbacksession_callback_latency'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flightevent',
+            name='ingestion_time',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='mockconfiguration',
+            name='replay_timing',
+            field=models.CharField(choices=[('fixed', 'Fixed delay'), ('recorded', 'Recorded timing')], default='fixed', help_text='Wait delay_between_events between events, or reproduce the gaps between their ingestion times', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='mockconfiguration',
+            name='speed_factor',
+            field=models.FloatField(default=1.0, help_text='Recorded timing only: replay this many times faster than the capture'),
+        ),
+        migrations.AddField(
+            model_name='playbacksession',
+            name='max_lag_seconds',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='playbacksession',
+            name='timing_anchor_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='playbacksession',
+            name='timing_anchor_time',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.20 on 2026-10-18 13:48
+
+from django.db import migrations, models
+
+
+def populate_cursors(apps, schema_editor):
+    FlightEvent = apps.get_model('event_manager', 'FlightEvent')
+    PlaybackSession = apps.get_model('event_manager', 'PlaybackSession')
+
+    rows = (
+        FlightEvent.objects.values('flight_id')
+        .annotate(
+            min_priority=models.Min('priority'),
+            max_priority=models.Max('priority'),
+            played_priority=models.Max('priority', filter=models.Q(is_played=True)),
+        )
+        .order_by()
+    )
+    for row in rows:
+        PlaybackSession.objects.update_or_create(
+            flight_id=row['flight_id'],
+            defaults={
+                'min_priority': row['min_priority'],
+                'max_priority': row['max_priority'],
+                'last_priority': row['played_priority'],
+            }
+        )
+
+
+def populate_is_played(apps, schema_editor):
+    FlightEvent = apps.get_model('event_manager', 'FlightEvent')
+    PlaybackSession = apps.get_model('event_manager', 'PlaybackSession')
+
+    for session in PlaybackSession.objects.filter(last_priority__isnull=False):
+        FlightEvent.objects.filter(flight_id=session.flight_id, priority__lte=session.last_priority).update(is_played=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('event_manager', '0011_recorded_timing_replay'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='playbacksession',
+            name='max_priority',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='playbacksession',
+            name='min_priority',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(populate_cursors, populate_is_played),
+        migrations.RemoveField(
+            model_name='flightevent',
+            name='is_played',
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.20 on 2026-10-18 13:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('event_manager', '0012_playback_cursor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlayRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('manual', 'Manual play'), ('playback', 'Server-side playback')], max_length=20)),
+                ('run_token', models.CharField(blank=True, max_length=32)),
+                ('event_id', models.IntegerField(blank=True, null=True)),
+                ('event_priority', models.IntegerField(blank=True, null=True)),
+                ('events', models.IntegerField(default=1)),
+                ('sent_at', models.DateTimeField()),
+                ('latency_seconds', models.FloatField()),
+                ('status_code', models.IntegerField(blank=True, null=True)),
+                ('payload_bytes', models.IntegerField(default=0)),
+                ('response_bytes', models.IntegerField(blank=True, null=True)),
+                ('response_digest', models.CharField(blank=True, max_length=64)),
+                ('error', models.TextField(blank=True)),
+                ('flight', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='play_records', to='event_manager.flight')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['flight', 'sent_at'], name='event_manag_flight__d9b248_idx'), models.Index(fields=['run_token', 'sent_at'], name='event_manag_run_tok_e7e8cd_idx')],
+            },
+        ),
+    ]
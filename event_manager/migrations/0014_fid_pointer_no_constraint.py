@@ -0,0 +1,19 @@
+# Generated by Django 4.2.20 on 2026-10-18 14:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('event_manager', '0013_play_history'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='flight',
+            name='fid_event',
+            field=models.ForeignKey(blank=True, db_constraint=False, editable=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='event_manager.flightevent'),
+        ),
+    ]
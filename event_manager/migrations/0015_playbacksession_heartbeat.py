@@ -0,0 +1,18 @@
+# Generated by Django 4.2.20 on 2026-10-18 14:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('event_manager', '0014_fid_pointer_no_constraint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='playbacksession',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,30 +1,176 @@
+import json
+import re
+from datetime import datetime, timedelta
+from django.conf import settings
 from django.db import models
 from django.utils import timezone
 
+def parse_flight_unique_id(flight_unique_id):
+    """
+    Split a flight unique id such as 'AI101_05042025' into (flight number, flight date).
+    The date is the first 8-digit ddMMyyyy token; the flight number is the first other
+    token that mixes letters and digits, else the first other token.
+    """
+    tokens = [token for token in re.split(r'[^A-Za-z0-9]+', flight_unique_id or '') if token]
+    flight_date = None
+    others = []
+    for token in tokens:
+        if flight_date is None and len(token) == 8 and token.isdigit():
+            try:
+                flight_date = datetime.strptime(token, '%d%m%Y').date()
+                continue
+            except ValueError:
+                pass
+        others.append(token)
+
+    flight_number = next(
+        (token for token in others if re.search(r'[A-Za-z]', token) and re.search(r'\d', token)),
+        others[0] if others else ''
+    )
+    return flight_number.upper(), flight_date
+
+# Event priorities are spaced this far apart so an insert can take a free value between
+# two neighbours instead of shifting every later event
+PRIORITY_GAP = 1000
+
 class Flight(models.Model):
     flight_unique_id = models.CharField(max_length=100, unique=True)
+    flight_number = models.CharField(max_length=100, blank=True, editable=False)  # Extracted from flight_unique_id
+    flight_date = models.DateField(null=True, blank=True, editable=False)  # Extracted from flight_unique_id
+    fid_event = models.ForeignKey('FlightEvent', null=True, blank=True, editable=False, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')  # First event carrying an fid; kept current by refresh_fid_pointer() so event deletes stay fast
+    fid = models.CharField(max_length=255, blank=True, editable=False)  # fid value of fid_event
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['flight_number', 'flight_date'], name='flight_number_date_idx'),
+        ]
+
     def __str__(self):
         return self.flight_unique_id
 
+    def refresh_fid_pointer(self):
+        """Point fid_event at the first event (by priority) whose raw_event has an fid. Call after event writes."""
+        event = self.events.filter(has_fid=True).order_by('priority', 'created_at').first()
+        self.fid_event = event
+        self.fid = str(event.event_data['fid']) if event is not None and event.event_data['fid'] is not None else ''
+        # Queryset update: no updated_at bump and no post_save cache invalidation for a derived column
+        Flight.objects.filter(pk=self.pk).update(fid_event=self.fid_event, fid=self.fid)
+
+    def allocate_priority(self, requested=0):
+        """
+        Priority for a new event. 0 appends after the last event, a free priority is used
+        as-is, and a taken priority places the new event right before the event holding it.
+        Call inside a transaction that holds this flight's row lock.
+        """
+        if not requested:
+            max_priority = self.events.aggregate(models.Max('priority'))['priority__max']
+            return (max_priority or 0) + PRIORITY_GAP
+
+        holder = self.events.filter(priority=requested).order_by('created_at').first()
+        if holder is None:
+            return requested
+
+        previous = self.events.filter(priority__lt=requested).aggregate(models.Max('priority'))['priority__max'] or 0
+        if requested - previous < 2:
+            # No free value left before the holder; respace the flight once and retry
+            self.renumber_priorities()
+            holder.refresh_from_db(fields=['priority'])
+            requested = holder.priority
+            previous = requested - PRIORITY_GAP
+        return (previous + requested) // 2
+
+    def renumber_priorities(self):
+        """Respace event priorities to multiples of PRIORITY_GAP, keeping their order."""
+        events = list(self.events.order_by('priority', 'created_at').only('id', 'priority'))
+        renumbered = {}
+        changed = []
+        for index, event in enumerate(events, start=1):
+            renumbered[event.priority] = index * PRIORITY_GAP
+            if event.priority != index * PRIORITY_GAP:
+                event.priority = index * PRIORITY_GAP
+                changed.append(event)
+        FlightEvent.objects.bulk_update(changed, ['priority'], batch_size=1000)
+
+        # Keep the playback cursor after the same event
+        session = PlaybackSession.objects.filter(flight=self, last_priority__isnull=False).first()
+        if session is not None:
+            played = [new for old, new in renumbered.items() if old <= session.last_priority]
+            PlaybackSession.objects.filter(pk=session.pk).update(last_priority=max(played, default=None))
+
+    def refresh_priority_bounds(self):
+        """Store the lowest and highest event priority on the playback session. Call after event writes."""
+        bounds = self.events.aggregate(min_priority=models.Min('priority'), max_priority=models.Max('priority'))
+        PlaybackSession.objects.update_or_create(flight=self, defaults=bounds)
+
+    def save(self, *args, **kwargs):
+        self.flight_number, self.flight_date = parse_flight_unique_id(self.flight_unique_id)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'flight_number', 'flight_date'}
+        super().save(*args, **kwargs)
+
 class FlightEvent(models.Model):
     flight = models.ForeignKey(Flight, on_delete=models.CASCADE, related_name='events')
     raw_event = models.TextField()  # Store the complete raw event
+    event_data = models.JSONField(null=True, blank=True)  # raw_event parsed once at write time
     flight_state = models.CharField(max_length=50)
     priority = models.IntegerField()
     identified_changes = models.TextField(blank=True)
-    is_played = models.BooleanField(default=False)
+    is_first_nav_tracking = models.BooleanField(default=False, editable=False)  # identified_changes mentions FIRST_NAV_TRACKING
+    has_fid = models.BooleanField(default=False, editable=False)  # event_data is an object with an fid key
+    ingestion_time = models.DateTimeField(null=True, blank=True)  # When the event was captured; set by imports, drives recorded-timing replay
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['priority', 'created_at']
+        indexes = [
+            models.Index(fields=['flight', 'priority', 'id'], name='event_flight_priority_idx'),
+            models.Index(
+                fields=['flight', 'priority'],
+                condition=models.Q(is_first_nav_tracking=True),
+                name='event_first_nav_tracking_idx',
+            ),
+            models.Index(
+                fields=['flight', 'priority'],
+                condition=models.Q(has_fid=True),
+                name='event_has_fid_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.flight.flight_unique_id} - {self.flight_state} - Priority: {self.priority}"
 
+    def parse_raw_event(self):
+        """Parse raw_event into event_data. Raises json.JSONDecodeError for invalid JSON."""
+        self.event_data = json.loads(self.raw_event)
+
+    def populate_derived_fields(self):
+        """Fill the columns derived from raw_event and identified_changes. Use before bulk_create."""
+        self.parse_raw_event()
+        self.is_first_nav_tracking = 'FIRST_NAV_TRACKING' in (self.identified_changes or '').upper()
+        self.has_fid = isinstance(self.event_data, dict) and 'fid' in self.event_data
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            self.populate_derived_fields()
+        elif {'raw_event', 'identified_changes'} & set(update_fields):
+            self.populate_derived_fields()
+            kwargs['update_fields'] = set(update_fields) | {'event_data', 'is_first_nav_tracking', 'has_fid'}
+        super().save(*args, **kwargs)
+
 class MockConfiguration(models.Model):
+    RESET_STRATEGIES = [
+        ('query', 'Cleanup query'),
+        ('snapshot', 'Restore snapshot'),
+    ]
+    REPLAY_TIMINGS = [
+        ('fixed', 'Fixed delay'),
+        ('recorded', 'Recorded timing'),
+    ]
+
     flight = models.ForeignKey(Flight, on_delete=models.CASCADE)
     delay_between_events = models.IntegerField(default=5)  # seconds
     fast_forward = models.BooleanField(default=False)
@@ -38,6 +184,13 @@ class MockConfiguration(models.Model):
     db_name = models.CharField(max_length=255, blank=True, help_text="Database name")
     db_user = models.CharField(max_length=255, blank=True, help_text="Database username")
     db_password = models.CharField(max_length=255, blank=True, help_text="Database password")
+    reset_strategy = models.CharField(max_length=20, choices=RESET_STRATEGIES, default='query', help_text="How the cleanup database is reset when a session starts, resets or aborts")
+    snapshot_tables = models.TextField(blank=True, help_text="Tables restored by the snapshot strategy, comma- or newline-separated, parents before children")
+    snapshot_captured_at = models.DateTimeField(null=True, blank=True, editable=False)  # When the baseline of snapshot_tables was captured
+    batch_size = models.PositiveIntegerField(default=1, help_text="Maximum number of events sent in one callback during playback")
+    batch_window = models.FloatField(null=True, blank=True, help_text="Seconds; when set, coalesce all events due within this window of the first one instead of using batch_size")
+    replay_timing = models.CharField(max_length=20, choices=REPLAY_TIMINGS, default='fixed', help_text="Wait delay_between_events between events, or reproduce the gaps between their ingestion times")
+    speed_factor = models.FloatField(default=1.0, help_text="Recorded timing only: replay this many times faster than the capture")
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -62,3 +215,85 @@ class AdditionalTask(models.Model):
 
     def __str__(self):
         return f"{self.name} ({self.task_type})"
+
+class PlaybackSession(models.Model):
+    STATUS_CHOICES = [
+        ('idle', 'Idle'),
+        ('running', 'Running'),
+        ('paused', 'Paused'),
+        ('completed', 'Completed'),
+        ('aborted', 'Aborted'),
+        ('failed', 'Failed'),
+    ]
+
+    flight = models.OneToOneField(Flight, on_delete=models.CASCADE, related_name='playback_session')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='idle')
+    run_token = models.CharField(max_length=32, blank=True, help_text="Identifies the engine run that owns this session")
+    events_sent = models.IntegerField(default=0)
+    last_priority = models.IntegerField(null=True, blank=True)  # Playback cursor: events at or below this priority count as played
+    min_priority = models.IntegerField(null=True, blank=True)  # Lowest event priority of the flight, kept current on event writes
+    max_priority = models.IntegerField(null=True, blank=True)  # Highest event priority of the flight
+    callbacks = models.IntegerField(default=0)  # Callbacks sent by the current run
+    callback_seconds = models.FloatField(default=0)  # Total time spent waiting for those callbacks
+    max_callback_seconds = models.FloatField(default=0)  # Slowest callback of the current run
+    timing_anchor_at = models.DateTimeField(null=True, blank=True)  # Recorded timing: when the anchor event was due in this run
+    timing_anchor_time = models.DateTimeField(null=True, blank=True)  # Recorded timing: ingestion time of the anchor event
+    max_lag_seconds = models.FloatField(default=0)  # Recorded timing: furthest a step started behind its scheduled time
+    heartbeat_at = models.DateTimeField(null=True, blank=True)  # Refreshed by the worker process running this session
+    last_error = models.TextField(blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Playback for {self.flight.flight_unique_id} ({self.status})"
+
+    @staticmethod
+    def stale_before():
+        # Get the heartbeat timeout from settings or use default
+        return timezone.now() - timedelta(seconds=getattr(settings, 'PLAYBACK_STALE_SECONDS', 60))
+
+    @staticmethod
+    def heartbeat_expired(status, heartbeat_at):
+        """Whether a session is 'running' without a worker process behind it, e.g. one that died or restarted."""
+        return status == 'running' and (heartbeat_at is None or heartbeat_at < PlaybackSession.stale_before())
+
+    @classmethod
+    def pause_stale(cls, **filters):
+        """Pause the stale running sessions matching filters so they can be resumed. Returns how many were paused."""
+        stale = models.Q(heartbeat_at__isnull=True) | models.Q(heartbeat_at__lt=cls.stale_before())
+        return cls.objects.filter(stale, status='running', **filters).update(
+            status='paused',
+            run_token='',
+            last_error='Playback stopped because its worker process stopped; resume to continue',
+            updated_at=timezone.now()
+        )
+
+class PlayRecord(models.Model):
+    """One callback sent for a flight's events. Rows are only ever added, in batches (see event_manager.history)."""
+    SOURCE_CHOICES = [
+        ('manual', 'Manual play'),
+        ('playback', 'Server-side playback'),
+    ]
+
+    flight = models.ForeignKey(Flight, on_delete=models.CASCADE, related_name='play_records')
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES)
+    run_token = models.CharField(max_length=32, blank=True)  # Playback run that sent the callback; blank for manual plays
+    event_id = models.IntegerField(null=True, blank=True)  # First event of the callback; kept as a plain id so event rewrites leave history alone
+    event_priority = models.IntegerField(null=True, blank=True)
+    events = models.IntegerField(default=1)  # Events sent in the callback
+    sent_at = models.DateTimeField()
+    latency_seconds = models.FloatField()  # Time from sending the callback to its response or error
+    status_code = models.IntegerField(null=True, blank=True)  # Empty when no response was received
+    payload_bytes = models.IntegerField(default=0)
+    response_bytes = models.IntegerField(null=True, blank=True)
+    response_digest = models.CharField(max_length=64, blank=True)  # SHA-256 of the response body
+    error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['flight', 'sent_at']),
+            models.Index(fields=['run_token', 'sent_at']),
+        ]
+
+    def __str__(self):
+        return f"Play of {self.flight.flight_unique_id} at {self.sent_at} ({self.status_code or 'no response'})"
@@ -0,0 +1,460 @@
+"""
+Server-side playback engine.
+
+Each worker process runs one scheduler thread that keeps a heap of
+(due time, flight) entries and hands due flights to a small thread pool,
+which sends exactly one event per step. Delays between events are handled
+by the scheduler, so no request thread ever sleeps.
+
+Session state is stored in PlaybackSession so that pause/resume/abort work
+whichever worker process receives the request. Every start or resume writes
+a fresh run_token; a run only keeps going while its token is still current.
+The engine refreshes heartbeat_at of the runs it owns every
+PLAYBACK_HEARTBEAT_SECONDS. A 'running' session whose heartbeat is older
+than PLAYBACK_STALE_SECONDS lost its worker process (it died or restarted
+mid-run) and is paused when it is next read, so it can be resumed.
+
+With recorded timing, events are due at their ingestion time relative to the
+first event of the run, divided by the speed factor. Each delay is computed
+from that absolute schedule rather than from the previous step, so time spent
+on callbacks and scheduler wake-ups does not add up over a long replay.
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db import close_old_connections, models, transaction
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from . import history, progress
+from .callbacks import build_callback_payload, send_callback
+from .models import FlightEvent, MockConfiguration, PlaybackSession
+
+logger = logging.getLogger(__name__)
+
+
+class PlaybackError(Exception):
+    """Raised when a playback control action is not allowed."""
+
+
+class PlaybackEngine:
+    def __init__(self, max_workers):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='playback')
+        self._queue = []  # heap of (due, sequence, flight_id, run_token)
+        self._runs = set()  # run tokens this process is playing, kept alive by the heartbeat
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._scheduler = None
+        self._heartbeat = None
+
+    def schedule(self, flight_id, run_token, delay=0):
+        with self._condition:
+            heapq.heappush(self._queue, (time.monotonic() + delay, next(self._sequence), flight_id, run_token))
+            self._runs.add(run_token)
+            if self._scheduler is None or not self._scheduler.is_alive():
+                self._scheduler = threading.Thread(
+                    target=self._run_scheduler, name='playback-scheduler', daemon=True
+                )
+                self._scheduler.start()
+            if self._heartbeat is None or not self._heartbeat.is_alive():
+                self._heartbeat = threading.Thread(
+                    target=self._run_heartbeat, name='playback-heartbeat', daemon=True
+                )
+                self._heartbeat.start()
+            self._condition.notify()
+
+    def _end_run(self, run_token):
+        with self._condition:
+            self._runs.discard(run_token)
+
+    def _run_heartbeat(self):
+        while True:
+            time.sleep(get_heartbeat_seconds())
+            with self._condition:
+                run_tokens = list(self._runs)
+            if not run_tokens:
+                continue
+            close_old_connections()
+            try:
+                PlaybackSession.objects.filter(run_token__in=run_tokens, status='running').update(heartbeat_at=timezone.now())
+            except Exception as e:
+                logger.error(f"Playback heartbeat failed: {str(e)}")
+            finally:
+                close_old_connections()
+
+    def _run_scheduler(self):
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._condition.wait()
+                due, _, flight_id, run_token = self._queue[0]
+                remaining = due - time.monotonic()
+                if remaining > 0:
+                    # Woken early by a new entry or timed out; re-check the heap head
+                    self._condition.wait(remaining)
+                    continue
+                heapq.heappop(self._queue)
+            self._executor.submit(self._step, flight_id, run_token)
+
+    def _step(self, flight_id, run_token):
+        close_old_connections()
+        try:
+            delay = play_next_event(flight_id, run_token)
+            if delay is not None:
+                self.schedule(flight_id, run_token, delay)
+            else:
+                self._end_run(run_token)
+        except Exception as e:
+            logger.error(f"Playback step failed for flight {flight_id}: {str(e)}", exc_info=True)
+            _finish_session(flight_id, run_token, 'failed', str(e))
+            self._end_run(run_token)
+        finally:
+            close_old_connections()
+            # Observers watching from this process get the step now instead of at their next poll
+            progress.notify(flight_id)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_heartbeat_seconds():
+    # Get heartbeat interval from settings or use default
+    return getattr(settings, 'PLAYBACK_HEARTBEAT_SECONDS', 15)
+
+def get_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = PlaybackEngine(max_workers=getattr(settings, 'PLAYBACK_MAX_WORKERS', 4))
+        return _engine
+
+def configure_engine(max_workers):
+    """Size this process's engine before its first playback (e.g. for a load test run)."""
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            raise PlaybackError('The playback engine of this process is already running')
+        _engine = PlaybackEngine(max_workers=max_workers)
+        return _engine
+
+def _finish_session(flight_id, run_token, status, error=''):
+    PlaybackSession.objects.filter(flight_id=flight_id, run_token=run_token).update(
+        status=status,
+        last_error=error,
+        updated_at=timezone.now()
+    )
+
+def get_batch_size(config):
+    """Number of consecutive events to coalesce into one callback for this configuration."""
+    max_batch = getattr(settings, 'PLAYBACK_MAX_BATCH', 500)
+    if config.batch_window:
+        if config.fast_forward or config.delay_between_events <= 0:
+            # Every remaining event is due immediately
+            return max_batch
+        if config.replay_timing == 'recorded':
+            # Candidates; the window is applied to their ingestion times
+            return max_batch
+        return min(int(config.batch_window // config.delay_between_events) + 1, max_batch)
+    return min(max(config.batch_size, 1), max_batch)
+
+def play_next_event(flight_id, run_token):
+    """
+    Send the next unplayed event (or batch of events) of a flight.
+    Returns the delay in seconds before the next step, or None when the run should stop.
+    """
+    session = PlaybackSession.objects.filter(flight_id=flight_id).first()
+    if not session or session.run_token != run_token or session.status != 'running':
+        # Paused, aborted or taken over by a newer run
+        return None
+
+    config = MockConfiguration.objects.filter(flight_id=flight_id).first()
+    if not config or not config.callback_url:
+        _finish_session(flight_id, run_token, 'failed', 'No callback URL configured')
+        return None
+
+    recorded = config.replay_timing == 'recorded' and not config.fast_forward
+    batch_size = get_batch_size(config)
+    # Recorded timing looks one event ahead to know when the next step is due
+    unplayed = FlightEvent.objects.filter(flight_id=flight_id)
+    if session.last_priority is not None:
+        unplayed = unplayed.filter(priority__gt=session.last_priority)
+    events = list(unplayed.order_by('priority', 'created_at')[:batch_size + 1 if recorded else batch_size])
+    if not events:
+        _finish_session(flight_id, run_token, 'completed')
+        return None
+
+    timing = {}
+    if recorded:
+        events, upcoming, timing = _recorded_batch(session, config, events, batch_size)
+
+    payload_to_send = []
+    for event in events:
+        if event.event_data is None:
+            _finish_session(flight_id, run_token, 'failed', f'Invalid JSON in event {event.id}')
+            return None
+        payload_to_send.extend(build_callback_payload(event.event_data, event.id))
+
+    first_event, last_event = events[0], events[-1]
+    label = first_event.id if len(events) == 1 else f'{first_event.id}-{last_event.id}'
+    sent_at = timezone.now()
+    started = time.perf_counter()
+    try:
+        response = send_callback(config.callback_url, payload_to_send, label)
+    except requests.RequestException as e:
+        history.record_play(flight_id, 'playback', events, sent_at, time.perf_counter() - started, error=e, run_token=run_token)
+        logger.error(f"Playback callback failed for event {label} (URL: {config.callback_url}): {str(e)}")
+        _finish_session(flight_id, run_token, 'failed', f'Failed to send event {label}: {str(e)}')
+        return None
+
+    callback_seconds = time.perf_counter() - started
+    history.record_play(flight_id, 'playback', events, sent_at, callback_seconds, response=response, run_token=run_token)
+
+    # The whole batch was acknowledged: moving the cursor past it marks it played
+    updated = PlaybackSession.objects.filter(flight_id=flight_id, run_token=run_token).update(
+        events_sent=models.F('events_sent') + len(events),
+        last_priority=last_event.priority,
+        callbacks=models.F('callbacks') + 1,
+        callback_seconds=models.F('callback_seconds') + callback_seconds,
+        max_callback_seconds=Greatest(models.F('max_callback_seconds'), callback_seconds),
+        updated_at=timezone.now(),
+        **timing
+    )
+    if not updated:
+        return None
+
+    if recorded:
+        return _recorded_delay(config, timing, upcoming)
+    # Keep the overall cadence: a batch of N events covers N delay slots
+    return 0 if config.fast_forward else config.delay_between_events * len(events)
+
+def _recorded_offset(event, anchor_time, config):
+    """Seconds after the anchor event at which an event is due, at the configured speed."""
+    return (event.ingestion_time - anchor_time).total_seconds() / (config.speed_factor or 1.0)
+
+def _recorded_batch(session, config, candidates, batch_size):
+    """
+    Split recorded-timing candidates into the batch to send now and the next event.
+    Also returns the session fields to update: the run's anchor and the schedule lag.
+    """
+    now = timezone.now()
+    first_event = candidates[0]
+    anchor_at, anchor_time = session.timing_anchor_at, session.timing_anchor_time
+    if anchor_at is None or anchor_time is None or first_event.ingestion_time is None:
+        # First step of the run, or after events without a recorded time: this event is due now
+        anchor_at, anchor_time = now, first_event.ingestion_time
+    timing = {'timing_anchor_at': anchor_at, 'timing_anchor_time': anchor_time}
+
+    events = candidates[:batch_size]
+    if config.batch_window and first_event.ingestion_time is not None:
+        # Coalesce the events recorded within the window (at replay speed) of the first one
+        events = [first_event] + list(itertools.takewhile(
+            lambda event: event.ingestion_time is not None
+            and _recorded_offset(event, first_event.ingestion_time, config) <= config.batch_window,
+            candidates[1:batch_size]
+        ))
+    upcoming = candidates[len(events)] if len(candidates) > len(events) else None
+
+    if anchor_time is not None:
+        due = anchor_at + timedelta(seconds=_recorded_offset(first_event, anchor_time, config))
+        timing['max_lag_seconds'] = Greatest(models.F('max_lag_seconds'), max((now - due).total_seconds(), 0.0))
+    else:
+        timing['timing_anchor_at'] = None
+    return events, upcoming, timing
+
+def _recorded_delay(config, timing, upcoming):
+    if upcoming is None:
+        # The next step finds no events and completes the run
+        return 0
+    anchor_at, anchor_time = timing['timing_anchor_at'], timing['timing_anchor_time']
+    if anchor_at is None or anchor_time is None or upcoming.ingestion_time is None:
+        # No recorded time to schedule by (e.g. an event added by hand): use the fixed delay
+        return config.delay_between_events
+    due = anchor_at + timedelta(seconds=_recorded_offset(upcoming, anchor_time, config))
+    # Behind schedule gives a zero delay, so a late run catches up instead of drifting
+    return max((due - timezone.now()).total_seconds(), 0.0)
+
+def reset_cursor(flight):
+    """Mark every event of the flight unplayed, with one small write to its session."""
+    PlaybackSession.objects.filter(flight=flight).update(last_priority=None, updated_at=timezone.now())
+    progress.notify(flight.id)
+
+def advance_cursor(flight, priority):
+    """
+    Move the cursor to priority if that is the next event after it, and return whether it moved.
+    Playing a later event out of order leaves the cursor alone, so the events in between stay unplayed.
+    """
+    with transaction.atomic():
+        session, _ = PlaybackSession.objects.select_for_update().get_or_create(flight=flight)
+        cursor = session.last_priority
+        if cursor is not None and priority <= cursor:
+            return False
+        skipped = flight.events.filter(priority__lt=priority)
+        if cursor is not None:
+            skipped = skipped.filter(priority__gt=cursor)
+        if skipped.exists():
+            return False
+        session.last_priority = priority
+        session.save(update_fields=['last_priority', 'updated_at'])
+    progress.notify(flight.id)
+    return True
+
+def start_playback(flight):
+    config = MockConfiguration.objects.filter(flight=flight).first()
+    if not config:
+        raise PlaybackError('Mock configuration not found. Please configure callback URL first.')
+    if not config.callback_url:
+        raise PlaybackError('No callback URL configured. Please set a callback URL in the configuration.')
+    if config.manual_mode:
+        raise PlaybackError('Manual mode is enabled. Play events one at a time instead.')
+
+    run_token = uuid.uuid4().hex
+    session, _ = PlaybackSession.objects.update_or_create(
+        flight=flight,
+        defaults={
+            'status': 'running',
+            'run_token': run_token,
+            'events_sent': 0,
+            'callbacks': 0,
+            'callback_seconds': 0.0,
+            'max_callback_seconds': 0.0,
+            'timing_anchor_at': None,
+            'timing_anchor_time': None,
+            'max_lag_seconds': 0.0,
+            'last_error': '',
+            'started_at': timezone.now(),
+            'heartbeat_at': timezone.now(),
+        }
+    )
+    get_engine().schedule(flight.id, run_token)
+    progress.notify(flight.id)
+    return session
+
+def _pause_if_stale(session):
+    """Pause the session if it is 'running' without a worker process behind it. Returns the current session."""
+    if session is not None and PlaybackSession.heartbeat_expired(session.status, session.heartbeat_at):
+        if PlaybackSession.pause_stale(pk=session.pk):
+            logger.warning(f"Paused playback of flight {session.flight_id}: its worker process stopped sending heartbeats")
+            progress.notify(session.flight_id)
+        session.refresh_from_db()
+    return session
+
+def pause_playback(flight):
+    session = _pause_if_stale(PlaybackSession.objects.filter(flight=flight).first())
+    if not session or session.status != 'running':
+        raise PlaybackError('No running playback to pause.')
+    session.status = 'paused'
+    session.save(update_fields=['status', 'updated_at'])
+    progress.notify(flight.id)
+    return session
+
+def resume_playback(flight):
+    # A run whose worker process stopped counts as paused
+    session = _pause_if_stale(PlaybackSession.objects.filter(flight=flight).first())
+    if not session or session.status != 'paused':
+        raise PlaybackError('No paused playback to resume.')
+    session.status = 'running'
+    session.run_token = uuid.uuid4().hex
+    session.heartbeat_at = timezone.now()
+    # Recorded timing picks up from the next event instead of catching up on the pause
+    session.timing_anchor_at = None
+    session.save(update_fields=['status', 'run_token', 'heartbeat_at', 'timing_anchor_at', 'updated_at'])
+    get_engine().schedule(flight.id, session.run_token)
+    progress.notify(flight.id)
+    return session
+
+def abort_playback(flight):
+    """Stop any running or paused playback. Returns the session, or None if nothing was active."""
+    session = PlaybackSession.objects.filter(flight=flight, status__in=['running', 'paused']).first()
+    if not session:
+        return None
+    session.status = 'aborted'
+    session.run_token = ''
+    session.save(update_fields=['status', 'run_token', 'updated_at'])
+    progress.notify(flight.id)
+    return session
+
+def get_playback_state(flight):
+    session = _pause_if_stale(PlaybackSession.objects.filter(flight=flight).first())
+    cursor = session.last_priority if session else None
+    return {
+        'status': session.status if session else 'idle',
+        'events_sent': session.events_sent if session else 0,
+        'last_priority': session.last_priority if session else None,
+        'last_error': session.last_error if session else '',
+        'max_lag_ms': _milliseconds(session.max_lag_seconds) if session else 0.0,
+        'current_priority': cursor or 0,
+        'played_events': flight.events.filter(priority__lte=cursor).count() if cursor is not None else 0,
+        'total_events': flight.events.count(),
+    }
+
+def _milliseconds(seconds):
+    return round(seconds * 1000, 2)
+
+def summarize_sessions(sessions):
+    """
+    Combined progress and callback latency of many playback sessions, plus one entry per flight.
+    sessions is a PlaybackSession queryset.
+    """
+    sessions = [
+        _pause_if_stale(session)
+        for session in sessions.select_related('flight').order_by('flight__flight_unique_id')
+    ]
+    counts = {
+        row['flight_id']: row
+        for row in FlightEvent.objects.filter(flight_id__in=[session.flight_id for session in sessions])
+        .values('flight_id')
+        .annotate(
+            total=models.Count('id'),
+            played=models.Count('id', filter=models.Q(priority__lte=models.F('flight__playback_session__last_priority')))
+        )
+    }
+
+    flights = []
+    by_status = {}
+    for session in sessions:
+        count = counts.get(session.flight_id, {'total': 0, 'played': 0})
+        by_status[session.status] = by_status.get(session.status, 0) + 1
+        flights.append({
+            'flight': session.flight.flight_unique_id,
+            'status': session.status,
+            'events_sent': session.events_sent,
+            'played_events': count['played'],
+            'total_events': count['total'],
+            'callbacks': session.callbacks,
+            'avg_callback_ms': _milliseconds(session.callback_seconds / session.callbacks) if session.callbacks else 0.0,
+            'max_callback_ms': _milliseconds(session.max_callback_seconds),
+            'last_error': session.last_error,
+        })
+
+    started = [session.started_at for session in sessions if session.started_at]
+    if any(session.status in ('running', 'paused') for session in sessions):
+        finished = timezone.now()
+    else:
+        finished = max((session.updated_at for session in sessions), default=None)
+    elapsed = (finished - min(started)).total_seconds() if started and finished else 0.0
+    events_sent = sum(session.events_sent for session in sessions)
+    callbacks = sum(session.callbacks for session in sessions)
+    total_events = sum(flight['total_events'] for flight in flights)
+    played_events = sum(flight['played_events'] for flight in flights)
+    return {
+        'sessions': len(sessions),
+        'by_status': by_status,
+        'events_sent': events_sent,
+        'played_events': played_events,
+        'total_events': total_events,
+        'progress_percent': round(played_events / total_events * 100, 1) if total_events else 100.0,
+        'callbacks': callbacks,
+        'avg_callback_ms': _milliseconds(sum(session.callback_seconds for session in sessions) / callbacks) if callbacks else 0.0,
+        'max_callback_ms': _milliseconds(max((session.max_callback_seconds for session in sessions), default=0.0)),
+        'elapsed_seconds': round(elapsed, 3),
+        'events_per_second': round(events_sent / elapsed, 1) if elapsed > 0 else 0.0,
+        'flights': flights,
+    }
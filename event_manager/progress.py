@@ -0,0 +1,221 @@
+"""
+Live playback progress for the flight page, pushed as Server-Sent Events.
+
+Under ASGI, every worker process keeps one channel per watched flight. The
+channel reads the flight's PlaybackSession row once per poll interval (or as
+soon as the playback engine of the same process finishes a step), works out
+what changed, and encodes the update once for all its observers. Many
+observers of one replay therefore cost one query per interval, and a slow
+observer only skips to the latest update instead of queueing them.
+
+Under WSGI (e.g. runserver), each stream polls on its own.
+
+Django 4.2 does not notice a client that goes away mid-stream, so every
+stream ends after PLAYBACK_STREAM_MAX_SECONDS; EventSource reconnects on its own.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .models import PlaybackSession
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT = ': keep-alive\n\n'
+HEARTBEAT_SECONDS = 15  # Comment line sent when nothing changed, so proxies keep the connection open
+RETRY_MS = 3000  # How long EventSource waits before reconnecting
+SETTLE_SECONDS = 0.25  # After a step in this process, wait this long so a burst of steps becomes one update
+SESSION_FIELDS = (
+    'status', 'last_error', 'max_lag_seconds', 'events_sent', 'last_priority',
+    'callbacks', 'callback_seconds', 'max_callback_seconds', 'heartbeat_at',
+)
+
+
+def get_poll_seconds():
+    # Get stream timings from settings or use defaults
+    return getattr(settings, 'PLAYBACK_STREAM_POLL_SECONDS', 1.0)
+
+def get_max_seconds():
+    return getattr(settings, 'PLAYBACK_STREAM_MAX_SECONDS', 300)
+
+def read_progress(flight_id):
+    """Session fields of a flight, one query (two when a stale run is paused)."""
+    values = PlaybackSession.objects.filter(flight_id=flight_id).values(*SESSION_FIELDS).first() or {
+        'status': 'idle', 'last_error': '', 'max_lag_seconds': 0.0, 'events_sent': 0, 'last_priority': None,
+        'callbacks': 0, 'callback_seconds': 0.0, 'max_callback_seconds': 0.0, 'heartbeat_at': None,
+    }
+    if PlaybackSession.heartbeat_expired(values['status'], values['heartbeat_at']):
+        # The worker process running it stopped; show it as paused so it can be resumed
+        PlaybackSession.pause_stale(flight_id=flight_id)
+        values = PlaybackSession.objects.filter(flight_id=flight_id).values(*SESSION_FIELDS).first() or values
+    return values
+
+def _frame(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+class ProgressFrames:
+    """Turns successive session reads into 'played', 'latency' and 'state' SSE frames."""
+
+    def __init__(self):
+        self.data = {}
+        self.latest = {}  # event name -> frame of its latest value
+
+    def update(self, values):
+        """Frames of the groups that changed since the previous update, in a fixed order."""
+        callbacks = values['callbacks']
+        # State last, so a page that stops watching on a final state has applied the rest first
+        groups = {
+            'played': {
+                'events_sent': values['events_sent'],
+                'current_priority': values['last_priority'],
+            },
+            'latency': {
+                'callbacks': callbacks,
+                'callback_seconds': values['callback_seconds'],
+                'max_callback_ms': round(values['max_callback_seconds'] * 1000, 2),
+            },
+            'state': {
+                'status': values['status'],
+                'last_error': values['last_error'],
+                'max_lag_ms': round(values['max_lag_seconds'] * 1000, 2),
+            },
+        }
+        changed = []
+        for name, data in groups.items():
+            if self.data.get(name) == data:
+                continue
+            payload = dict(data)
+            if name == 'latency':
+                previous = self.data.get('latency') or {'callbacks': 0, 'callback_seconds': 0.0}
+                count = callbacks - previous['callbacks']
+                seconds = values['callback_seconds'] - previous['callback_seconds']
+                # Callbacks since the previous update, or since the run started
+                payload['recent_callback_ms'] = round(seconds / count * 1000, 2) if count > 0 else None
+                payload['avg_callback_ms'] = round(values['callback_seconds'] / callbacks * 1000, 2) if callbacks else 0.0
+                del payload['callback_seconds']
+            self.data[name] = data
+            self.latest[name] = _frame(name, payload)
+            changed.append(name)
+        return changed
+
+
+class FlightChannel:
+    """Shared progress of one flight for the observers on one event loop."""
+
+    def __init__(self, flight_id, loop):
+        self.flight_id = flight_id
+        self.loop = loop
+        self.observers = 0
+        self.frames = ProgressFrames()
+        self.version = 0
+        self.changed = []
+        self.condition = asyncio.Condition()
+        self.wake = asyncio.Event()
+        self.task = None
+
+    async def run(self):
+        read = sync_to_async(read_progress)
+        while self.observers:
+            self.wake.clear()
+            try:
+                values = await read(self.flight_id)
+            except Exception as e:
+                logger.error(f"Reading playback progress of flight {self.flight_id} failed: {str(e)}")
+                values = None
+            if values is not None:
+                changed = self.frames.update(values)
+                if changed:
+                    async with self.condition:
+                        self.version += 1
+                        self.changed = changed
+                        self.condition.notify_all()
+            try:
+                await asyncio.wait_for(self.wake.wait(), get_poll_seconds())
+                # Woken by a step in this process
+                await asyncio.sleep(SETTLE_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    def notify(self):
+        try:
+            self.loop.call_soon_threadsafe(self.wake.set)
+        except RuntimeError:
+            # The loop has closed
+            pass
+
+
+_channels = {}  # (event loop, flight id) -> FlightChannel
+_channels_lock = threading.Lock()
+
+def _subscribe(flight_id):
+    loop = asyncio.get_running_loop()
+    with _channels_lock:
+        channel = _channels.get((loop, flight_id))
+        if channel is None:
+            channel = _channels[(loop, flight_id)] = FlightChannel(flight_id, loop)
+            # Keep a reference so the poller is not garbage collected while it runs
+            channel.task = loop.create_task(channel.run())
+        channel.observers += 1
+    return channel
+
+def _unsubscribe(channel):
+    with _channels_lock:
+        channel.observers -= 1
+        if channel.observers <= 0 and _channels.get((channel.loop, channel.flight_id)) is channel:
+            del _channels[(channel.loop, channel.flight_id)]
+    # Let the poller see that nobody is watching any more
+    channel.wake.set()
+
+def notify(flight_id):
+    """Push the progress of a flight now rather than at the next poll. Safe to call from any thread."""
+    with _channels_lock:
+        channels = [channel for (_, watched), channel in _channels.items() if watched == flight_id]
+    for channel in channels:
+        channel.notify()
+
+async def stream_progress(flight_id):
+    """SSE stream of a flight's playback progress, shared with the other observers on this event loop."""
+    channel = _subscribe(flight_id)
+    deadline = time.monotonic() + get_max_seconds()
+    seen = 0
+    try:
+        yield f'retry: {RETRY_MS}\n\n'
+        while time.monotonic() < deadline:
+            async with channel.condition:
+                try:
+                    await asyncio.wait_for(
+                        channel.condition.wait_for(lambda: channel.version != seen),
+                        min(HEARTBEAT_SECONDS, max(deadline - time.monotonic(), 0))
+                    )
+                except asyncio.TimeoutError:
+                    frames = None
+                else:
+                    # One update behind gets what changed; a new or lagging observer gets everything
+                    names = channel.changed if channel.version == seen + 1 else list(channel.frames.latest)
+                    frames = ''.join(channel.frames.latest[name] for name in names)
+                    seen = channel.version
+            yield frames or HEARTBEAT
+    finally:
+        _unsubscribe(channel)
+
+def stream_progress_sync(flight_id):
+    """The same stream for WSGI servers, polling for this observer alone."""
+    frames = ProgressFrames()
+    deadline = time.monotonic() + get_max_seconds()
+    last_sent = time.monotonic()
+    yield f'retry: {RETRY_MS}\n\n'
+    while time.monotonic() < deadline:
+        changed = frames.update(read_progress(flight_id))
+        if changed:
+            yield ''.join(frames.latest[name] for name in changed)
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent >= HEARTBEAT_SECONDS:
+            yield HEARTBEAT
+            last_sent = time.monotonic()
+        time.sleep(get_poll_seconds())
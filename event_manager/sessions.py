@@ -0,0 +1,145 @@
+"""
+Mock session preparation, for one flight or many at once.
+
+Preparing a session stops its playback, resets the cleanup database (cleanup
+query or snapshot), marks the flight's events unplayed and runs the enabled
+additional tasks. start_sessions() prepares many flights concurrently and
+starts their playback on the shared playback engine, whose bounded thread
+pool serves every session. Each flight has at most one step queued at a time,
+so its events are always sent in priority order.
+"""
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from . import http_client, kafka_avro, kafka_producers
+from .cleanup import execute_cleanup
+from .kafka_publish import publish_flight_events
+from .models import Flight, MockConfiguration
+from .playback import PlaybackError, abort_playback, reset_cursor, start_playback
+from .snapshots import restore_snapshot
+
+logger = logging.getLogger(__name__)
+
+
+def prepare_session(flight):
+    """Reset a flight for a new mock session. Raises on cleanup or task failure."""
+    # Stop any server-side playback before cleaning up underneath it
+    abort_playback(flight)
+
+    config = MockConfiguration.objects.filter(flight=flight).first()
+    if not config:
+        raise PlaybackError('Mock configuration not found. Please configure callback URL first.')
+
+    if config.reset_strategy == 'snapshot':
+        # Restore the captured baseline of the cleanup database instead of running cleanup queries
+        restore_snapshot(config)
+    else:
+        # Run custom cleanup query if provided, otherwise the default query on the default database
+        execute_cleanup(config.cleanup_query, flight.flight_unique_id, config if config.cleanup_query else None)
+
+    # Reset all events to unplayed
+    reset_cursor(flight)
+
+    # Execute pre-mock tasks
+    for task in config.tasks.filter(is_enabled=True).order_by('order'):
+        try:
+            execute_additional_task(task)
+        except Exception as e:
+            raise Exception(f'Task {task.name} failed: {str(e)}')
+
+def execute_additional_task(task):
+    payload = json.loads(task.payload_template)
+    if task.task_type == 'kafka':
+        bootstrap_servers = payload.get('bootstrap_servers')
+        topic = payload.get('topic')
+        if not bootstrap_servers or not topic:
+            raise ValueError('Kafka task needs bootstrap_servers and topic')
+        avro_subject = payload.get('schema_subject')
+        if avro_subject is None and 'schema_registry_url' in payload:
+            avro_subject = kafka_avro.default_subject(topic)
+        if 'message' in payload:
+            # Single message from the template
+            if avro_subject:
+                value = kafka_avro.get_encoder(avro_subject, payload.get('schema_registry_url')).encode(payload['message'])
+            else:
+                value = json.dumps(payload['message']).encode('utf-8')
+            delivery = kafka_producers.produce(bootstrap_servers, topic, value)
+            delivery.result(timeout=getattr(settings, 'KAFKA_DELIVERY_TIMEOUT', 10))
+        else:
+            # Publish the flight's events (optionally a priority range)
+            summary = publish_flight_events(
+                task.configuration.flight,
+                bootstrap_servers,
+                topic,
+                min_priority=payload.get('min_priority'),
+                max_priority=payload.get('max_priority'),
+                key_strategy=payload.get('key_strategy', 'none'),
+                rate=payload.get('rate'),
+                avro_subject=avro_subject,
+                schema_registry_url=payload.get('schema_registry_url')
+            )
+            if summary['failed'] or summary['pending']:
+                raise Exception(
+                    f"{summary['failed']} of {summary['messages']} Kafka messages failed and "
+                    f"{summary['pending']} were not acknowledged"
+                )
+    elif task.task_type == 'api':
+        response = http_client.post(
+            payload.get('url'),
+            json=payload.get('body'),
+            headers=payload.get('headers', {}),
+            timeout=5
+        )
+        response.raise_for_status()
+
+def resolve_flights(references):
+    """
+    Flights for a list of flight unique ids or primary keys, in the given order.
+    Returns (flights, references that matched no flight).
+    """
+    ids = [reference for reference in references if isinstance(reference, int)]
+    unique_ids = [str(reference) for reference in references if not isinstance(reference, int)]
+    by_id = Flight.objects.in_bulk(ids)
+    by_unique_id = Flight.objects.in_bulk(unique_ids, field_name='flight_unique_id')
+
+    flights = []
+    missing = []
+    for reference in references:
+        flight = by_id.get(reference) if isinstance(reference, int) else by_unique_id.get(str(reference))
+        if flight is None:
+            missing.append(reference)
+        elif flight not in flights:
+            flights.append(flight)
+    return flights, missing
+
+def _start_one(flight, reset):
+    close_old_connections()
+    try:
+        if reset:
+            prepare_session(flight)
+        start_playback(flight)
+        return {'flight': flight.flight_unique_id, 'status': 'started'}
+    except Exception as e:
+        logger.error(f"Could not start mock session for {flight.flight_unique_id}: {str(e)}")
+        return {'flight': flight.flight_unique_id, 'status': 'failed', 'error': str(e)}
+    finally:
+        close_old_connections()
+
+def start_sessions(flights, reset=True, workers=None):
+    """
+    Start a mock session for every flight, each with its own configuration.
+    With reset, each flight is prepared first (cleanup, events unplayed, tasks).
+    Returns one {'flight', 'status', 'error'} entry per flight.
+    """
+    # Get preparation concurrency from settings or use default
+    workers = workers or getattr(settings, 'SESSION_START_WORKERS', 8)
+    if connection.vendor == 'sqlite':
+        # SQLite allows a single writer, so parallel preparation would only wait on locks
+        workers = 1
+    logger.info(f"Starting {len(flights)} mock sessions ({'with' if reset else 'without'} reset, {workers} workers)")
+    with ThreadPoolExecutor(max_workers=max(min(workers, len(flights)), 1), thread_name_prefix='session-start') as executor:
+        return list(executor.map(lambda flight: _start_one(flight, reset), flights))
@@ -0,0 +1,40 @@
+import threading
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import api_cache
+from .models import Flight, FlightEvent
+
+# Flights already queued for invalidation in the current transaction of this thread
+_pending = threading.local()
+
+@receiver(post_save, sender=Flight)
+@receiver(post_delete, sender=Flight)
+def invalidate_flight_cache(sender, instance, **kwargs):
+    api_cache.invalidate_flight(instance)
+
+# No post_delete receiver for events: any delete listener makes Django load every row of a
+# bulk event delete. The places that delete events invalidate the flight themselves.
+@receiver(post_save, sender=FlightEvent)
+def invalidate_event_flight_cache(sender, instance, using=None, **kwargs):
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        _invalidate(instance.flight_id)
+        return
+    # Saving several events of a flight in one transaction invalidates it once, on commit.
+    # Django starts a new hook list after every commit or rollback, which also resets the queue.
+    if getattr(_pending, 'hooks', None) is not connection.run_on_commit:
+        _pending.hooks = connection.run_on_commit
+        _pending.flight_ids = set()
+    if instance.flight_id not in _pending.flight_ids:
+        _pending.flight_ids.add(instance.flight_id)
+        transaction.on_commit(partial(_invalidate, instance.flight_id), using=using)
+
+def _invalidate(flight_id):
+    # A deleted flight was already invalidated by its own post_delete
+    flight = Flight.objects.filter(pk=flight_id).only('flight_number', 'flight_date').first()
+    if flight is not None:
+        api_cache.invalidate_flight(flight)
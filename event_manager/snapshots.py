@@ -0,0 +1,126 @@
+"""
+Snapshot reset of the cleanup database, as an alternative to cleanup queries.
+
+Capturing copies the listed tables (and the values of the sequences they own)
+into a schema of their own on the cleanup database. Restoring truncates the
+tables and reloads them from that copy in one transaction and one round trip.
+TRUNCATE does not depend on how many rows a replay wrote, so a reset costs
+the same however much data the replay produced, and every listed table is
+reset, not just the rows the cleanup query knows about.
+
+Requires PostgreSQL (the default database or the custom cleanup database).
+"""
+import logging
+import re
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from .cleanup import cleanup_transaction
+from .models import MockConfiguration
+
+logger = logging.getLogger(__name__)
+
+TABLE_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_$]*(\.[A-Za-z_][A-Za-z0-9_$]*)?$')
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def parse_tables(text):
+    """[(schema or None, table)] from a comma- or newline-separated table list, in order."""
+    tables = []
+    for name in re.split(r'[,\s]+', text or ''):
+        if not name:
+            continue
+        if not TABLE_NAME.match(name):
+            raise SnapshotError(f'Invalid table name: {name}')
+        # Unquoted names, so fold case the way PostgreSQL does
+        schema, _, table = name.lower().rpartition('.')
+        if (schema or None, table) not in tables:
+            tables.append((schema or None, table))
+    return tables
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def _qualified(schema, table):
+    return f'{_quote(schema)}.{_quote(table)}' if schema else _quote(table)
+
+def snapshot_schema(config):
+    return f"{getattr(settings, 'SNAPSHOT_SCHEMA_PREFIX', 'flight_mock_snapshot')}_{config.pk}"
+
+def _copies(config):
+    tables = parse_tables(config.snapshot_tables)
+    if not tables:
+        raise SnapshotError('No snapshot tables configured')
+    schema = _quote(snapshot_schema(config))
+    copies = []
+    for table_schema, table in tables:
+        copy_name = _quote(f"{table_schema or 'public'}__{table}")
+        copies.append((_qualified(table_schema, table), f'{schema}.{copy_name}'))
+    return copies, schema
+
+def capture_script(config):
+    copies, schema = _copies(config)
+    script = [f'DROP SCHEMA IF EXISTS {schema} CASCADE', f'CREATE SCHEMA {schema}']
+    script += [f'CREATE TABLE {copy} AS TABLE {source}' for source, copy in copies]
+    # Sequences owned by the tables (serial and identity columns), so ids continue from the baseline
+    sources = ', '.join(f"'{source}'::regclass" for source, _ in copies)
+    script.append(
+        f'CREATE TABLE {schema}."_sequences" AS '
+        "SELECT format('%I.%I', sequences.schemaname, sequences.sequencename) AS name, sequences.last_value "
+        "FROM pg_depend dependency "
+        "JOIN pg_class sequence_class ON sequence_class.oid = dependency.objid AND sequence_class.relkind = 'S' "
+        "JOIN pg_namespace namespace ON namespace.oid = sequence_class.relnamespace "
+        "JOIN pg_sequences sequences "
+        "ON sequences.schemaname = namespace.nspname AND sequences.sequencename = sequence_class.relname "
+        f"WHERE dependency.deptype IN ('a', 'i') AND dependency.refobjid IN ({sources})"
+    )
+    return script
+
+def restore_script(config):
+    copies, schema = _copies(config)
+    # One TRUNCATE for all tables, so foreign keys between them do not get in the way
+    script = [f"TRUNCATE {', '.join(source for source, _ in copies)}"]
+    # Reload in the listed order: parents before children
+    script += [f'INSERT INTO {source} OVERRIDING SYSTEM VALUE SELECT * FROM {copy}' for source, copy in copies]
+    script.append(
+        'SELECT CASE WHEN last_value IS NULL THEN setval(name::regclass, 1, false) '
+        'ELSE setval(name::regclass, last_value) END '
+        f'FROM {schema}."_sequences"'
+    )
+    return script
+
+def _run(config, script, action):
+    started = time.perf_counter()
+    try:
+        with cleanup_transaction(config) as (cursor, is_postgres):
+            if not is_postgres:
+                raise SnapshotError('Snapshot reset requires a PostgreSQL cleanup database')
+            cursor.execute(';\n'.join(script))
+    except SnapshotError:
+        raise
+    except Exception as e:
+        raise SnapshotError(f'Snapshot {action} failed: {str(e).split("LINE")[0].strip()}')
+    return round((time.perf_counter() - started) * 1000, 2)
+
+def capture_snapshot(config):
+    """Copy the configured tables as the baseline that later resets restore."""
+    elapsed_ms = _run(config, capture_script(config), 'capture')
+    config.snapshot_captured_at = timezone.now()
+    MockConfiguration.objects.filter(pk=config.pk).update(snapshot_captured_at=config.snapshot_captured_at)
+    tables = len(parse_tables(config.snapshot_tables))
+    logger.info(f"Captured snapshot of {tables} tables for {config} in {elapsed_ms} ms")
+    return {'tables': tables, 'total_ms': elapsed_ms, 'captured_at': config.snapshot_captured_at.isoformat()}
+
+def restore_snapshot(config):
+    """Reset the configured tables to the captured baseline."""
+    if config.snapshot_captured_at is None:
+        raise SnapshotError('No snapshot captured yet; capture one from Advanced Configuration first')
+    elapsed_ms = _run(config, restore_script(config), 'restore')
+    tables = len(parse_tables(config.snapshot_tables))
+    logger.info(f"Restored snapshot of {tables} tables for {config} in {elapsed_ms} ms")
+    return {'tables': tables, 'total_ms': elapsed_ms}
@@ -1,3 +1,459 @@
-from django.test import TestCase
+import io
+import json
+import os
+import struct
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+from confluent_kafka import KafkaError, KafkaException, Producer
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from fastavro import parse_schema, schemaless_reader
+
+from . import api_cache, kafka_avro, kafka_producers, kafka_publish, playback
+from .cleanup import CleanupError, bind_statement, split_statements
+from .importers import external_sort, read_csv_rows, sort_by_ingestion_time
+from .models import PRIORITY_GAP, Flight, FlightEvent, PlaybackSession
+
+
+class FakeMessage:
+    def __init__(self, topic, value, key):
+        self._topic = topic
+        self._value = value
+        self._key = key
+
+    def topic(self):
+        return self._topic
+
+    def value(self):
+        return self._value
+
+    def key(self):
+        return self._key
+
+    def partition(self):
+        return 0
+
+    def offset(self):
+        return 0
+
+
+class FakeProducer:
+    """Stand-in for confluent_kafka.Producer that delivers on poll(), failing the topics in fail_topics."""
+
+    instances = []
+
+    def __init__(self, config):
+        self.config = config
+        self.fail_topics = set()
+        self.hold = threading.Event()  # While set, poll() delivers nothing
+        self._lock = threading.Lock()
+        self._pending = []
+        self.produced = []
+        FakeProducer.instances.append(self)
+
+    def produce(self, topic, value=None, key=None, on_delivery=None):
+        with self._lock:
+            message = FakeMessage(topic, value, key)
+            self.produced.append(message)
+            self._pending.append((message, on_delivery))
+
+    def poll(self, timeout=None):
+        pending = []
+        if not self.hold.is_set():
+            with self._lock:
+                pending, self._pending = self._pending, []
+        for msg, on_delivery in pending:
+            err = KafkaError(KafkaError._MSG_TIMED_OUT) if msg.topic() in self.fail_topics else None
+            on_delivery(err, msg)
+        if not pending and timeout:
+            time.sleep(timeout)
+        return len(pending)
+
+    def flush(self, timeout=None):
+        self.hold.clear()
+        self.poll(0)
+        return len(self)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ApiCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.flight = Flight(flight_unique_id='AI101_05042025')
+        self.flight.flight_number, self.flight.flight_date = 'AI101', date(2025, 4, 5)
+        stats_patch = mock.patch.object(api_cache, '_stats', dict.fromkeys(api_cache.STATS, 0))
+        stats_patch.start()
+        self.addCleanup(stats_patch.stop)
+
+    def test_hit_until_invalidated(self):
+        content, version = api_cache.get_response('ai101', self.flight.flight_date)
+        self.assertIsNone(content)
+        api_cache.set_response('ai101', self.flight.flight_date, '{"a": 1}', version)
+        self.assertEqual(api_cache.get_response('AI101', self.flight.flight_date)[0], '{"a": 1}')
+
+        api_cache.invalidate_flight(self.flight)
+        self.assertIsNone(api_cache.get_response('AI101', self.flight.flight_date)[0])
+        stats = api_cache.get_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['invalidations']), (1, 2, 1))
+
+    def test_miss_racing_a_write_is_not_served(self):
+        # The miss reads the database, then a write commits and invalidates before the miss stores its entry
+        _, version = api_cache.get_response('AI101', self.flight.flight_date)
+        api_cache.invalidate_flight(self.flight)
+        api_cache.set_response('AI101', self.flight.flight_date, '"stale"', version)
+        self.assertIsNone(api_cache.get_response('AI101', self.flight.flight_date)[0])
+
+    def test_undated_flight_invalidates_every_entry(self):
+        _, version = api_cache.get_response('AI101', self.flight.flight_date)
+        api_cache.set_response('AI101', self.flight.flight_date, '{}', version)
+        api_cache.invalidate_flight(Flight(flight_unique_id='TEST'))
+        self.assertIsNone(api_cache.get_response('AI101', self.flight.flight_date)[0])
+
+
+class KafkaProducerPoolTests(SimpleTestCase):
+    def setUp(self):
+        FakeProducer.instances = []
+        kafka_producers.set_producer_factory(FakeProducer)
+        self.addCleanup(kafka_producers.set_producer_factory, Producer)
+        stats_patch = mock.patch.object(kafka_producers, 'stats', kafka_producers.ProducerStats())
+        stats_patch.start()
+        self.addCleanup(stats_patch.stop)
+
+    def test_one_producer_per_bootstrap_servers(self):
+        first = kafka_producers.get_producer('broker-a:9092')
+        self.assertIs(kafka_producers.get_producer('broker-a:9092'), first)
+        self.assertIsNot(kafka_producers.get_producer('broker-b:9092'), first)
+        # Config overrides get a producer of their own
+        tuned = kafka_producers.get_producer('broker-a:9092', {'linger.ms': 50})
+        self.assertIsNot(tuned, first)
+        self.assertEqual(len(FakeProducer.instances), 3)
+        self.assertEqual(first.producer.config['bootstrap.servers'], 'broker-a:9092')
+        self.assertEqual(tuned.producer.config['linger.ms'], 50)
+
+    def test_delivery_report_resolves_future(self):
+        future = kafka_producers.produce('broker-a:9092', 'flights', b'{"a": 1}', key=b'AI101')
+        msg = future.result(timeout=5)
+        self.assertEqual(msg.topic(), 'flights')
+        self.assertEqual(msg.value(), b'{"a": 1}')
+        self.assertEqual(msg.key(), b'AI101')
+
+    def test_failed_delivery_fails_future(self):
+        pooled = kafka_producers.get_producer('broker-a:9092')
+        pooled.producer.fail_topics.add('flights')
+        with self.assertLogs('event_manager.kafka_producers', 'ERROR'):
+            future = pooled.produce('flights', b'{}')
+            with self.assertRaises(KafkaException):
+                future.result(timeout=5)
+
+    def test_topic_stats(self):
+        pooled = kafka_producers.get_producer('broker-a:9092')
+        pooled.producer.hold.set()
+        futures = [pooled.produce('flights', b'{}') for _ in range(3)]
+        pooled.producer.fail_topics.add('other')
+        failed = pooled.produce('other', b'{}')
+
+        stats = kafka_producers.get_stats()
+        self.assertEqual(stats['topics']['flights']['produced'], 3)
+        self.assertEqual(stats['topics']['flights']['queue_depth'], 3)
+        self.assertEqual(stats['producers']['broker-a:9092']['queue_length'], 4)
+
+        with self.assertLogs('event_manager.kafka_producers', 'ERROR'):
+            pooled.producer.hold.clear()
+            for future in futures:
+                future.result(timeout=5)
+            with self.assertRaises(KafkaException):
+                failed.result(timeout=5)
+
+        topics = kafka_producers.get_stats()['topics']
+        self.assertEqual(topics['flights']['delivered'], 3)
+        self.assertEqual(topics['flights']['queue_depth'], 0)
+        self.assertGreaterEqual(topics['flights']['max_latency_ms'], topics['flights']['avg_latency_ms'])
+        self.assertEqual(topics['other']['failed'], 1)
+        self.assertEqual(topics['other']['delivered'], 0)
+        self.assertEqual(topics['other']['queue_depth'], 0)
+
+
+FLIGHT_SCHEMA = {
+    'type': 'record',
+    'name': 'Flight',
+    'fields': [
+        {'name': 'flight_number', 'type': 'string'},
+        {'name': 'priority', 'type': 'int'},
+        {'name': 'fid', 'type': ['null', 'string'], 'default': None},
+    ],
+}
+
+
+class AvroEncoderTests(SimpleTestCase):
+    def setUp(self):
+        schema_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(schema_dir.cleanup)
+        with open(os.path.join(schema_dir.name, 'flights-value.avsc'), 'w', encoding='utf-8') as schema_file:
+            json.dump(FLIGHT_SCHEMA, schema_file)
+        settings_patch = override_settings(AVRO_SCHEMA_DIR=schema_dir.name)
+        settings_patch.enable()
+        self.addCleanup(settings_patch.disable)
+        kafka_avro.clear_cache()
+        self.addCleanup(kafka_avro.clear_cache)
+
+    def test_batch_uses_confluent_wire_format(self):
+        encoder = kafka_avro.get_encoder('flights-value')
+        records = [
+            {'flight_number': 'AI101', 'priority': 1000, 'fid': 'abc'},
+            {'flight_number': 'AI102', 'priority': 2000, 'fid': None},
+        ]
+        for record, message in zip(records, encoder.encode_batch(records)):
+            magic, schema_id = struct.unpack('>bI', message[:5])
+            self.assertEqual(magic, 0)
+            self.assertEqual(schema_id, encoder.schema_id)
+            self.assertEqual(schemaless_reader(io.BytesIO(message[5:]), parse_schema(FLIGHT_SCHEMA)), record)
+
+    def test_record_not_matching_schema_raises(self):
+        encoder = kafka_avro.get_encoder('flights-value')
+        with self.assertRaisesRegex(ValueError, 'Record 1 does not match schema flights-value'):
+            encoder.encode_batch([
+                {'flight_number': 'AI101', 'priority': 1000},
+                {'flight_number': 'AI102', 'priority': 'high'},
+            ])
+
+    def test_encoder_cached_per_registry_and_subject(self):
+        encoder = kafka_avro.get_encoder('flights-value')
+        self.assertIs(kafka_avro.get_encoder('flights-value'), encoder)
+        with mock.patch.object(kafka_avro, 'SchemaRegistryClient') as client:
+            client.return_value = kafka_avro.LocalSchemaRegistry(settings.AVRO_SCHEMA_DIR)
+            remote = kafka_avro.get_encoder('flights-value', 'http://registry:8081')
+            self.assertIsNot(remote, encoder)
+            self.assertIs(kafka_avro.get_encoder('flights-value', 'http://registry:8081'), remote)
+        client.assert_called_once_with({'url': 'http://registry:8081'})
+
+    def test_missing_local_schema_raises(self):
+        with self.assertRaisesRegex(ValueError, 'no local schema file'):
+            kafka_avro.get_encoder('other-value')
+
+
+class PublishFlightEventsTests(TestCase):
+    def setUp(self):
+        FakeProducer.instances = []
+        kafka_producers.set_producer_factory(FakeProducer)
+        self.addCleanup(kafka_producers.set_producer_factory, Producer)
+        stats_patch = mock.patch.object(kafka_producers, 'stats', kafka_producers.ProducerStats())
+        stats_patch.start()
+        self.addCleanup(stats_patch.stop)
+
+        self.flight = Flight.objects.create(flight_unique_id='AI101_05042025')
+        self.events = [
+            FlightEvent.objects.create(
+                flight=self.flight, raw_event=json.dumps({'fid': f'F{n}', 'n': n}), flight_state='SCHEDULED',
+                priority=n * PRIORITY_GAP
+            )
+            for n in range(1, 5)
+        ]
+
+    def producer(self):
+        return kafka_producers.get_producer('broker-a:9092', kafka_publish.get_bulk_producer_overrides()).producer
+
+    def publish(self, **kwargs):
+        return kafka_publish.publish_flight_events(self.flight, 'broker-a:9092', 'flights', **kwargs)
+
+    def test_delivered_in_priority_order(self):
+        summary = self.publish()
+        self.assertEqual((summary['messages'], summary['delivered'], summary['failed'], summary['pending']), (4, 4, 0, 0))
+        self.assertEqual([message.value() for message in self.producer().produced],
+                         [event.raw_event.encode('utf-8') for event in self.events])
+
+    def test_key_strategies(self):
+        expected = {
+            'none': [None] * 4,
+            'flight': [b'AI101_05042025'] * 4,
+            'fid': [b'F1', b'F2', b'F3', b'F4'],
+            'event': [str(event.id).encode('utf-8') for event in self.events],
+        }
+        for key_strategy, keys in expected.items():
+            with self.subTest(key_strategy=key_strategy):
+                producer = self.producer()
+                producer.produced.clear()
+                self.publish(key_strategy=key_strategy)
+                self.assertEqual([message.key() for message in producer.produced], keys)
+
+    def test_priority_range(self):
+        summary = self.publish(min_priority=2 * PRIORITY_GAP, max_priority=3 * PRIORITY_GAP)
+        self.assertEqual(summary['messages'], 2)
+        self.assertEqual([json.loads(message.value())['n'] for message in self.producer().produced], [2, 3])
+
+    def test_failed_deliveries_counted(self):
+        self.producer().fail_topics.add('flights')
+        with self.assertLogs('event_manager.kafka_producers', 'ERROR'):
+            summary = self.publish()
+        self.assertEqual((summary['delivered'], summary['failed'], summary['pending']), (0, 4, 0))
+        self.assertEqual(summary['errors'][0]['count'], 4)
+
+    @override_settings(KAFKA_BULK_DELIVERY_TIMEOUT=0.05)
+    def test_undelivered_messages_pending(self):
+        self.producer().hold.set()
+        summary = self.publish()
+        self.assertEqual((summary['delivered'], summary['failed'], summary['pending']), (0, 0, 4))
+
+
+class CleanupScriptTests(SimpleTestCase):
+    def test_split_on_semicolons(self):
+        self.assertEqual(
+            split_statements("DELETE FROM a; DELETE FROM b;\n\n;"),
+            ['DELETE FROM a', 'DELETE FROM b']
+        )
+
+    def test_split_ignores_semicolons_in_quotes(self):
+        self.assertEqual(
+            split_statements("""UPDATE a SET note = 'x;y' WHERE "odd;name" = 'it''s;'; DELETE FROM b"""),
+            ["""UPDATE a SET note = 'x;y' WHERE "odd;name" = 'it''s;'""", 'DELETE FROM b']
+        )
+
+    def test_split_ignores_semicolons_in_comments(self):
+        script = "-- clear; both tables\nDELETE FROM a; /* b; then /* nested; */ c */ DELETE FROM b;\n-- done;"
+        self.assertEqual(split_statements(script), [
+            '-- clear; both tables\nDELETE FROM a',
+            '/* b; then /* nested; */ c */ DELETE FROM b',
+        ])
+
+    def test_split_keeps_dollar_quoted_bodies_whole(self):
+        do_block = "DO $$ BEGIN DELETE FROM a; DELETE FROM b; END $$"
+        function = "CREATE FUNCTION f() RETURNS void AS $body$ DELETE FROM c; $$ not the end; $body$ LANGUAGE sql"
+        self.assertEqual(
+            split_statements(f"{do_block}; {function}; SELECT $1"),
+            [do_block, function, 'SELECT $1']
+        )
+
+    def test_bind_whole_literal(self):
+        self.assertEqual(
+            bind_statement("DELETE FROM flight_status WHERE flight_unique_id = '{flight_unique_id}'"),
+            'DELETE FROM flight_status WHERE flight_unique_id = %(flight_unique_id)s'
+        )
+
+    def test_bind_literal_with_surrounding_text(self):
+        self.assertEqual(
+            bind_statement("DELETE FROM a WHERE id LIKE '%{flight_unique_id}%' AND note = 'it''s 100%'"),
+            "DELETE FROM a WHERE id LIKE ('%%' || %(flight_unique_id)s || '%%') AND note = 'it''s 100%%'"
+        )
+
+    def test_bind_bare_placeholder_and_escape_percent(self):
+        self.assertEqual(
+            bind_statement('SELECT {flight_unique_id}, 5 % 2'),
+            'SELECT %(flight_unique_id)s, 5 %% 2'
+        )
+
+    def test_bind_leaves_comments_and_bodies(self):
+        self.assertEqual(
+            bind_statement("-- 100% of '{flight_unique_id}'\nDO $$ BEGIN PERFORM 1 % 2; END $$"),
+            "-- 100%% of '{flight_unique_id}'\nDO $$ BEGIN PERFORM 1 %% 2; END $$"
+        )
+
+    def test_bind_rejects_placeholder_in_dollar_body(self):
+        with self.assertRaises(CleanupError):
+            bind_statement("DO $$ BEGIN DELETE FROM a WHERE id = '{flight_unique_id}'; END $$")
+
+
+class PriorityAllocationTests(TestCase):
+    def setUp(self):
+        self.flight = Flight.objects.create(flight_unique_id='AI101_05042025')
+
+    def add_events(self, *priorities):
+        return [
+            FlightEvent.objects.create(flight=self.flight, raw_event='{}', flight_state='SCHEDULED', priority=priority)
+            for priority in priorities
+        ]
+
+    def priorities(self):
+        return list(self.flight.events.values_list('priority', flat=True))
+
+    def test_zero_appends_after_last_event(self):
+        self.assertEqual(self.flight.allocate_priority(0), PRIORITY_GAP)
+        self.add_events(1000, 2500)
+        self.assertEqual(self.flight.allocate_priority(0), 2500 + PRIORITY_GAP)
+
+    def test_free_priority_is_used_as_is(self):
+        self.add_events(1000, 2000)
+        self.assertEqual(self.flight.allocate_priority(1500), 1500)
+
+    def test_taken_priority_takes_gap_midpoint(self):
+        self.add_events(1000, 2000)
+        self.assertEqual(self.flight.allocate_priority(2000), 1500)
+        self.assertEqual(self.flight.allocate_priority(1000), 500)
+        self.assertEqual(self.priorities(), [1000, 2000])
+
+    def test_exhausted_gap_renumbers_flight(self):
+        first, second, _ = self.add_events(5, 6, 4000)
+        PlaybackSession.objects.create(flight=self.flight, last_priority=5)
+
+        priority = self.flight.allocate_priority(6)
+
+        self.assertEqual(self.priorities(), [1000, 2000, 3000])
+        second.refresh_from_db()
+        self.assertEqual(second.priority, 2000)
+        self.assertEqual(priority, 1500)
+        # The new event lands between the events that held 5 and 6
+        first.refresh_from_db()
+        self.assertLess(first.priority, priority)
+        # The cursor stays after the same played event
+        self.assertEqual(PlaybackSession.objects.get(flight=self.flight).last_priority, 1000)
+
+
+class ExternalSortTests(SimpleTestCase):
+    def test_single_run_stays_in_memory(self):
+        with mock.patch('event_manager.importers._spill') as spill:
+            self.assertEqual(list(external_sort([3, 1, 2], key=lambda item: item, run_size=10)), [1, 2, 3])
+        spill.assert_not_called()
+
+    def test_merges_spilled_runs_in_order(self):
+        items = [(number * 7919) % 101 for number in range(101)]
+        self.assertEqual(list(external_sort(items, key=lambda item: item, run_size=8)), sorted(items))
+
+    def test_equal_keys_keep_input_order_across_runs(self):
+        items = [(index % 3, index) for index in range(20)]
+        result = list(external_sort(items, key=lambda item: item[0], run_size=4))
+        self.assertEqual(result, sorted(items, key=lambda item: item[0]))
+
+    def test_sort_by_ingestion_time_across_runs(self):
+        csv_text = 'raw_event_json,identified_changes,flight_state,ingestion_time\n' + ''.join(
+            f'"{{""n"": {n}}}",,SCHEDULED,2025-04-05T10:{(n * 37) % 60:02d}:00\n' for n in range(60)
+        )
+        rows = list(sort_by_ingestion_time(read_csv_rows(csv_text), run_size=7))
+        self.assertEqual(len(rows), 60)
+        times = [row[3] for row in rows]
+        self.assertEqual(times, sorted(times))
+        self.assertEqual(rows[0][0], '{"n": 0}')
+
+
+class StalePlaybackTests(TestCase):
+    def setUp(self):
+        self.flight = Flight.objects.create(flight_unique_id='AI101_05042025')
+        engine_patch = mock.patch.object(playback, 'get_engine')
+        self.engine = engine_patch.start()
+        self.addCleanup(engine_patch.stop)
+
+    def running_session(self, heartbeat_age):
+        return PlaybackSession.objects.create(
+            flight=self.flight, status='running', run_token='abc',
+            heartbeat_at=timezone.now() - timedelta(seconds=heartbeat_age)
+        )
+
+    def test_running_session_with_heartbeat(self):
+        self.running_session(heartbeat_age=5)
+        self.assertEqual(playback.get_playback_state(self.flight)['status'], 'running')
+
+    def test_stale_session_is_paused_and_resumable(self):
+        self.running_session(heartbeat_age=600)
+        with self.assertLogs('event_manager.playback', 'WARNING'):
+            state = playback.get_playback_state(self.flight)
+        self.assertEqual(state['status'], 'paused')
+        self.assertIn('worker process stopped', state['last_error'])
+
+        session = playback.resume_playback(self.flight)
+        self.assertEqual(session.status, 'running')
+        self.engine.return_value.schedule.assert_called_once_with(self.flight.id, session.run_token)
@@ -13,12 +13,29 @@ urlpatterns = [
     path('flight/<int:flight_pk>/event/<int:event_pk>/edit/', views.edit_event, name='edit-event'),
     path('flight/<int:flight_pk>/event-form/', views.get_event_form, name='get-event-form'),
     path('flight/<int:flight_pk>/get-event/', views.get_event, name='get-event'),
+    path('flight/<int:flight_pk>/events/', views.list_events, name='list-events'),
     path('flight/<int:flight_pk>/get-event-with-fid/', views.get_event_with_fid, name='get-event-with-fid'),
+    path('flight/<int:pk>/playback/', views.playback_status, name='playback-status'),
+    path('flight/<int:pk>/playback/stream/', views.playback_stream, name='playback-stream'),
+    path('flight/<int:pk>/playback/start/', views.playback_control, {'action': 'start'}, name='playback-start'),
+    path('flight/<int:pk>/playback/pause/', views.playback_control, {'action': 'pause'}, name='playback-pause'),
+    path('flight/<int:pk>/playback/resume/', views.playback_control, {'action': 'resume'}, name='playback-resume'),
+    path('flight/<int:pk>/playback/abort/', views.playback_control, {'action': 'abort'}, name='playback-abort'),
     path('flight/<int:flight_pk>/delete-all-events/', views.delete_all_events, name='delete-all-events'),
     path('flight/<int:flight_id>/run-cleanup/', views.run_cleanup_query, name='run-cleanup'),
+    path('flight/<int:pk>/capture-snapshot/', views.capture_cleanup_snapshot, name='capture-snapshot'),
     path('produce-kafka-event/', views.produce_kafka_event, name='produce-kafka-event'),
+    path('flight/<int:pk>/publish-kafka/', views.publish_flight_to_kafka, name='publish-flight-kafka'),
     path('api/flight', api_views.flight_query, name='api-flight-query'),
     path('api/addflightpush', api_views.add_flight_push, name='api-flight-push'),
+    path('api/ingest', api_views.ingest_events, name='api-ingest-events'),
+    path('api/sessions/start', api_views.start_sessions_api, name='api-start-sessions'),
+    path('api/sessions/summary', api_views.sessions_summary, name='api-sessions-summary'),
+    path('api/play-history/summary', api_views.play_history_summary, name='api-play-history-summary'),
+    path('api/cache-stats', api_views.cache_stats, name='api-cache-stats'),
+    path('api/kafka-stats', api_views.kafka_stats, name='api-kafka-stats'),
+    path('api/http-client-stats', api_views.http_client_stats, name='api-http-client-stats'),
+    path('api/db-pool-stats', api_views.db_pool_stats, name='api-db-pool-stats'),
     path('api/transform-payload/', views.transform_payload, name='transform-payload'),
     path('api/proxy-request/', views.proxy_api_request, name='proxy-api-request'),
 ] 
\ No newline at end of file
@@ -2,26 +2,34 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.views.generic import ListView, CreateView
 from django.contrib import messages
 from django.urls import reverse_lazy
-from django.http import JsonResponse
-from django.db import connection, transaction
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+from django.db import transaction
+import aiohttp
+import asyncio
 import json
-import time
 import requests
-import csv
-import io
-from datetime import datetime
-from .models import Flight, FlightEvent, MockConfiguration, AdditionalTask
+import time
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from .models import Flight, FlightEvent, MockConfiguration, AdditionalTask, PlaybackSession
 from .forms import FlightForm, FlightEventForm, MockConfigurationForm, AdditionalTaskForm
+from . import api_cache, history, http_client, io_logging, kafka_avro, kafka_producers
+from .importers import read_csv_rows, sort_by_ingestion_time, insert_flight_events
+from .kafka_publish import publish_flight_events
+from .cleanup import CleanupError, execute_cleanup
+from .snapshots import SnapshotError, capture_snapshot
+from .sessions import prepare_session
+from .progress import stream_progress, stream_progress_sync
+from .callbacks import build_callback_payload, get_callback_timeout, send_callback
+from .playback import (
+    PlaybackError, start_playback, pause_playback, resume_playback, abort_playback, get_playback_state,
+    advance_cursor, reset_cursor
+)
 from django.db import models
-import psycopg2
 from django.conf import settings
+from django.utils import timezone
 from django.views.decorators.http import require_http_methods
-from confluent_kafka import Producer
-from confluent_kafka.schema_registry import SchemaRegistryClient
-from confluent_kafka.schema_registry.avro import AvroSerializer
-import socket
 import logging
-from django.views.decorators.csrf import csrf_protect
 
 # Get logger instance
 logger = logging.getLogger(__name__)
@@ -62,11 +70,17 @@ class FlightCreateView(CreateView):
         messages.error(self.request, 'Please correct the errors below')
         return super().form_invalid(form)
 
+def events_changed(flight):
+    """Refresh data derived from a flight's events after they were added, edited, imported or deleted."""
+    flight.refresh_fid_pointer()
+    flight.refresh_priority_bounds()
+    api_cache.invalidate_flight(flight)
+
 def flight_detail(request, pk):
     flight = get_object_or_404(Flight, pk=pk)
     events = flight.events.all().order_by('priority', 'created_at')
     config = MockConfiguration.objects.filter(flight=flight).first()
-    current_priority = events.filter(is_played=True).order_by('-priority').values_list('priority', flat=True).first() or 0
+    current_priority = PlaybackSession.objects.filter(flight=flight).values_list('last_priority', flat=True).first() or 0
     
     if request.method == 'POST':
         if 'start_mock' in request.POST:
@@ -77,7 +91,8 @@ def flight_detail(request, pk):
             return abort_mock_session(request, flight)
         elif 'reset_mock' in request.POST:
             try:
-                flight.events.all().update(is_played=False)
+                abort_playback(flight)
+                reset_cursor(flight)
                 return JsonResponse({
                     'status': 'success',
                     'message': 'Mock session reset successfully'
@@ -111,31 +126,13 @@ def flight_detail(request, pk):
                 return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
         elif 'run_cleanup' in request.POST:
             try:
-                # Get the cleanup query or use default if empty
+                # Get the cleanup query; the executor falls back to the default query if empty
                 cleanup_query = request.POST.get('cleanup_query', '').strip()
-                if not cleanup_query:
-                    cleanup_query = "DELETE FROM flight_status WHERE flight_unique_id = '{flight_unique_id}'"
-                
-                # Split queries by semicolon and filter out empty ones
-                queries = [q.strip() for q in cleanup_query.split(';') if q.strip()]
-                success_count = 0
-                
-                with connection.cursor() as cursor:
-                    for query in queries:
-                        try:
-                            # Format the query with flight_unique_id
-                            formatted_query = query.format(flight_unique_id=flight.flight_unique_id)
-                            cursor.execute(formatted_query)
-                            success_count += 1
-                        except Exception as e:
-                            return JsonResponse({
-                                'status': 'error',
-                                'message': f'Query failed: {str(e)}'
-                            }, status=400)
-                
+                result = execute_cleanup(cleanup_query, flight.flight_unique_id)
                 return JsonResponse({
                     'status': 'success',
-                    'message': f'Successfully executed {success_count} queries'
+                    'message': f"Successfully executed {len(result['statements'])} queries",
+                    'statements': result['statements']
                 })
             except Exception as e:
                 return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
@@ -160,22 +157,12 @@ def add_event(request, pk):
             event = form.save(commit=False)
             event.flight = flight
             
-            # Handle priority assignment
-            requested_priority = event.priority
-            max_priority = flight.events.aggregate(models.Max('priority'))['priority__max'] or 0
-            
-            if requested_priority == 0:  # If no priority specified
-                event.priority = max_priority + 1
-            elif requested_priority > max_priority:  # If higher priority specified
-                event.priority = requested_priority
-            else:  # If existing priority specified
-                # Shift all events with same or higher priority up by 1
-                flight.events.filter(priority__gte=requested_priority).update(
-                    priority=models.F('priority') + 1
-                )
-                event.priority = requested_priority
-            
-            event.save()
+            with transaction.atomic():
+                # Serialize inserts into this flight so two of them never pick the same free priority
+                Flight.objects.select_for_update().filter(pk=flight.pk).first()
+                event.priority = flight.allocate_priority(event.priority)
+                event.save()
+            events_changed(flight)
             messages.success(request, 'Event added successfully')
             return redirect('flight-detail', pk=pk)
         else:
@@ -205,11 +192,10 @@ def play_specific_event(request, flight):
                 }
             }, status=400)
             
-        # Get the minimum priority event
-        min_priority = flight.events.aggregate(models.Min('priority'))['priority__min']
-        
-        # Check if we can play this event based on priority
-        current_priority = flight.events.filter(is_played=True).order_by('-priority').values_list('priority', flat=True).first() or 0
+        # The session holds the playback cursor and the flight's lowest priority, so no event scan is needed
+        session = PlaybackSession.objects.filter(flight=flight).first()
+        min_priority = session.min_priority if session else None
+        current_priority = (session.last_priority if session else None) or 0
         
         # Allow replay of first event or if priority is valid
         if not is_replay and event.priority < current_priority and event.priority != min_priority:
@@ -218,7 +204,7 @@ def play_specific_event(request, flight):
                 'message': 'Cannot play this event. Events must be played in sequence.',
                 'details': {
                     'event_id': event_id,
-                    'is_played': event.is_played,
+                    'is_played': event.priority <= current_priority,
                     'event_priority': event.priority,
                     'current_priority': current_priority,
                     'min_priority': min_priority,
@@ -226,34 +212,20 @@ def play_specific_event(request, flight):
                 }
             }, status=400)
         
-        # Parse raw event and send it
-        try:
-            event_data = json.loads(event.raw_event)
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse JSON for event {event.id}: {str(e)}")
+        # Events are parsed when written; only rows that never parsed have no event_data
+        event_data = event.event_data
+        if event_data is None:
+            logger.error(f"Event {event.id} has no parsed event data (invalid JSON)")
             return JsonResponse({
                 'status': 'error',
                 'message': 'Failed to parse event data. Invalid JSON format.',
                 'details': {
-                    'error': str(e),
                     'raw_event': event.raw_event[:500]  # First 500 chars for debugging
                 }
             }, status=400)
             
         # Ensure the payload sent to the callback is always a list
-        payload_to_send = None
-        if isinstance(event_data, dict):
-            # If the parsed data is an object {}, wrap it in a list [{}]
-            payload_to_send = [event_data]
-            logger.info(f"Wrapping event data object into a list for callback event {event.id}")
-        elif isinstance(event_data, list):
-            # If it's already a list [...], use it directly
-            payload_to_send = event_data
-            logger.info(f"Using existing list payload for callback event {event.id}")
-        else:
-            # Handle unexpected types - log a warning and attempt to send wrapped in a list
-            logger.warning(f"Unexpected type for event_data for event {event.id}: {type(event_data)}. Wrapping in list before sending.")
-            payload_to_send = [event_data]
+        payload_to_send = build_callback_payload(event_data, event.id)
             
         if not config.callback_url:
             return JsonResponse({
@@ -265,43 +237,13 @@ def play_specific_event(request, flight):
                 }
             }, status=400)
             
+        timeout = get_callback_timeout()
+        sent_at = timezone.now()
+        started = time.perf_counter()
         try:
-            # Get timeout from settings or use default
-            timeout = getattr(settings, 'API_TIMEOUT_MS', 15000) / 1000  # Convert to seconds
-            
-            # Log request details before sending
-            logger.info(f"---> Sending callback for event {event.id} to URL: {config.callback_url}")
-            try:
-                # Log payload (use payload_to_send)
-                payload_json_str = json.dumps(payload_to_send, indent=2)
-                logger.info(f"Callback payload for event {event.id}:\n{payload_json_str}")
-            except Exception as json_err:
-                logger.error(f"Error formatting payload as JSON for logging: {json_err}")
-                logger.info(f"Callback payload (raw) for event {event.id}: {payload_to_send}")
-
-            response = requests.post(
-                config.callback_url,
-                json=payload_to_send, # Use the modified payload_to_send
-                timeout=timeout
-            )
-            
-            # Log response status
-            logger.info(f"<--- Callback response status for event {event.id}: {response.status_code}")
-            
-            # Log response body
-            try:
-                response_json = response.json()
-                response_json_str = json.dumps(response_json, indent=2)
-                logger.info(f"Callback response JSON for event {event.id}:\n{response_json_str}")
-            except json.JSONDecodeError:
-                # Log as text if not JSON
-                response_text = response.text
-                logger.info(f"Callback response text (first 500 chars) for event {event.id}:\n{response_text[:500]}{'...' if len(response_text) > 500 else ''}")
-            except Exception as resp_log_err:
-                logger.error(f"Error logging response body: {resp_log_err}")
-
-            response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
+            response = send_callback(config.callback_url, payload_to_send, event.id)
         except requests.Timeout as e:
+            history.record_play(flight.id, 'manual', [event], sent_at, time.perf_counter() - started, error=e)
             logger.error(f"Callback request for event {event.id} timed out (URL: {config.callback_url}): {str(e)}")
             return JsonResponse({
                 'status': 'error',
@@ -312,6 +254,7 @@ def play_specific_event(request, flight):
                 }
             }, status=504)  # Gateway Timeout
         except requests.ConnectionError as e:
+            history.record_play(flight.id, 'manual', [event], sent_at, time.perf_counter() - started, error=e)
             logger.error(f"Callback request for event {event.id} failed to connect (URL: {config.callback_url}): {str(e)}")
             return JsonResponse({
                 'status': 'error',
@@ -321,6 +264,7 @@ def play_specific_event(request, flight):
                 }
             }, status=503)  # Service Unavailable
         except requests.RequestException as e:
+            history.record_play(flight.id, 'manual', [event], sent_at, time.perf_counter() - started, error=e)
             # Log the error and the response if available
             error_response_text = e.response.text[:500] + ('...' if len(e.response.text) > 500 else '') if e.response else "No response received"
             logger.error(f"Callback request failed for event {event.id} (URL: {config.callback_url}): {str(e)}\nResponse: {error_response_text}")
@@ -332,23 +276,20 @@ def play_specific_event(request, flight):
                     'url': config.callback_url,
                 }
             }, status=500)
+
+        history.record_play(flight.id, 'manual', [event], sent_at, time.perf_counter() - started, response=response)
             
-        # If this is a replay, don't update the event state
-        if not is_replay:
-            event.is_played = True
-            event.save()
+        # A replay leaves the cursor alone, and so does an event played ahead of the next one
+        # (it is in the play history, but the events before it stay unplayed)
+        cursor_advanced = not is_replay and advance_cursor(flight, event.priority)
         
         # Get next event if in fast forward mode
         next_event = None
         if config.fast_forward and not config.manual_mode:
             next_event = flight.events.filter(
-                is_played=False,
                 priority__gt=event.priority
             ).order_by('priority').first()
         
-        if not config.manual_mode and not config.fast_forward:
-            time.sleep(config.delay_between_events)
-            
         response_data = {
             'status': 'success',
             'message': 'Event played successfully',
@@ -356,8 +297,11 @@ def play_specific_event(request, flight):
             'identified_changes': event.identified_changes,
             'flight_state': event.flight_state,
             'priority': event.priority,
-            'is_replay': is_replay
+            'is_replay': is_replay,
+            'cursor_advanced': cursor_advanced
         }
+        if not is_replay and not cursor_advanced:
+            response_data['message'] = 'Event played out of order; earlier events are still pending'
         
         # Add next event info if available
         if next_event:
@@ -381,10 +325,54 @@ def play_specific_event(request, flight):
             }
         }, status=500)
 
+PLAYBACK_ACTIONS = {
+    'start': (start_playback, 'Playback started'),
+    'pause': (pause_playback, 'Playback paused'),
+    'resume': (resume_playback, 'Playback resumed'),
+    'abort': (abort_playback, 'Playback aborted'),
+}
+
+def playback_status(request, pk):
+    flight = get_object_or_404(Flight, pk=pk)
+    return JsonResponse({
+        'status': 'success',
+        'playback': get_playback_state(flight)
+    })
+
+async def playback_stream(request, pk):
+    """Server-Sent Events with the flight's session state, played events and callback latency."""
+    if not await Flight.objects.filter(pk=pk).aexists():
+        raise Http404('Flight not found')
+    # Observers share one poller per flight under ASGI; WSGI streams poll on their own
+    content = stream_progress(pk) if isinstance(request, ASGIRequest) else stream_progress_sync(pk)
+    response = StreamingHttpResponse(content, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Keep nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@require_http_methods(["POST"])
+def playback_control(request, pk, action):
+    flight = get_object_or_404(Flight, pk=pk)
+    handler, message = PLAYBACK_ACTIONS[action]
+    try:
+        handler(flight)
+    except PlaybackError as e:
+        return JsonResponse({
+            'status': 'error',
+            'message': str(e),
+            'playback': get_playback_state(flight)
+        }, status=400)
+    return JsonResponse({
+        'status': 'success',
+        'message': message,
+        'playback': get_playback_state(flight)
+    })
+
 def reset_mock_session(request, flight):
     try:
         # Reset all events to unplayed
-        flight.events.all().update(is_played=False)
+        reset_cursor(flight)
         
         # Run cleanup queries and capture any errors
         try:
@@ -437,64 +425,7 @@ def abort_mock_session(request, flight):
 
 # Internal version of start_mock_session that doesn't redirect
 def start_mock_session_internal(request, flight):
-    config = get_object_or_404(MockConfiguration, flight=flight)
-    
-    # Run custom cleanup query if provided, otherwise run the default query
-    if config.cleanup_query:
-        # Split queries by semicolon and filter out empty ones
-        queries = [q.strip() for q in config.cleanup_query.split(';') if q.strip()]
-        
-        if config.use_custom_db and all([config.db_host, config.db_name, config.db_user, config.db_password]):
-            # Create a new connection to the custom database
-            custom_conn = psycopg2.connect(
-                host=config.db_host,
-                port=config.db_port or "5432",
-                database=config.db_name,
-                user=config.db_user,
-                password=config.db_password
-            )
-            
-            success_count = 0
-            with custom_conn.cursor() as cursor:
-                for query in queries:
-                    try:
-                        formatted_query = query.format(flight_unique_id=flight.flight_unique_id)
-                        cursor.execute(formatted_query)
-                        success_count += 1
-                    except Exception as e:
-                        error_msg = str(e).split('LINE')[0].strip()
-                        raise Exception(f'Query failed: {error_msg}')
-            
-            custom_conn.commit()
-            custom_conn.close()
-        else:
-            # Use the default database connection
-            success_count = 0
-            with connection.cursor() as cursor:
-                for query in queries:
-                    try:
-                        formatted_query = query.format(flight_unique_id=flight.flight_unique_id)
-                        cursor.execute(formatted_query)
-                        success_count += 1
-                    except Exception as e:
-                        error_msg = str(e).split('LINE')[0].strip()
-                        raise Exception(f'Query failed: {error_msg}')
-    else:
-        # Run the default cleanup query
-        default_query = "DELETE FROM flight_status WHERE flight_unique_id = '{flight_unique_id}'"
-        with connection.cursor() as cursor:
-            cursor.execute(default_query.format(flight_unique_id=flight.flight_unique_id))
-
-    # Reset all events to unplayed
-    flight.events.all().update(is_played=False)
-    
-    # Execute pre-mock tasks
-    for task in config.tasks.filter(is_enabled=True).order_by('order'):
-        try:
-            execute_additional_task(task)
-        except Exception as e:
-            raise Exception(f'Task {task.name} failed: {str(e)}')
-    
+    prepare_session(flight)
     return True
 
 def start_mock_session(request, flight):
@@ -511,21 +442,6 @@ def start_mock_session(request, flight):
     
     return redirect('flight-detail', pk=flight.pk)
 
-def execute_additional_task(task):
-    payload = json.loads(task.payload_template)
-    if task.task_type == 'kafka':
-        # Implement Kafka producer logic here
-        # You would typically use kafka-python or confluent-kafka here
-        pass
-    elif task.task_type == 'api':
-        response = requests.post(
-            payload.get('url'),
-            json=payload.get('body'),
-            headers=payload.get('headers', {}),
-            timeout=5
-        )
-        response.raise_for_status()
-
 def get_event_form(request, flight_pk):
     event_id = request.GET.get('event_id')
     event = get_object_or_404(FlightEvent, id=event_id, flight_id=flight_pk)
@@ -545,34 +461,24 @@ def import_events(request, pk):
         return redirect('flight-detail', pk=pk)
     
     try:
-        # Process either the uploaded file or pasted content
-        if csv_file:
-            csv_data = csv_file.read().decode('utf-8')
-        else:
-            csv_data = csv_content
-        
-        # Parse CSV data
-        csv_io = io.StringIO(csv_data)
-        reader = csv.DictReader(csv_io)
-        
-        # Sort rows by ingestion_time
-        rows = sorted(reader, key=lambda x: datetime.strptime(x['ingestion_time'], '%Y-%m-%dT%H:%M:%S'))
+        started = time.perf_counter()
+        # Stream rows from the uploaded file or pasted content, ordered by ingestion_time
+        event_rows = sort_by_ingestion_time(read_csv_rows(csv_file or csv_content))
         
         with transaction.atomic():
             # Delete existing events for this flight
             flight.events.all().delete()
             
             # Create events with priorities based on sorted order
-            for priority, row in enumerate(rows, start=1):
-                FlightEvent.objects.create(
-                    flight=flight,
-                    raw_event=row['raw_event_json'],
-                    identified_changes=row['identified_changes'],
-                    flight_state=row['flight_state'],
-                    priority=priority
-                )
+            imported = insert_flight_events(flight, event_rows)
+            # The new events have not been played
+            reset_cursor(flight)
         
-        messages.success(request, f'Successfully imported {len(rows)} events')
+        elapsed = time.perf_counter() - started
+        rate = imported / elapsed if elapsed > 0 else imported
+        logger.info(f"Imported {imported} events for flight {flight.flight_unique_id} in {elapsed:.2f}s ({rate:.0f} rows/s)")
+        events_changed(flight)
+        messages.success(request, f'Successfully imported {imported} events in {elapsed:.2f}s ({rate:.0f} rows/s)')
         
     except Exception as e:
         messages.error(request, f'Error importing CSV: {str(e)}')
@@ -594,6 +500,7 @@ def delete_event(request, flight_pk, event_pk):
     event = get_object_or_404(FlightEvent, id=event_pk, flight_id=flight_pk)
     if request.method == 'POST':
         event.delete()
+        events_changed(event.flight)
         messages.success(request, 'Event has been deleted')
     return redirect('flight-detail', pk=flight_pk)
 
@@ -602,7 +509,15 @@ def edit_event(request, flight_pk, event_pk):
     if request.method == 'POST':
         form = FlightEventForm(request.POST, instance=event)
         if form.is_valid():
-            form.save()
+            event = form.save(commit=False)
+            with transaction.atomic():
+                # Same row lock as add_event, so a moved event never shares a priority with another one
+                Flight.objects.select_for_update().filter(pk=flight_pk).first()
+                current_priority = FlightEvent.objects.filter(pk=event.pk).values_list('priority', flat=True).first()
+                if event.priority != current_priority:
+                    event.priority = event.flight.allocate_priority(event.priority)
+                event.save()
+            events_changed(event.flight)
             messages.success(request, 'Event has been updated')
         else:
             messages.error(request, 'Error updating event')
@@ -612,13 +527,8 @@ def get_event(request, flight_pk):
     event_id = request.GET.get('event_id')
     event = get_object_or_404(FlightEvent, id=event_id, flight_id=flight_pk)
     
-    # Try to parse raw_event if it's a string
-    raw_event = event.raw_event
-    try:
-        if isinstance(raw_event, str):
-            raw_event = json.loads(raw_event)
-    except json.JSONDecodeError:
-        pass  # Keep original raw_event if parsing fails
+    # Serve the parsed form; fall back to the raw text for rows that never parsed
+    raw_event = event.event_data if event.event_data is not None else event.raw_event
     
     return JsonResponse({
         'raw_event': raw_event,
@@ -627,33 +537,102 @@ def get_event(request, flight_pk):
         'priority': event.priority
     })
 
-def get_event_with_fid(request, flight_pk):
+# Fields the bulk event endpoint can return
+EVENT_LIST_FIELDS = {
+    'id', 'priority', 'flight_state', 'identified_changes', 'raw_event',
+    'is_played', 'has_fid', 'is_first_nav_tracking', 'created_at',
+}
+EVENT_LIST_DEFAULT_FIELDS = ['id', 'priority', 'flight_state', 'identified_changes', 'is_played']
+
+def list_events(request, flight_pk):
+    """
+    Return selected fields of many events of a flight in priority order.
+    Query params:
+    - fields: Comma-separated fields (default: id, priority, flight_state, identified_changes, is_played)
+    - has_fid, unplayed, first_nav_tracking: 1 to keep only matching events (has_fid=0 for events without fid)
+    - state: Exact flight_state
+    - changes: Text identified_changes must contain (case-insensitive)
+    - min_priority, max_priority: Inclusive priority range
+    - limit: Page size (default 100, max 1000)
+    - cursor: next_cursor of the previous page
+    """
     flight = get_object_or_404(Flight, pk=flight_pk)
+    params = request.GET
+
+    fields = [field.strip() for field in params.get('fields', '').split(',') if field.strip()] or EVENT_LIST_DEFAULT_FIELDS
+    unknown = [field for field in fields if field not in EVENT_LIST_FIELDS]
+    if unknown:
+        return JsonResponse({'status': 'error', 'message': f'Unknown fields: {", ".join(unknown)}'}, status=400)
+
+    events = flight.events.all()
+    # Events at or below the session's playback cursor count as played
+    played_priority = PlaybackSession.objects.filter(flight=flight).values_list('last_priority', flat=True).first()
+    try:
+        if params.get('has_fid') in ('0', '1'):
+            events = events.filter(has_fid=params['has_fid'] == '1')
+        if params.get('unplayed') == '1' and played_priority is not None:
+            events = events.filter(priority__gt=played_priority)
+        if params.get('first_nav_tracking') == '1':
+            events = events.filter(is_first_nav_tracking=True)
+        if params.get('state'):
+            events = events.filter(flight_state=params['state'])
+        if params.get('changes'):
+            events = events.filter(identified_changes__icontains=params['changes'])
+        if params.get('min_priority'):
+            events = events.filter(priority__gte=int(params['min_priority']))
+        if params.get('max_priority'):
+            events = events.filter(priority__lte=int(params['max_priority']))
+        limit = min(max(int(params.get('limit', 100)), 1), 1000)
+        if params.get('cursor'):
+            # Keyset pagination: continue after the (priority, id) of the previous page's last event
+            cursor_priority, cursor_id = (int(value) for value in params['cursor'].split(':'))
+            events = events.filter(
+                models.Q(priority__gt=cursor_priority) | models.Q(priority=cursor_priority, id__gt=cursor_id)
+            )
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Invalid numeric parameter or cursor'}, status=400)
+
+    # Load only the columns needed for the requested fields and the cursor
+    columns = {'id', 'priority'} | {'event_data' if field == 'raw_event' else field for field in fields if field != 'is_played'}
+    if 'raw_event' in fields:
+        columns.add('raw_event')
+    page = list(events.order_by('priority', 'id').only(*columns)[:limit + 1])
+
+    results = []
+    for event in page[:limit]:
+        item = {}
+        for field in fields:
+            if field == 'raw_event':
+                # Serve the parsed form; fall back to the raw text for rows that never parsed
+                item[field] = event.event_data if event.event_data is not None else event.raw_event
+            elif field == 'is_played':
+                item[field] = played_priority is not None and event.priority <= played_priority
+            else:
+                item[field] = getattr(event, field)
+        results.append(item)
+
+    next_cursor = f'{page[limit - 1].priority}:{page[limit - 1].id}' if len(page) > limit else None
+    return JsonResponse({'status': 'success', 'events': results, 'next_cursor': next_cursor})
+
+def get_event_with_fid(request, flight_pk):
+    # The first event with an fid is tracked on the flight whenever events are written
+    flight = get_object_or_404(Flight.objects.select_related('fid_event'), pk=flight_pk)
+    event = flight.fid_event
     
-    # Get all events sorted by priority
-    events = flight.events.all().order_by('priority')
-    
-    for event in events:
-        try:
-            raw_event = event.raw_event
-            if isinstance(raw_event, str):
-                raw_event = json.loads(raw_event)
-            
-            if isinstance(raw_event, dict) and 'fid' in raw_event:
-                return JsonResponse({
-                    'raw_event': raw_event,
-                    'identified_changes': event.identified_changes,
-                    'flight_state': event.flight_state,
-                    'priority': event.priority,
-                    'event_id': event.id
-                })
-        except json.JSONDecodeError:
-            continue
+    if event is None:
+        return JsonResponse({
+            'error': 'No event with fid field found',
+            'status': 'error'
+        }, status=404)
     
     return JsonResponse({
-        'error': 'No event with fid field found',
-        'status': 'error'
-    }, status=404)
+        'raw_event': event.event_data,
+        'identified_changes': event.identified_changes,
+        'flight_state': event.flight_state,
+        'priority': event.priority,
+        'event_id': event.id,
+        'fid': flight.fid
+    })
 
 def run_cleanup_query(request, flight_id):
     if request.method == 'POST':
@@ -670,84 +649,28 @@ def run_cleanup_query(request, flight_id):
         # Update parameter name to match what's sent from client
         cleanup_query = request.POST.get('cleanup_query', '').strip()
         
-        # If no query is provided, use the default query
-        if not cleanup_query:
-            cleanup_query = "DELETE FROM flight_status WHERE flight_unique_id = '{flight_unique_id}'"
-        
         try:
-            # Split queries by semicolon and filter out empty ones
-            queries = [q.strip() for q in cleanup_query.split(';') if q.strip()]
-            success_count = 0
+            # All statements run in one transaction; an empty query runs the default one
+            result = execute_cleanup(cleanup_query, flight.flight_unique_id, config)
+            return JsonResponse({
+                'status': 'success',
+                'message': f"Successfully executed all {len(result['statements'])} queries",
+                'statements': result['statements'],
+                'total_ms': result['total_ms']
+            })
+        except CleanupError as e:
             failed_queries = []
-            
-            # Check if custom DB should be used
-            if config.use_custom_db and all([config.db_host, config.db_name, config.db_user, config.db_password]):
-                # Create a new connection to the custom database
-                custom_conn = psycopg2.connect(
-                    host=config.db_host,
-                    port=config.db_port or "5432",
-                    database=config.db_name,
-                    user=config.db_user,
-                    password=config.db_password
-                )
-                
-                try:
-                    with custom_conn.cursor() as cursor:
-                        for i, query in enumerate(queries):
-                            try:
-                                # Format the query with flight_unique_id
-                                formatted_query = query.format(flight_unique_id=flight.flight_unique_id)
-                                cursor.execute(formatted_query)
-                                success_count += 1
-                            except Exception as e:
-                                failed_queries.append({
-                                    'query_index': i,
-                                    'query': query,
-                                    'error': str(e).split("LINE")[0].strip()
-                                })
-                                # Continue with next query instead of stopping
-                    
-                    # Commit changes to the custom database
-                    custom_conn.commit()
-                finally:
-                    # Ensure the connection is closed even if an exception occurs
-                    custom_conn.close()
-            else:
-                # Use the default database connection
-                with connection.cursor() as cursor:
-                    for i, query in enumerate(queries):
-                        try:
-                            # Format the query with flight_unique_id
-                            formatted_query = query.format(flight_unique_id=flight.flight_unique_id)
-                            cursor.execute(formatted_query)
-                            success_count += 1
-                        except Exception as e:
-                            failed_queries.append({
-                                'query_index': i,
-                                'query': query,
-                                'error': str(e).split("LINE")[0].strip()
-                            })
-                            # Continue with next query instead of stopping
-            
-            # Construct response message
-            if success_count == len(queries):
-                return JsonResponse({
-                    'status': 'success',
-                    'message': f'Successfully executed all {success_count} queries'
+            if e.index is not None:
+                failed_queries.append({
+                    'query_index': e.index,
+                    'query': e.query,
+                    'error': str(e)
                 })
-            elif success_count > 0:
-                return JsonResponse({
-                    'status': 'partial_success',
-                    'message': f'Executed {success_count} of {len(queries)} queries successfully',
-                    'failed_queries': failed_queries
-                })
-            else:
-                return JsonResponse({
-                    'status': 'error',
-                    'message': 'All queries failed',
-                    'failed_queries': failed_queries
-                }, status=500)
-                
+            return JsonResponse({
+                'status': 'error',
+                'message': f'{str(e)}. No changes were applied',
+                'failed_queries': failed_queries
+            }, status=500)
         except Exception as e:
             return JsonResponse({
                 'status': 'error',
@@ -759,29 +682,54 @@ def run_cleanup_query(request, flight_id):
             'message': 'Only POST method is allowed'
         }, status=405)
 
+@require_http_methods(["POST"])
+def capture_cleanup_snapshot(request, pk):
+    """
+    Capture the current contents of the configured snapshot tables as the baseline
+    restored by the snapshot reset strategy.
+    """
+    flight = get_object_or_404(Flight, pk=pk)
+    config = MockConfiguration.objects.filter(flight=flight).first()
+    if not config:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'No configuration found for this flight'
+        }, status=400)
+
+    try:
+        result = capture_snapshot(config)
+        return JsonResponse({
+            'status': 'success',
+            'message': f"Captured snapshot of {result['tables']} tables in {result['total_ms']} ms",
+            **result
+        })
+    except SnapshotError as e:
+        logger.error(f"Snapshot capture for {flight.flight_unique_id} failed: {str(e)}")
+        return JsonResponse({
+            'status': 'error',
+            'message': str(e)
+        }, status=400)
+
 def delete_all_events(request, flight_pk):
     flight = get_object_or_404(Flight, pk=flight_pk)
     if request.method == 'POST':
         flight.events.all().delete()
+        events_changed(flight)
         messages.success(request, 'All events have been deleted')
     return redirect('flight-detail', pk=flight_pk)
 
 @require_http_methods(["POST"])
 def produce_kafka_event(request):
     try:
-        logger.info("Starting Kafka event production")
-        
         data = json.loads(request.body)
-        logger.info(f"Received data: {data}")
         
         bootstrap_servers = data.get('bootstrapServers')
         topic_name = data.get('topicName')
         payload = data.get('payload')
 
-        logger.info(f"Bootstrap servers: {bootstrap_servers}")
-        logger.info(f"Topic name: {topic_name}")
-        logger.info(f"Payload type: {type(payload)}")
-        logger.info(f"Raw payload: {payload}")
+        logger.info(f"Producing Kafka event to {topic_name} on {bootstrap_servers} ({len(request.body)} byte request)")
+        if io_logging.sample(logger):
+            logger.info("Kafka payload for %s:\n%s", topic_name, io_logging.Body(payload))
 
         if not all([bootstrap_servers, topic_name, payload]):
             return JsonResponse({
@@ -789,54 +737,57 @@ def produce_kafka_event(request):
                 'message': 'Missing required fields'
             }, status=400)
 
-        # Basic Kafka producer configuration
-        conf = {
-            'bootstrap.servers': bootstrap_servers,
-            'client.id': socket.gethostname()
-        }
-
         try:
             # Parse payload if it's a string
             message_payload = json.loads(payload) if isinstance(payload, str) else payload
-            logger.info(f"Parsed message payload type: {type(message_payload)}")
             
             # Convert dict to JSON string and then to bytes
             message_bytes = json.dumps(message_payload).encode('utf-8')
-            logger.info(f"Message bytes type: {type(message_bytes)}")
-            
-            # Create producer instance
-            producer = Producer(conf)
+            json_size = len(message_bytes)
             
-            # Delivery callback
-            def delivery_callback(err, msg):
-                if err:
-                    logger.error(f"Message delivery failed: {str(err)}")
-                    return JsonResponse({
-                        'status': 'error',
-                        'message': f'Message delivery failed: {str(err)}'
-                    }, status=500)
-                else:
-                    logger.info(f"Message delivered to {msg.topic()} [{msg.partition()}]")
-
-            # Produce message
-            producer.produce(
-                topic=topic_name,
-                value=message_bytes,  # Use the bytes version of the message
-                callback=delivery_callback
-            )
+            encoding = 'json'
+            if 'schemaRegistryUrl' in data or 'schemaSubject' in data:
+                # Avro with the subject's cached schema (local schema file when no registry URL is given)
+                encoder = kafka_avro.get_encoder(
+                    data.get('schemaSubject') or kafka_avro.default_subject(topic_name),
+                    data.get('schemaRegistryUrl') or None
+                )
+                message_bytes = encoder.encode(message_payload)
+                encoding = 'avro'
+            logger.info(f"Encoded message as {encoding}: {len(message_bytes)} bytes")
             
-            # Wait for message delivery
-            producer.flush(timeout=10)
+            # Produce through the shared producer and wait for this message's delivery report only
+            delivery = kafka_producers.produce(bootstrap_servers, topic_name, message_bytes)
+            try:
+                msg = delivery.result(timeout=getattr(settings, 'KAFKA_DELIVERY_TIMEOUT', 10))
+            except FuturesTimeoutError:
+                logger.error(f"Timed out waiting for delivery report from {topic_name}")
+                return JsonResponse({
+                    'status': 'error',
+                    'message': 'Timed out waiting for the broker to acknowledge the event'
+                }, status=504)
             
             return JsonResponse({
                 'status': 'success',
                 'message': 'Event produced successfully',
                 'details': {
-                    'topic': topic_name,
-                    'timestamp': producer.flush()
+                    'topic': msg.topic(),
+                    'partition': msg.partition(),
+                    'offset': msg.offset(),
+                    'timestamp': msg.timestamp()[1],
+                    'encoding': encoding,
+                    'size_bytes': len(message_bytes),
+                    'json_size_bytes': json_size
                 }
             })
-            
+
+        except ValueError as e:
+            # Payload that is not JSON or does not match the Avro schema
+            logger.error(f"Invalid Kafka message: {str(e)}")
+            return JsonResponse({
+                'status': 'error',
+                'message': str(e)
+            }, status=400)
         except Exception as e:
             logger.error(f"Error producing message: {str(e)}", exc_info=True)
             return JsonResponse({
@@ -857,9 +808,64 @@ def produce_kafka_event(request):
             'message': str(e)
         }, status=500)
 
-@csrf_protect
 @require_http_methods(["POST"])
-def transform_payload(request):
+def publish_flight_to_kafka(request, pk):
+    """
+    Publish the flight's events (or a priority range of them) to a Kafka topic in one operation.
+    """
+    flight = get_object_or_404(Flight, pk=pk)
+    try:
+        data = json.loads(request.body)
+        bootstrap_servers = data.get('bootstrapServers')
+        topic_name = data.get('topicName')
+        if not bootstrap_servers or not topic_name:
+            return JsonResponse({
+                'status': 'error',
+                'message': 'Missing required fields'
+            }, status=400)
+
+        min_priority = int(data['minPriority']) if data.get('minPriority') not in (None, '') else None
+        max_priority = int(data['maxPriority']) if data.get('maxPriority') not in (None, '') else None
+        rate = float(data['rate']) if data.get('rate') not in (None, '') else None
+        avro_subject = None
+        if 'schemaRegistryUrl' in data or 'schemaSubject' in data:
+            avro_subject = data.get('schemaSubject') or kafka_avro.default_subject(topic_name)
+        summary = publish_flight_events(
+            flight,
+            bootstrap_servers,
+            topic_name,
+            min_priority=min_priority,
+            max_priority=max_priority,
+            key_strategy=data.get('keyStrategy') or 'none',
+            rate=rate,
+            avro_subject=avro_subject,
+            schema_registry_url=data.get('schemaRegistryUrl') or None
+        )
+    except (json.JSONDecodeError, ValueError) as e:
+        return JsonResponse({
+            'status': 'error',
+            'message': f'Invalid request: {str(e)}'
+        }, status=400)
+    except Exception as e:
+        logger.error(f"Error publishing flight {flight.flight_unique_id} to Kafka: {str(e)}", exc_info=True)
+        return JsonResponse({
+            'status': 'error',
+            'message': f'Failed to publish events: {str(e)}'
+        }, status=500)
+
+    if summary['messages'] == 0:
+        return JsonResponse({'status': 'error', 'message': 'No events in the selected range', **summary}, status=400)
+    if summary['delivered'] == summary['messages']:
+        status = 'success'
+    else:
+        status = 'partial' if summary['delivered'] else 'error'
+    return JsonResponse({'status': status, **summary})
+
+# The transform and proxy views are async: under ASGI a slow downstream service holds a socket, not a worker thread.
+# CSRF is still checked by CsrfViewMiddleware; the Django 4.2 view decorators cannot wrap async views.
+async def transform_payload(request):
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
     try:
         data = json.loads(request.body)
         raw_event = data.get('raw_event')
@@ -873,8 +879,10 @@ def transform_payload(request):
             
         # Make the request to the external API
         transform_url = f"{host_address}/nav/v1/internal/create-flight-detail-dto-v2"
-        response = requests.post(
+        response = await http_client.apost(
             transform_url,
+            # Under WSGI each async view gets an event loop of its own, which cannot keep the shared session
+            shared=isinstance(request, ASGIRequest),
             json=raw_event,
             headers={'Content-Type': 'application/json'},
             timeout=10  # 10 seconds timeout
@@ -893,12 +901,12 @@ def transform_payload(request):
                 status=502
             )
             
-    except requests.RequestException as e:
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         error_msg = str(e)
-        if 'ConnectionError' in error_msg:
-            error_msg = 'Could not connect to transformation service'
-        elif 'Timeout' in error_msg:
+        if isinstance(e, asyncio.TimeoutError):
             error_msg = 'Transformation service request timed out'
+        elif isinstance(e, aiohttp.ClientConnectionError):
+            error_msg = 'Could not connect to transformation service'
         return JsonResponse(
             {'message': f'Failed to reach transformation service: {error_msg}'}, 
             status=502
@@ -914,47 +922,49 @@ def transform_payload(request):
             status=500
         )
 
-@csrf_protect
-@require_http_methods(["POST"])
-def proxy_api_request(request):
+async def proxy_api_request(request):
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
     try:
-        print(">>> PROXY API REQUEST CALLED <<<")
         data = json.loads(request.body)
         payload = data.get('payload')
         target_url = data.get('url')
         headers = data.get('headers', {})
         
-        print(f"Proxying request to: {target_url}")
-        print(f"Headers: {headers}")
-        print(f"Payload: {payload}")
-        
         # Ensure all header values are strings
         string_headers = {str(k): str(v) for k, v in headers.items() if v is not None}
         
         if not payload or not target_url:
-            print("Missing required parameters")
+            logger.warning("Proxy request is missing payload or url")
             return JsonResponse(
                 {'message': 'Missing required parameters: payload or url'}, 
                 status=400
             )
         
+        # Header names only: values may hold credentials
+        logger.info(f"Proxying request to {target_url} (headers: {', '.join(string_headers) or 'none'})")
+        log_bodies = io_logging.sample(logger)
+        if log_bodies:
+            logger.info("Proxy payload for %s:\n%s", target_url, io_logging.Body(payload))
+        
         # Make the request to the external API
-        response = requests.post(
+        response = await http_client.apost(
             target_url,
+            shared=isinstance(request, ASGIRequest),
             json=payload if isinstance(payload, dict) else json.loads(payload),
             headers=string_headers, # Use stringified headers
             timeout=15  # 15 seconds timeout
         )
         
-        print(f"Response status code: {response.status_code}")
+        logger.info(f"Proxy response from {target_url}: {response.status_code} ({len(response.content)} bytes)")
+        if log_bodies:
+            logger.info("Proxy response from %s:\n%s", target_url, io_logging.Body(response.content))
         
         # Get the response content
         try:
             response_content = response.json()
-            print(f"Response content: {response_content}")
         except ValueError:
             response_content = {'text': response.text}
-            print(f"Text response content: {response.text[:200]}...")
         
         # Return the response with status code and headers
         return JsonResponse({
@@ -963,25 +973,25 @@ def proxy_api_request(request):
             'headers': dict(response.headers)
         })
         
-    except requests.RequestException as e:
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         error_msg = str(e)
-        print(f"Request exception: {error_msg}")
-        if 'ConnectionError' in error_msg:
-            error_msg = 'Could not connect to target service'
-        elif 'Timeout' in error_msg:
+        logger.error(f"Proxy request to {target_url} failed: {type(e).__name__} {error_msg}")
+        if isinstance(e, asyncio.TimeoutError):
             error_msg = 'Request timed out'
+        elif isinstance(e, aiohttp.ClientConnectionError):
+            error_msg = 'Could not connect to target service'
         return JsonResponse(
             {'message': f'Failed to reach target service: {error_msg}'}, 
             status=502
         )
     except ValueError as e:
-        print(f"Value error: {str(e)}")
+        logger.warning(f"Invalid proxy request: {str(e)}")
         return JsonResponse(
             {'message': f'Invalid JSON in request: {str(e)}'}, 
             status=400
         )
     except Exception as e:
-        print(f"Unexpected error: {str(e)}")
+        logger.error(f"Unexpected proxy error: {str(e)}", exc_info=True)
         return JsonResponse(
             {'message': f'Internal server error: {str(e)}'}, 
             status=500
@@ -54,7 +54,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',  # For static files in production
+    'event_manager.middleware.StaticFilesMiddleware',  # WhiteNoise static files for production, without forcing async views onto a thread
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -168,8 +168,10 @@ LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
     'handlers': {
+        # Request threads only queue records; a background thread formats and writes them
         'console': {
-            'class': 'logging.StreamHandler',
+            'class': 'event_manager.io_logging.BackgroundStreamHandler',
+            'queue_size': int(os.getenv('LOG_QUEUE_SIZE', 10000)),  # Records waiting to be written; more are dropped
         },
     },
     'root': {
@@ -186,3 +188,67 @@ HEALTH_CHECK = {
 
 # Add API timeout setting from .env file
 API_TIMEOUT_MS = int(os.getenv('API_TIMEOUT_MS', 15000))  # Default to 15000ms (15 seconds) if not set
+
+# Server-side playback engine: threads per worker process that send due events
+PLAYBACK_MAX_WORKERS = int(os.getenv('PLAYBACK_MAX_WORKERS', 4))
+
+# Shared outbound HTTP clients: requests for callbacks and API tasks, aiohttp for the async transform and proxy views
+HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', 10))  # Number of target hosts to keep pools for
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', 10))  # Keep-alive connections kept per host
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 5))  # Seconds to establish a connection
+HTTP_ASYNC_MAX_CONNECTIONS = int(os.getenv('HTTP_ASYNC_MAX_CONNECTIONS', 200))  # Async calls in flight at once per worker process; more wait for a connection
+PLAYBACK_MAX_BATCH = int(os.getenv('PLAYBACK_MAX_BATCH', 500))  # Upper bound on events coalesced into one callback
+PLAYBACK_HEARTBEAT_SECONDS = float(os.getenv('PLAYBACK_HEARTBEAT_SECONDS', 15))  # How often a worker process marks the sessions it is playing as alive
+PLAYBACK_STALE_SECONDS = float(os.getenv('PLAYBACK_STALE_SECONDS', 60))  # A running session without a heartbeat for this long lost its worker and is paused
+SESSION_START_WORKERS = int(os.getenv('SESSION_START_WORKERS', 8))  # Flights prepared in parallel when starting many sessions at once
+LOADGEN_MAX_CONCURRENCY = int(os.getenv('LOADGEN_MAX_CONCURRENCY', 64))  # Callbacks a load test keeps in flight at once
+PLAYBACK_STREAM_POLL_SECONDS = float(os.getenv('PLAYBACK_STREAM_POLL_SECONDS', 1))  # How often a watched flight's progress is read for its live stream
+PLAYBACK_STREAM_MAX_SECONDS = int(os.getenv('PLAYBACK_STREAM_MAX_SECONDS', 300))  # Live streams end after this and the browser reconnects
+PLAY_HISTORY_BATCH_SIZE = int(os.getenv('PLAY_HISTORY_BATCH_SIZE', 500))  # Play records written per bulk INSERT
+PLAY_HISTORY_FLUSH_SECONDS = float(os.getenv('PLAY_HISTORY_FLUSH_SECONDS', 2))  # Longest a play record waits in memory before it is written
+PLAY_HISTORY_MAX_BUFFER = int(os.getenv('PLAY_HISTORY_MAX_BUFFER', 50000))  # Play records kept waiting at most; more are dropped
+PAYLOAD_LOG_SAMPLE_RATE = float(os.getenv('PAYLOAD_LOG_SAMPLE_RATE', 0.1))  # Share of callback, proxy and Kafka calls whose bodies are logged
+PAYLOAD_LOG_MAX_CHARS = int(os.getenv('PAYLOAD_LOG_MAX_CHARS', 2000))  # Characters of a logged body before it is cut
+PAYLOAD_LOG_FULL = os.getenv('PAYLOAD_LOG_FULL', '0') == '1'  # Log every body in full and pretty-printed, for debugging
+
+# Cache shared by all worker processes (used for /api/flight responses).
+# Uses Redis when REDIS_URL is set, otherwise a database table created by `manage.py createcachetable`.
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'flight_mock_cache',
+        }
+    }
+API_CACHE_TIMEOUT = int(os.getenv('API_CACHE_TIMEOUT', 300))  # Seconds a cached /api/flight response is kept
+
+# Event import (CSV upload and multi-flight ingest)
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', 2000))  # Events inserted per bulk INSERT
+IMPORT_SORT_RUN_SIZE = int(os.getenv('IMPORT_SORT_RUN_SIZE', 50000))  # Rows sorted in memory before spilling to a temp file
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', 4))  # Worker processes used by multi-flight ingest
+
+# Shared Kafka producers (one per bootstrap server list and worker process)
+KAFKA_MESSAGE_TIMEOUT_MS = int(os.getenv('KAFKA_MESSAGE_TIMEOUT_MS', 30000))  # Time the producer keeps retrying a message
+KAFKA_DELIVERY_TIMEOUT = float(os.getenv('KAFKA_DELIVERY_TIMEOUT', 10))  # Seconds a request waits for its delivery report
+KAFKA_BULK_LINGER_MS = int(os.getenv('KAFKA_BULK_LINGER_MS', 50))  # Time a bulk publish waits to fill a batch
+KAFKA_BULK_BATCH_BYTES = int(os.getenv('KAFKA_BULK_BATCH_BYTES', 1048576))  # Maximum batch size of a bulk publish
+KAFKA_BULK_COMPRESSION = os.getenv('KAFKA_BULK_COMPRESSION', 'lz4')  # none, gzip, snappy, lz4 or zstd
+KAFKA_BULK_DELIVERY_TIMEOUT = float(os.getenv('KAFKA_BULK_DELIVERY_TIMEOUT', 60))  # Seconds a bulk publish waits for delivery reports
+AVRO_SCHEMA_DIR = os.getenv('AVRO_SCHEMA_DIR', str(BASE_DIR / 'schemas'))  # <subject>.avsc files used for Avro when no schema registry URL is given
+
+# Pooled connections to the custom cleanup databases of mock configurations
+CUSTOM_DB_POOL_SIZE = int(os.getenv('CUSTOM_DB_POOL_SIZE', 5))  # Connections kept per database and worker process
+CUSTOM_DB_POOL_IDLE_SECONDS = float(os.getenv('CUSTOM_DB_POOL_IDLE_SECONDS', 300))  # Idle connections older than this are closed
+CUSTOM_DB_POOL_CHECK_SECONDS = float(os.getenv('CUSTOM_DB_POOL_CHECK_SECONDS', 30))  # Ping connections idle longer than this before reuse
+CUSTOM_DB_POOL_TIMEOUT = float(os.getenv('CUSTOM_DB_POOL_TIMEOUT', 10))  # Seconds to wait for a free connection
+CUSTOM_DB_CONNECT_TIMEOUT = int(os.getenv('CUSTOM_DB_CONNECT_TIMEOUT', 5))  # Seconds to open a new connection
+
+# Snapshot reset strategy: the baseline of each configuration is kept in schema <prefix>_<configuration id>
+SNAPSHOT_SCHEMA_PREFIX = os.getenv('SNAPSHOT_SCHEMA_PREFIX', 'flight_mock_snapshot')